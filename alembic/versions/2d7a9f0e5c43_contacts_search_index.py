@@ -0,0 +1,35 @@
+"""contacts search index
+
+Revision ID: 2d7a9f0e5c43
+Revises: 8e4f2b6c1a90
+Create Date: 2026-10-17 12:20:31.004716
+
+"""
+from alembic import op
+
+from src.database.models import CONTACTS_SEARCH_DDL
+
+
+# revision identifiers, used by Alembic.
+revision = '2d7a9f0e5c43'
+down_revision = '8e4f2b6c1a90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for statement in CONTACTS_SEARCH_DDL.get(dialect, []):
+        op.execute(statement)
+    if dialect == 'sqlite':
+        op.execute("INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_contacts_search_trgm")
+    elif dialect == 'sqlite':
+        for trigger in ('contacts_fts_ai', 'contacts_fts_ad', 'contacts_fts_au'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS contacts_fts")
@@ -0,0 +1,33 @@
+"""birthday digests
+
+Revision ID: 4f8a2c6e9d13
+Revises: 9c4d2e7a1f36
+Create Date: 2026-10-18 16:24:09.380517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f8a2c6e9d13'
+down_revision = '9c4d2e7a1f36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('birthday_digests',
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('digest_date', sa.Date(), nullable=False),
+                    sa.Column('status', sa.String(length=10), nullable=False),
+                    sa.Column('updated_at', sa.DateTime(), nullable=True),
+                    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('user_id', 'digest_date')
+                    )
+    op.create_index(op.f('ix_birthday_digests_digest_date'), 'birthday_digests', ['digest_date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_birthday_digests_digest_date'), table_name='birthday_digests')
+    op.drop_table('birthday_digests')
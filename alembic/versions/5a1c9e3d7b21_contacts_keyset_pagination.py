@@ -0,0 +1,28 @@
+"""contacts keyset pagination
+
+Revision ID: 5a1c9e3d7b21
+Revises: 173b3bbda2cf
+Create Date: 2026-10-17 10:12:05.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a1c9e3d7b21'
+down_revision = '173b3bbda2cf'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('description', sa.String(), nullable=True))
+    op.create_index('ix_contacts_first_name_id', 'contacts', ['first_name', 'id'], unique=False)
+    op.create_index('ix_contacts_last_name_id', 'contacts', ['last_name', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_last_name_id', table_name='contacts')
+    op.drop_index('ix_contacts_first_name_id', table_name='contacts')
+    op.drop_column('contacts', 'description')
@@ -0,0 +1,24 @@
+"""users token version
+
+Revision ID: 6b3e1d8f2a57
+Revises: 2d7a9f0e5c43
+Create Date: 2026-10-18 09:41:12.318220
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6b3e1d8f2a57'
+down_revision = '2d7a9f0e5c43'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('token_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'token_version')
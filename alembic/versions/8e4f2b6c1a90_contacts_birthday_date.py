@@ -0,0 +1,77 @@
+"""contacts birthday date
+
+Revision ID: 8e4f2b6c1a90
+Revises: 5a1c9e3d7b21
+Create Date: 2026-10-17 11:02:47.530912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from src.database.models import month_day
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4f2b6c1a90'
+down_revision = '5a1c9e3d7b21'
+branch_labels = None
+depends_on = None
+
+
+# birthday was free text: only ISO dates survive the conversion, anything else becomes NULL
+POSTGRES_TO_DATE = r"""
+CREATE FUNCTION pg_temp.iso_date_or_null(value varchar) RETURNS date AS $$
+BEGIN
+    IF value !~ '^\d{4}-\d{2}-\d{2}$' THEN
+        RETURN NULL;
+    END IF;
+    RETURN value::date;
+EXCEPTION WHEN others THEN
+    -- well-formed but impossible, e.g. 2001-02-30
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+# with a modifier SQLite normalises impossible dates, so a valid ISO date is one that comes back unchanged
+SQLITE_CLEAR_INVALID = "UPDATE contacts SET birthday = NULL WHERE birthday IS NOT NULL " \
+                       "AND date(birthday, '+0 days') IS NOT birthday"
+
+
+def birthday_md_column() -> sa.Column:
+    return sa.Column('birthday_md', sa.Integer(), sa.Computed(month_day(sa.column('birthday')), persisted=True),
+                     nullable=True)
+
+
+def contacts_table(column: str, type_) -> sa.Table:
+    # the batch copy CASTs a column whose type changes, and CAST(... AS DATE) turns '1990-05-17' into 1990 in
+    # SQLite; declared with the new type up front, the ISO text is copied as it is
+    contacts = sa.Table('contacts', sa.MetaData(), autoload_with=op.get_bind())
+    contacts.c[column].type = type_
+    return contacts
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        # SQLite cannot alter a column type nor add a stored generated column: the table is rebuilt
+        op.execute(SQLITE_CLEAR_INVALID)
+        with op.batch_alter_table('contacts', copy_from=contacts_table('birthday', sa.Date()),
+                                  recreate='always') as batch_op:
+            batch_op.add_column(birthday_md_column())
+    else:
+        op.execute(POSTGRES_TO_DATE)
+        op.alter_column('contacts', 'birthday', existing_type=sa.String(), type_=sa.Date(),
+                        postgresql_using='pg_temp.iso_date_or_null(birthday)')
+        op.add_column('contacts', birthday_md_column())
+    op.create_index(op.f('ix_contacts_birthday_md'), 'contacts', ['birthday_md'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_contacts_birthday_md'), table_name='contacts')
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table('contacts', copy_from=contacts_table('birthday', sa.String()),
+                                  recreate='always') as batch_op:
+            batch_op.drop_column('birthday_md')
+    else:
+        op.drop_column('contacts', 'birthday_md')
+        op.alter_column('contacts', 'birthday', existing_type=sa.Date(), type_=sa.String(),
+                        postgresql_using='birthday::varchar')
@@ -0,0 +1,80 @@
+"""
+Event-loop concurrency of a blocking Session versus an AsyncSession.
+
+Each simulated request runs one query that takes ``--query-ms`` on the database side (a SQLite
+user function that sleeps), the way the repositories do inside ``async def`` handlers. A heartbeat
+task measures how long the event loop is stalled meanwhile.
+
+    python -m benchmarks.db_concurrency --requests 50 --query-ms 20
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+
+def _register_sleep(dbapi_connection, _):
+    dbapi_connection.create_function('sleep_ms', 1, lambda ms: time.sleep(ms / 1000) or 1)
+
+
+async def _heartbeat(stop: asyncio.Event, interval: float = 0.001) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def _run(handler, requests: int) -> tuple[float, float]:
+    stop = asyncio.Event()
+    heartbeat = asyncio.create_task(_heartbeat(stop))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(*(handler() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return elapsed, await heartbeat
+
+
+async def main(requests: int, query_ms: int, pool_size: int):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    query = text("SELECT sleep_ms(:ms)").bindparams(ms=query_ms)
+
+    sync_engine = create_engine(f"sqlite:///{path}", pool_size=pool_size, connect_args={"check_same_thread": False})
+    event.listen(sync_engine, 'connect', _register_sleep)
+    SyncSession = sessionmaker(bind=sync_engine)
+
+    async def blocking_request():
+        with SyncSession() as db:
+            db.execute(query).scalar()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", pool_size=pool_size)
+    event.listen(async_engine.sync_engine, 'connect', _register_sleep)
+    AsyncSessionLocal = async_sessionmaker(async_engine)
+
+    async def async_request():
+        async with AsyncSessionLocal() as db:
+            (await db.execute(query)).scalar()
+
+    print(f"{requests} concurrent requests, {query_ms} ms per query, pool_size={pool_size}")
+    for name, handler in (("Session (before)", blocking_request), ("AsyncSession (after)", async_request)):
+        elapsed, stall = await _run(handler, requests)
+        print(f"{name:22} total {elapsed * 1000:8.1f} ms   "
+              f"throughput {requests / elapsed:7.1f} req/s   worst loop stall {stall * 1000:7.1f} ms")
+    await async_engine.dispose()
+    sync_engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--query-ms', type=int, default=20)
+    parser.add_argument('--pool-size', type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.query_ms, args.pool_size))
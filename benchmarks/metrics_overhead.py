@@ -0,0 +1,51 @@
+"""
+Per-request cost of MetricsMiddleware: a bare ASGI app called directly, with and without the middleware.
+
+    python -m benchmarks.metrics_overhead --requests 100000
+"""
+import argparse
+import asyncio
+import time
+
+from src.services.metrics import MetricsMiddleware
+
+
+async def _endpoint(scope, receive, send):
+    scope['endpoint'] = _endpoint
+    await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+class _Route:
+    endpoint = _endpoint
+    path = '/'
+
+
+class _App:
+    routes = [_Route()]
+
+
+async def _send(message):
+    pass
+
+
+async def _time(app, requests: int) -> float:
+    scope = {'type': 'http', 'method': 'GET', 'path': '/', 'app': _App()}
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), None, _send)
+    return (time.perf_counter() - start) / requests
+
+
+async def main(requests: int):
+    bare = await _time(_endpoint, requests)
+    measured = await _time(MetricsMiddleware(_endpoint), requests)
+    print(f"bare app:         {bare * 1e6:8.2f} us/request")
+    print(f"with metrics:     {measured * 1e6:8.2f} us/request")
+    print(f"overhead:         {(measured - bare) * 1e6:8.2f} us/request")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=100000)
+    asyncio.run(main(parser.parse_args().requests))
@@ -1,12 +1,23 @@
-import time
+import asyncio
+import datetime
+import functools
 
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
-from src.routes import contacts, auth, avatar
+from src.conf.config import settings
+from src.database.db import get_db, SessionLocal
+from src.database.instrumentation import QueryStatsMiddleware
+from src.routes import contacts, auth, avatar, admin, media, metrics
+from src.services.admission import AdmissionMiddleware, admission_options
+from src.services.birthdays import run_daily, send_birthday_digests
+from src.services.body_limit import BodyLimitMiddleware, MULTIPART_OVERHEAD
+from src.services.email import mail_dispatcher
+from src.services.gravatar import gravatar_resolver
+from src.services.metrics import MetricsMiddleware, mark_process_dead, publish_periodically
+from src.services.sessions import purge_sessions_periodically
 
 app = FastAPI()
 
@@ -14,6 +25,12 @@ origins = [
     "http://localhost:8500", "http://localhost:8500"
     ]
 
+# innermost: an oversized avatar is refused before the form parser spools it to disk
+app.add_middleware(BodyLimitMiddleware, limits={'/api/users/avatar': settings.avatar_max_bytes + MULTIPART_OVERHEAD})
+
+# refuses requests before any other work; CORS wraps it, so refusals are readable by browsers
+app.add_middleware(AdmissionMiddleware, **admission_options())
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -22,13 +39,68 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["Process-Time"] = str(process_time)
-    return response
+app.add_middleware(QueryStatsMiddleware)
+
+# outermost: times every request, refused ones included, and sets Process-Time
+app.add_middleware(MetricsMiddleware)
+
+
+@app.on_event("startup")
+async def start_session_purge():
+    if settings.session_purge_interval > 0:
+        app.state.session_purge = asyncio.create_task(
+            purge_sessions_periodically(SessionLocal, settings.session_purge_interval))
+
+
+@app.on_event("shutdown")
+async def stop_session_purge():
+    task = getattr(app.state, 'session_purge', None)
+    if task is not None:
+        task.cancel()
+
+
+@app.on_event("startup")
+async def start_birthday_digest():
+    if settings.birthday_digest_enabled:
+        app.state.birthday_digest = asyncio.create_task(
+            run_daily(datetime.time.fromisoformat(settings.birthday_digest_at),
+                      functools.partial(send_birthday_digests, SessionLocal)))
+
+
+@app.on_event("shutdown")
+async def stop_birthday_digest():
+    task = getattr(app.state, 'birthday_digest', None)
+    if task is not None:
+        task.cancel()
+
+
+@app.on_event("startup")
+async def start_mail_dispatcher():
+    await mail_dispatcher.start()
+
+
+@app.on_event("shutdown")
+async def stop_mail_dispatcher():
+    await mail_dispatcher.stop()
+
+
+@app.on_event("shutdown")
+async def close_gravatar_resolver():
+    await gravatar_resolver.close()
+
+
+@app.on_event("startup")
+async def start_metrics_publisher():
+    if settings.metrics_enabled and settings.metrics_publish_interval > 0:
+        app.state.metrics_publisher = asyncio.create_task(publish_periodically(settings.metrics_publish_interval))
+
+
+@app.on_event("shutdown")
+async def stop_metrics_publisher():
+    task = getattr(app.state, 'metrics_publisher', None)
+    if task is not None:
+        task.cancel()
+    mark_process_dead()
 
 
 @app.get("/", name='Core project')
@@ -37,10 +109,10 @@ def read_root():
 
 
 @app.get("/api/healthchecker")
-def healthchecker(db: Session = Depends(get_db)):
+async def healthchecker(db: AsyncSession = Depends(get_db)):
     try:
         # Make request
-        result = db.execute(text("SELECT 1")).fetchone()
+        result = (await db.execute(text("SELECT 1"))).fetchone()
         print(result)
         if result is None:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -55,3 +127,6 @@ def healthchecker(db: Session = Depends(get_db)):
 app.include_router(contacts.router, prefix='/api')
 app.include_router(auth.router, prefix='/api')
 app.include_router(avatar.router, prefix='/api')
+app.include_router(admin.router, prefix='/api')
+app.include_router(media.router)
+app.include_router(metrics.router)
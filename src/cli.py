@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+import json
+import sys
+from datetime import date
+
+from src.database.db import SessionLocal
+from src.services.birthdays import send_birthday_digests
+from src.services.contacts_import import import_contacts, IMPORT_FORMATS
+from src.services.sessions import session_store
+
+
+async def run_import_contacts(args: argparse.Namespace) -> int:
+    fmt = args.format or args.path.rsplit('.', 1)[-1].lower()
+    if fmt not in IMPORT_FORMATS:
+        print(f"Unknown import format: {fmt}", file=sys.stderr)
+        return 2
+    async with SessionLocal() as db:
+        with open(args.path, encoding='utf-8-sig', errors='replace', newline='') as lines:
+            report = await import_contacts(lines, fmt, db, args.batch_size, args.max_errors)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+async def run_purge_sessions(args: argparse.Namespace) -> int:
+    async with SessionLocal() as db:
+        purged = await session_store.purge(db)
+    print(f"Purged {purged} expired sessions")
+    return 0
+
+
+async def run_birthday_digest(args: argparse.Namespace) -> int:
+    report = await send_birthday_digests(SessionLocal, args.date, args.days, args.batch_size)
+    print(json.dumps(report, indent=2))
+    return 0 if not report["failed"] else 1
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.cli')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parser_import = commands.add_parser('import-contacts', help='Bulk import contacts from a CSV or NDJSON file')
+    parser_import.add_argument('path')
+    parser_import.add_argument('--format', choices=IMPORT_FORMATS)
+    parser_import.add_argument('--batch-size', type=int, default=1000)
+    parser_import.add_argument('--max-errors', type=int, default=100)
+    parser_import.set_defaults(handler=run_import_contacts)
+
+    parser_purge = commands.add_parser('purge-sessions', help='Delete expired refresh-token sessions')
+    parser_purge.set_defaults(handler=run_purge_sessions)
+
+    parser_digest = commands.add_parser('birthday-digest', help="Send the day's upcoming-birthday digests")
+    parser_digest.add_argument('--date', type=date.fromisoformat, help='Day of the digest, YYYY-MM-DD')
+    parser_digest.add_argument('--days', type=int)
+    parser_digest.add_argument('--batch-size', type=int)
+    parser_digest.set_defaults(handler=run_birthday_digest)
+
+    args = parser.parse_args(argv)
+    return asyncio.run(args.handler(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
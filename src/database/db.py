@@ -29,21 +29,180 @@ def get_db():
     finally:
         db.close()'''
 
+import itertools
+import logging
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
+
 from src.conf.config import settings
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from src.database.instrumentation import instrument_engine
+from src.database.pool import InstrumentedPool, PoolStats
+
+try:
+    from redis import asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # pragma: no cover - redis is optional while pins are kept in process
+    aioredis = None
+    RedisError = OSError
+
+logger = logging.getLogger(__name__)
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def create_engine_with_pool(url: str) -> AsyncEngine:
+    """
+    Create an engine whose pool is sized from the settings and reports PoolStats, and whose statements
+    are counted per request.
 
+    :param url: Database URL.
+    :type url: str
+    :return: The engine; ``engine.pool.stats`` holds its statistics.
+    :rtype: AsyncEngine
+    """
+    new_engine = create_async_engine(
+        url,
+        poolclass=InstrumentedPool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+    )
+    new_engine.pool.stats = PoolStats().attach(new_engine)
+    return instrument_engine(new_engine)
 
-# Dependency
-def get_db():
-    db = SessionLocal()
+
+class ReplicaRouter:
+    """
+    Picks the engine for read-only sessions: one of the replicas, or the primary for clients that wrote
+    within the read-your-writes window, so they never read a replica that has not caught up yet.
+
+    With ``redis`` the pins are shared by every worker, so a read served by another process than the
+    write still sees it; without it they are kept in a bounded in-process LRU. While Redis fails, reads
+    go to the primary.
+    """
+
+    def __init__(self, primary: AsyncEngine, replicas: list[AsyncEngine], selection: str = 'round_robin',
+                 pin_seconds: float = 5, max_pinned: int = 100_000, redis=None, prefix: str = 'pin'):
+        if selection not in ('round_robin', 'least_connections'):
+            raise ValueError(f"Unknown replica selection: {selection}")
+        self.primary = primary
+        self.replicas = replicas
+        self.selection = selection
+        self.pin_seconds = pin_seconds
+        self.max_pinned = max_pinned
+        self.redis = redis
+        self.prefix = prefix
+        self._next = itertools.cycle(replicas)
+        self._pinned: OrderedDict[str, float] = OrderedDict()
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    async def mark_write(self, keys: list[str]):
+        if not keys or not self.replicas:
+            return
+        if self.redis is not None:
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for key in keys:
+                        pipe.set(self._redis_key(key), 1, px=max(int(self.pin_seconds * 1000), 1))
+                    await pipe.execute()
+            except RedisError as e:
+                logger.warning("Read-your-writes pin was not stored: %s", e)
+            return
+        until = time.monotonic() + self.pin_seconds
+        for key in keys:
+            self._pinned[key] = until
+            self._pinned.move_to_end(key)
+        while len(self._pinned) > self.max_pinned:
+            self._pinned.popitem(last=False)
+
+    async def is_pinned(self, keys: list[str]) -> bool:
+        if not keys:
+            return False
+        if self.redis is not None:
+            try:
+                return await self.redis.exists(*(self._redis_key(key) for key in keys)) > 0
+            except RedisError as e:
+                logger.warning("Read-your-writes pins are unavailable, reading the primary: %s", e)
+                return True
+        now = time.monotonic()
+        for key in keys:
+            until = self._pinned.get(key)
+            if until is None:
+                continue
+            if until > now:
+                return True
+            del self._pinned[key]
+        return False
+
+    async def engine_for_read(self, keys: list[str]) -> AsyncEngine:
+        if not self.replicas or await self.is_pinned(keys):
+            return self.primary
+        if self.selection == 'least_connections':
+            return min(self.replicas, key=lambda replica: replica.pool.checkedout())
+        return next(self._next)
+
+
+def client_keys(request: Request) -> list[str]:
+    """
+    Identify the client for read-your-writes by its verified user. Requests without a valid bearer
+    token are not pinned: a forged token, or a shared address, cannot pin anybody else to the primary.
+
+    :param request: Current request.
+    :type request: Request
+    :return: Routing keys of the client.
+    :rtype: list[str]
+    """
+    # imported here: the auth service depends on this module
+    from src.services.auth import auth_service
+
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return []
     try:
+        return [f"user:{auth_service.decode_access_token(token)['sub']}"]
+    except HTTPException:
+        return []
+
+
+def replica_pins_redis():
+    if settings.read_your_writes_redis and settings.sqlalchemy_replica_urls and aioredis is not None:
+        return aioredis.Redis(host=settings.redis_host, port=settings.redis)
+    return None
+
+
+engine = create_engine_with_pool(SQLALCHEMY_DATABASE_URL)
+replica_engines = [create_engine_with_pool(url) for url in settings.sqlalchemy_replica_urls]
+replica_router = ReplicaRouter(engine, replica_engines, settings.replica_selection, settings.read_your_writes_seconds,
+                               redis=replica_pins_redis())
+
+# expire_on_commit=False: after a commit, attributes stay loaded instead of being lazily
+# re-fetched, which an AsyncSession cannot do implicitly
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+# Dependency
+async def get_db(request: Request):
+    writes = request.method not in SAFE_METHODS
+    keys = client_keys(request) if writes else []
+    await replica_router.mark_write(keys)
+    async with SessionLocal() as db:
+        yield db
+    # the window starts over once the write has finished
+    await replica_router.mark_write(keys)
+
+
+# Dependency for read-only routes
+async def get_read_db(request: Request):
+    read_engine = await replica_router.engine_for_read(client_keys(request))
+    # marked so that the read cache is not filled with rows a lagging replica returned
+    async with SessionLocal(bind=read_engine, info={'replica': read_engine is not replica_router.primary}) as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -0,0 +1,153 @@
+import contextvars
+import logging
+import re
+import time
+from collections import Counter
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+EXPLAIN_PREFIX = {'postgresql': 'EXPLAIN ', 'sqlite': 'EXPLAIN QUERY PLAN '}
+# EXPLAIN without ANALYZE does not run the statement, but only reads are worth the extra round trip
+EXPLAINABLE = ('SELECT', 'WITH')
+# password hashes, refresh tokens and session ids: statements on these tables are logged without their
+# parameters, and without a plan, since Postgres prints the bound values in it
+SECRET_TABLES = re.compile(r'\b(users|user_sessions)\b', re.IGNORECASE)
+EXPLAIN_SAVEPOINT = 'slow_query_explain'
+
+
+class QueryStats:
+    """
+    Statements issued while serving one request.
+    """
+    __slots__ = ('count', 'seconds', 'statements')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: Counter[str] = Counter()
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """
+        Statements issued at least ``threshold`` times: the same SQL with other parameters, one row at a
+        time, is the mark of an N+1 query.
+
+        :param threshold: Least number of repeats reported.
+        :type threshold: int
+        :return: Statements with their counts, the most repeated first.
+        :rtype: list[tuple[str, int]]
+        """
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.seconds * 1000:.2f};desc="{self.count} queries"'
+
+
+current_query_stats: contextvars.ContextVar[QueryStats | None] = contextvars.ContextVar('current_query_stats',
+                                                                                          default=None)
+
+
+def _explain(conn, statement: str, parameters) -> str:
+    prefix = EXPLAIN_PREFIX.get(conn.dialect.name)
+    if prefix is None or not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return ''
+    # a raw DBAPI cursor on the request's own connection: EXPLAIN must not trigger these listeners again.
+    # On Postgres a failed statement aborts the whole transaction, so the EXPLAIN gets a savepoint of its own.
+    savepoint = conn.dialect.name == 'postgresql' and conn.in_transaction()
+    cursor = conn.connection.cursor()
+    try:
+        if savepoint:
+            cursor.execute(f'SAVEPOINT {EXPLAIN_SAVEPOINT}')
+        try:
+            cursor.execute(prefix + statement, parameters)
+            plan = '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+        except Exception as e:  # noqa - a failed EXPLAIN must not fail the request
+            if savepoint:
+                cursor.execute(f'ROLLBACK TO SAVEPOINT {EXPLAIN_SAVEPOINT}')
+            plan = f"EXPLAIN failed: {e}"
+        if savepoint:
+            cursor.execute(f'RELEASE SAVEPOINT {EXPLAIN_SAVEPOINT}')
+        return plan
+    except Exception as e:  # noqa - nor may a failed savepoint
+        return f"EXPLAIN failed: {e}"
+    finally:
+        cursor.close()
+
+
+def _log_slow_query(conn, statement: str, parameters, seconds: float, executemany: bool):
+    if SECRET_TABLES.search(statement):
+        parameters, plan = '<redacted>', ''
+    else:
+        plan = _explain(conn, statement, parameters) if settings.slow_query_explain and not executemany else ''
+        parameters = f'{parameters!r:.500}'
+    logger.warning("Slow query (%.1f ms): %s\nParameters: %s%s", seconds * 1000, statement, parameters,
+                   f"\nPlan:\n{plan}" if plan else '')
+
+
+def instrument_engine(engine: AsyncEngine) -> AsyncEngine:
+    """
+    Count statements and their time into the request's :class:`QueryStats`, and log statements slower
+    than ``slow_query_seconds`` with their parameters and plan.
+
+    :param engine: Engine to observe.
+    :type engine: AsyncEngine
+    :return: The same engine, for chaining.
+    :rtype: AsyncEngine
+    """
+    target = engine.sync_engine
+
+    @event.listens_for(target, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(target, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - context._query_start
+        stats = current_query_stats.get()
+        if stats is not None:
+            stats.record(statement, seconds)
+        if settings.slow_query_seconds and seconds >= settings.slow_query_seconds:
+            _log_slow_query(conn, statement, parameters, seconds, executemany)
+
+    return engine
+
+
+class QueryStatsMiddleware:
+    """
+    ASGI middleware that collects the :class:`QueryStats` of every request. Statements repeated
+    ``n_plus_one_threshold`` times or more are logged as a likely N+1; with ``debug`` on, the totals
+    are sent in a ``Server-Timing`` header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start' and settings.debug:
+                message['headers'] = [*message.get('headers', ()),
+                                      (b'server-timing', stats.server_timing().encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing if settings.debug else send)
+        finally:
+            current_query_stats.reset(token)
+            if settings.n_plus_one_threshold:
+                for statement, count in stats.repeated(settings.n_plus_one_threshold):
+                    logger.warning("Likely N+1: %s %s ran %s times: %s", scope['method'], scope['path'], count,
+                                   statement)
@@ -1,11 +1,34 @@
 import enum
 
-from sqlalchemy import Column, Integer, String, DateTime, func, Enum, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, func, Enum, Boolean, Index, Date, Computed, DDL, event, \
+    ForeignKey
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.sql.expression import FunctionElement
 
 Base = declarative_base()
 
 
+class month_day(FunctionElement):
+    """
+    ``month * 100 + day`` of a date, e.g. 1231 for December 31st. Orders birthdays within a year.
+    """
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(month_day)
+def _compile_month_day(element, compiler, **kw):
+    arg = compiler.process(element.clauses, **kw)
+    return f"CAST(EXTRACT(MONTH FROM {arg}) * 100 + EXTRACT(DAY FROM {arg}) AS INTEGER)"
+
+
+@compiles(month_day, 'sqlite')
+def _compile_month_day_sqlite(element, compiler, **kw):
+    arg = compiler.process(element.clauses, **kw)
+    return f"CAST(strftime('%m%d', {arg}) AS INTEGER)"
+
+
 class Role(enum.Enum):
     admin: str = 'admin'
     moderator: str = 'moderator'
@@ -15,14 +38,58 @@ class Role(enum.Enum):
 class Contact(Base):
     __tablename__ = "contacts"
     id = Column(Integer, primary_key=True, index=True)
-    first_name = Column(String, index=True)
-    last_name = Column(String, index=True)
+    name = Column('first_name', String, index=True)
+    surname = Column('last_name', String, index=True)
     email = Column(String, unique=True, index=True)
     phone = Column(String, unique=True, index=True)
-    birthday = Column(String)
+    birthday = Column(Date)
+    birthday_md = Column(Integer, Computed(month_day(birthday), persisted=True), index=True)
+    description = Column(String, nullable=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
+    # read server-generated values (id, timestamps, birthday_md) back with RETURNING instead of a lazy load
+    __mapper_args__ = {"eager_defaults": True}
+
+    __table_args__ = (
+        # keyset pagination of the search_by_* lists: WHERE first_name = ? AND id > ? ORDER BY id
+        Index('ix_contacts_first_name_id', 'first_name', 'id'),
+        Index('ix_contacts_last_name_id', 'last_name', 'id'),
+    )
+
+
+# Text matched by GET /api/contacts/search on Postgres. Queries must use this exact expression to hit the index.
+CONTACTS_SEARCH_DOCUMENT = ("coalesce(contacts.first_name, '') || ' ' || coalesce(contacts.last_name, '') || ' ' || "
+                            "coalesce(contacts.email, '') || ' ' || coalesce(contacts.phone, '')")
+
+CONTACTS_SEARCH_DDL = {
+    'postgresql': [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        f"CREATE INDEX IF NOT EXISTS ix_contacts_search_trgm ON contacts USING gin (({CONTACTS_SEARCH_DOCUMENT}) "
+        f"gin_trgm_ops)",
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5(first_name, last_name, email, phone, "
+        "content='contacts', content_rowid='id')",
+        "CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+        "INSERT INTO contacts_fts(rowid, first_name, last_name, email, phone) "
+        "VALUES (new.id, new.first_name, new.last_name, new.email, new.phone); END",
+        "CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+        "INSERT INTO contacts_fts(contacts_fts, rowid, first_name, last_name, email, phone) "
+        "VALUES ('delete', old.id, old.first_name, old.last_name, old.email, old.phone); END",
+        "CREATE TRIGGER IF NOT EXISTS contacts_fts_au AFTER UPDATE ON contacts BEGIN "
+        "INSERT INTO contacts_fts(contacts_fts, rowid, first_name, last_name, email, phone) "
+        "VALUES ('delete', old.id, old.first_name, old.last_name, old.email, old.phone); "
+        "INSERT INTO contacts_fts(rowid, first_name, last_name, email, phone) "
+        "VALUES (new.id, new.first_name, new.last_name, new.email, new.phone); END",
+    ],
+}
+
+for _dialect, _statements in CONTACTS_SEARCH_DDL.items():
+    for _statement in _statements:
+        event.listen(Contact.__table__, 'after_create', DDL(_statement).execute_if(dialect=_dialect))
+event.listen(Contact.__table__, 'before_drop', DDL("DROP TABLE IF EXISTS contacts_fts").execute_if(dialect='sqlite'))
+
 
 class User(Base):
     __tablename__ = "users"
@@ -34,5 +101,35 @@ class User(Base):
     refresh_token = Column(String(255), nullable=True)
     role = Column('role', Enum(Role), default=Role.user)
     confirmed = Column(Boolean, default=False)
+    # bumped when claims signed into access tokens (role) stop being true
+    token_version = Column(Integer, nullable=False, default=0, server_default='0')
+
+
+class UserSession(Base):
+    """
+    One signed-in device. Its refresh token is valid while ``jti`` matches; every refresh replaces ``jti``.
+    """
+    __tablename__ = "user_sessions"
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    jti = Column(String(32), nullable=False)
+    device = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    last_used_at = Column(DateTime, default=func.now())
+    # the purge walks this index
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class BirthdayDigest(Base):
+    """
+    Birthday digest of one user for one day. The row is claimed before the mail goes out and is never
+    claimed twice, so a rerun of the job skips everyone it has already handled.
+    """
+    __tablename__ = "birthday_digests"
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    digest_date = Column(Date, primary_key=True, index=True)
+    # claimed, sent or failed
+    status = Column(String(10), nullable=False, default='claimed')
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
 
@@ -0,0 +1,115 @@
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class PoolStats:
+    """
+    Counters of one engine's connection pool. Live gauges are read from the pool itself on snapshot.
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.closes = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_counts = [0] * (len(WAIT_BUCKETS) + 1)
+        self.wait_sum = 0.0
+
+    def observe_wait(self, seconds: float):
+        self.wait_counts[bisect_left(WAIT_BUCKETS, seconds)] += 1
+        self.wait_sum += seconds
+
+    def attach(self, engine: AsyncEngine) -> 'PoolStats':
+        """
+        Count connection churn of the engine. Listeners registered on the engine survive pool re-creation.
+
+        :param engine: Engine to observe.
+        :type engine: AsyncEngine
+        :return: The same stats, for chaining.
+        :rtype: PoolStats
+        """
+        target = engine.sync_engine
+
+        @event.listens_for(target, 'connect')
+        def on_connect(*_):
+            self.connects += 1
+
+        @event.listens_for(target, 'close')
+        def on_close(*_):
+            self.closes += 1
+
+        @event.listens_for(target, 'close_detached')
+        def on_close_detached(*_):
+            self.closes += 1
+
+        @event.listens_for(target, 'invalidate')
+        def on_invalidate(*_):
+            self.invalidations += 1
+
+        @event.listens_for(target, 'checkout')
+        def on_checkout(*_):
+            self.checkouts += 1
+
+        @event.listens_for(target, 'checkin')
+        def on_checkin(*_):
+            self.checkins += 1
+
+        return self
+
+    def snapshot(self, pool) -> dict:
+        """
+        Current state of the pool together with the accumulated counters.
+
+        :param pool: The engine's current pool.
+        :return: Pool gauges, churn counters and the cumulative checkout wait histogram in seconds.
+        :rtype: dict
+        """
+        buckets, total = {}, 0
+        for bound, count in zip(WAIT_BUCKETS + (float('inf'),), self.wait_counts):
+            total += count
+            buckets['+Inf' if bound == float('inf') else str(bound)] = total
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "connects": self.connects,
+            "closes": self.closes,
+            "invalidations": self.invalidations,
+            "timeouts": self.timeouts,
+            "wait_seconds": {"buckets": buckets, "count": total, "sum": self.wait_sum},
+        }
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    AsyncAdaptedQueuePool that records how long each checkout waited for a connection.
+    """
+    stats: PoolStats | None = None
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            if self.stats is not None:
+                self.stats.timeouts += 1
+            raise
+        finally:
+            if self.stats is not None:
+                self.stats.observe_wait(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
@@ -1,160 +1,505 @@
-from datetime import date, datetime
-from sqlalchemy.orm import Session
+from calendar import isleap
+from datetime import date, datetime, timedelta
 
-from src.database.models import Contact
-from src.schemas import ContactModel
+from sqlalchemy import case, or_, and_, select, insert, update, delete, func, literal, literal_column, table, column
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
+from src.database.models import Contact, CONTACTS_SEARCH_DOCUMENT
+from src.schemas import ContactModel, ContactSelection, ContactUpdate
+from src.services.cache import contact_cache
 
-async def validate_birthday(brth: date):
+CACHED_COLUMNS = [(attr.key, attr.columns[0].type.python_type) for attr in Contact.__mapper__.column_attrs]
+
+
+def dump_contacts(value: Contact | list[Contact] | None):
     """
-    The validate_birthday function takes a date object as an argument and returns the number of days until that birthday.
-        If the birthday has already passed this year, it will return the number of days until next year's birthday.
+    The dump_contacts function turns a contact, a list of contacts or None into JSON-compatible data for the cache.
 
-    :param brth: date: Pass the user's birthday into the function
-    :return: The number of days until the user's birthday
+    :param value: Contact | list[Contact] | None: Result of a read function
+    :return: A dict, a list of dicts or None
     :doc-author: Poznanskyi
     """
-    bth_now = date(datetime.now().year, datetime.now().month, datetime.now().day)
-    brth = date(
-        bth_now.year if bth_now.month < brth.month else bth_now.year + 1 if bth_now.day < brth.day else bth_now.year,
-        brth.month, brth.day)
-    delta = bth_now - brth
-    return delta.days
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return [dump_contacts(contact) for contact in value]
+    data = {}
+    for key, _ in CACHED_COLUMNS:
+        item = getattr(value, key)
+        data[key] = item.isoformat() if isinstance(item, date) else item
+    return data
+
+
+def load_contacts(value: dict | list[dict] | None):
+    """
+    The load_contacts function builds detached contacts back from the data produced by dump_contacts.
 
+    :param value: dict | list[dict] | None: Cached data
+    :return: A contact, a list of contacts or None
+    :doc-author: Poznanskyi
+    """
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return [load_contacts(data) for data in value]
+    data = dict(value)
+    for key, python_type in CACHED_COLUMNS:
+        if data.get(key) is not None and python_type in (date, datetime):
+            data[key] = python_type.fromisoformat(data[key])
+    return Contact(**data)
+
+
+def birthday_key_ranges(today: date, days: int) -> list[tuple[int, int]]:
+    """
+    The birthday_key_ranges function turns the window [today, today + days] into inclusive ranges of
+        Contact.birthday_md keys (month * 100 + day). A window that crosses New Year is split in two,
+        and in a year without February 29th the contacts born on it are congratulated on March 1st.
 
-async def get_contacts(db: Session):
+    :param today: date: First day of the window
+    :param days: int: Length of the window in days
+    :return: Ranges of birthday keys, or an empty list when the window covers the whole year
+    :doc-author: Poznanskyi
+    """
+    end = today + timedelta(days=days)
+    start_key, end_key = today.month * 100 + today.day, end.month * 100 + end.day
+    if end.year == today.year:
+        ranges = [(start_key, end_key)]
+    elif end_key < start_key:
+        ranges = [(start_key, 1231), (101, end_key)]
+    else:
+        return []
+    for year in {today.year, end.year}:
+        if not isleap(year) and today <= date(year, 3, 1) <= end:
+            ranges.append((229, 229))
+    return ranges
+
+
+@contact_cache.cached('get_contacts', dump_contacts, load_contacts)
+async def get_contacts(db: AsyncSession, limit: int = 20, after_id: int | None = None):
     """
-    The get_contacts function returns a list of all contacts in the database.
+    The get_contacts function returns one page of contacts ordered by id.
+        The page starts right after after_id, so the cost does not depend on how deep the client has scrolled.
 
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
+    :param limit: int: Maximum number of contacts to return
+    :param after_id: int | None: Id of the last contact of the previous page
     :return: A list of contact objects
     :doc-author: Poznanskyi
     """
-    return db.query(Contact).all()
+    stmt = select(Contact)
+    if after_id is not None:
+        stmt = stmt.where(Contact.id > after_id)
+    return (await db.execute(stmt.order_by(Contact.id).limit(limit))).scalars().all()
+
+
+async def get_contacts_version(db: AsyncSession, limit: int | None = 20, after_id: int | None = None,
+                               where: tuple = ()):
+    """
+    The get_contacts_version function summarises the page get_contacts would return with the same arguments:
+        its size, its last id and its latest updated_at. Only the id index and two columns are read,
+        no contact objects are built, so the result can validate a cached page cheaply.
+        With where, the page is one of a filtered list; with limit None, the whole list is summarised.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :param limit: int | None: Maximum number of contacts in the page, None for no limit
+    :param after_id: int | None: Id of the last contact of the previous page
+    :param where: tuple: Criteria of the list, e.g. Contact.name == name
+    :return: A row of count, max_id and last_modified
+    :doc-author: Poznanskyi
+    """
+    page = select(Contact.id, Contact.updated_at).where(*where)
+    if after_id is not None:
+        page = page.where(Contact.id > after_id)
+    page = page.order_by(Contact.id).limit(limit).subquery()
+    stmt = select(func.count().label('count'), func.max(page.c.id).label('max_id'),
+                  func.max(page.c.updated_at).label('last_modified'))
+    return (await db.execute(stmt)).one()
+
 
+EXPORT_COLUMNS = (Contact.id, Contact.name, Contact.surname, Contact.email, Contact.phone, Contact.birthday,
+                  Contact.description)
 
-async def get_contacts_by_birthdays(db: Session):
+
+async def stream_contacts(db: AsyncSession, after_id: int | None = None, batch_size: int = 1000):
+    """
+    The stream_contacts function yields contacts ordered by id as plain rows, batch_size rows at a time.
+        yield_per makes the driver use a server-side cursor where it supports one, so neither the driver
+        nor the session ever holds more than one batch, whatever the size of the table.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :param after_id: int | None: Resume after the contact with this id
+    :param batch_size: int: Number of rows fetched per round trip
+    :return: An async iterator of rows with the EXPORT_COLUMNS
+    :doc-author: Poznanskyi
     """
-        The get_contacts_by_birthdays function returns a list of contacts whose birthdays are within the next 7 days.
+    stmt = select(*EXPORT_COLUMNS)
+    if after_id is not None:
+        stmt = stmt.where(Contact.id > after_id)
+    stmt = stmt.order_by(Contact.id).execution_options(yield_per=batch_size)
+    async for row in await db.stream(stmt):
+        yield row
 
-        :param db: Session: Pass the database session to the function
-        :return: A list of contacts whose birthday is within the next 7 days
+
+def birthday_criteria(today: date, days: int) -> tuple:
+    """
+    The birthday_criteria function returns the WHERE criteria of contacts whose birthdays fall in the window.
+
+    :param today: date: First day of the window
+    :param days: int: Length of the window in days
+    :return: Criteria on the indexed birthday_md column
+    :doc-author: Poznanskyi
+    """
+    ranges = birthday_key_ranges(today, days)
+    if not ranges:
+        return (Contact.birthday_md.is_not(None),)
+    return Contact.birthday_md.is_not(None), or_(*(Contact.birthday_md.between(low, high) for low, high in ranges))
+
+
+@contact_cache.cached('get_contacts_by_birthdays', dump_contacts, load_contacts,
+                      key=lambda days, today: (days, (today or date.today()).isoformat()))
+async def get_contacts_by_birthdays(db: AsyncSession, days: int = 7, today: date | None = None):
+    """
+        The get_contacts_by_birthdays function returns a list of contacts whose birthdays are within the next days days.
+            The window is matched against the indexed birthday_md column, so only matching rows leave the database.
+
+        :param db: AsyncSession: Pass the database session to the function
+        :param days: int: Length of the window in days
+        :param today: date | None: First day of the window, defaults to the current date
+        :return: A list of contacts ordered by the upcoming birthday
         :doc-author: Poznanskyi
         """
-    contacts = db.query(Contact).all()
-    contacts_list = []
-    for contact in contacts:
-        if 0 <= await validate_birthday(contact.birthday) <= 7:
-            contacts_list.append(contact)
-    return contacts_list
+    today = today or date.today()
+    stmt = select(Contact).where(*birthday_criteria(today, days))
+    start_key = today.month * 100 + today.day
+    stmt = stmt.order_by(case((Contact.birthday_md >= start_key, 0), else_=1), Contact.birthday_md)
+    return (await db.execute(stmt)).scalars().all()
 
 
-async def get_contact_by_id(contact_id: int, db: Session):
+@contact_cache.cached('get_contact_by_id', dump_contacts, load_contacts)
+async def get_contact_by_id(contact_id: int, db: AsyncSession):
     """
     The get_contact_by_id function returns a contact from the database by its id.
 
     :param contact_id: int: Specify the id of the contact to be returned
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A contact object
     :doc-author: Poznanskyi
     """
-    return db.query(Contact).filter_by(id = contact_id).first()
+    return (await db.execute(select(Contact).filter_by(id=contact_id))).scalars().first()
 
 
-async def get_contact_by_email(email, db: Session):
+async def get_contact_version(contact_id: int, db: AsyncSession):
+    """
+    The get_contact_version function returns the id and updated_at of a contact without loading the contact itself.
+
+    :param contact_id: int: Specify the id of the contact
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A row of id and updated_at, or None if there is no such contact
+    :doc-author: Poznanskyi
+    """
+    return (await db.execute(select(Contact.id, Contact.updated_at).filter_by(id=contact_id))).first()
+
+
+@contact_cache.cached('get_contact_by_email', dump_contacts, load_contacts)
+async def get_contact_by_email(email, db: AsyncSession):
     """
     The get_contact_by_email function returns a contact object from the database based on the email address provided.
         Args:
             email (str): The email address of the contact to be retrieved.
-            db (Session, optional): SQLAlchemy Session instance. Defaults to None.
+            db (AsyncSession, optional): SQLAlchemy AsyncSession instance. Defaults to None.
 
     :param email: Filter the query
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: The first contact found by the email address
     :doc-author: Poznanskyi
     """
-    return db.query(Contact).filter_by(email=email).first()
+    return (await db.execute(select(Contact).filter_by(email=email))).scalars().first()
 
 
-async def get_contact_by_name(contact_name, db: Session):
+async def get_contact_by_name(contact_name, db: AsyncSession, limit: int = 20, after_id: int | None = None):
     """
-    The get_contact_by_name function returns a list of contacts that match the contact_name parameter.
+    The get_contact_by_name function returns one page of contacts that match the contact_name parameter.
 
 
     :param contact_name: Filter the database query
-    :param db: Session: Pass the database session to the function
-    :return: All contacts with the name specified in the contact_name parameter
+    :param db: AsyncSession: Pass the database session to the function
+    :param limit: int: Maximum number of contacts to return
+    :param after_id: int | None: Id of the last contact of the previous page
+    :return: Contacts with the name specified in the contact_name parameter
     :doc-author: Poznanskyi
     """
-    return db.query(Contact).filter_by(name=contact_name).all()
+    stmt = select(Contact).where(Contact.name == contact_name)
+    if after_id is not None:
+        stmt = stmt.where(Contact.id > after_id)
+    return (await db.execute(stmt.order_by(Contact.id).limit(limit))).scalars().all()
 
 
-async def get_contact_by_surname(contact_surname, db: Session):
+async def get_contact_by_surname(contact_surname, db: AsyncSession, limit: int = 20, after_id: int | None = None):
     """
-    The get_contact_by_surname function returns a list of contacts with the given surname.
+    The get_contact_by_surname function returns one page of contacts with the given surname.
 
     :param contact_surname: Filter the query
-    :param db: Session: Pass in the database session to the function
+    :param db: AsyncSession: Pass in the database session to the function
+    :param limit: int: Maximum number of contacts to return
+    :param after_id: int | None: Id of the last contact of the previous page
     :return: A list of contacts with the given surname
     :doc-author: Poznanskyi
     """
-    return db.query(Contact).filter_by(surname=contact_surname).all()
+    stmt = select(Contact).where(Contact.surname == contact_surname)
+    if after_id is not None:
+        stmt = stmt.where(Contact.id > after_id)
+    return (await db.execute(stmt.order_by(Contact.id).limit(limit))).scalars().all()
 
 
-async def create_contact(body: ContactModel, db: Session):
+def _fts_query(query: str) -> str:
+    """
+    The _fts_query function turns free text into an FTS5 query where every word is matched as a prefix.
+
+    :param query: str: Text typed by the user
+    :return: FTS5 MATCH expression
+    :doc-author: Poznanskyi
+    """
+    terms = [word.replace('"', '""') for word in query.split()]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+async def search_contacts(query: str, db: AsyncSession, limit: int = 20, after: tuple[float, int] | None = None):
+    """
+    The search_contacts function finds contacts whose first name, last name, email or phone match the query.
+        On Postgres it uses the pg_trgm GIN index, so a match may be a substring or a word with a typo.
+        On SQLite it uses the contacts_fts FTS5 table and matches word prefixes.
+        Results are ordered by relevance and paginated by the (score, id) of the last row of the previous page.
+
+    :param query: str: Text to look for
+    :param db: AsyncSession: Pass the database session to the function
+    :param limit: int: Maximum number of contacts to return
+    :param after: tuple[float, int] | None: Score and id of the last contact of the previous page
+    :return: A list of rows with the Contact and its score, best matches first
+    :doc-author: Poznanskyi
+    """
+    if not query.split():
+        return []
+    if db.bind.dialect.name == 'postgresql':
+        document = literal_column(f'({CONTACTS_SEARCH_DOCUMENT})')
+        pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        score = func.word_similarity(query, document)
+        matched = select(Contact, score.label('score')) \
+            .where(or_(literal(query).op('<%')(document), document.ilike(pattern, escape='\\')))
+    else:
+        fts = table('contacts_fts', column('rowid'))
+        score = -func.bm25(literal_column(fts.name))
+        matched = select(Contact, score.label('score')) \
+            .join(fts, fts.c.rowid == Contact.id) \
+            .where(literal_column(fts.name).match(_fts_query(query)))
+    matched = matched.subquery()
+    contact = aliased(Contact, matched)
+    stmt = select(contact, matched.c.score)
+    if after is not None:
+        stmt = stmt.where(or_(matched.c.score < after[0], and_(matched.c.score == after[0], matched.c.id > after[1])))
+    stmt = stmt.order_by(matched.c.score.desc(), matched.c.id).limit(limit)
+    return (await db.execute(stmt)).all()
+
+
+async def create_contact(body: ContactModel, db: AsyncSession):
     """
     The create_contact function creates a new contact in the database.
 
     :param body: ContactModel: Pass the data from the request body to the function
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A contact object
     :doc-author: Poznanskyi
     """
     contact = Contact(**body.dict())
     db.add(contact)
-    db.commit()
+    await db.commit()
+    await contact_cache.invalidate()
     return contact
 
 
-async def update_contact(body: ContactModel, contact_id, db: Session):
+def _dialect_insert(db: AsyncSession):
     """
-    The update_contact function updates a contact in the database.
+    The _dialect_insert function returns the INSERT construct of the session's dialect, which has ON CONFLICT support.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The insert function of the postgresql or sqlite dialect
+    :doc-author: Poznanskyi
+    """
+    if db.bind.dialect.name == 'postgresql':
+        return postgresql.insert
+    return sqlite.insert
+
+
+async def upsert_contact(body: ContactModel, db: AsyncSession, update_existing: bool = False):
+    """
+    The upsert_contact function inserts a contact and lets the email unique index decide what happens
+        when a contact with the same email exists: it is updated with the body, or left untouched.
+        There is no SELECT before the INSERT, so the outcome is decided by the database in one statement.
+
+    :param body: ContactModel: Pass the data from the request body to the function
+    :param db: AsyncSession: Pass the database session to the function
+    :param update_existing: bool: Overwrite the existing contact instead of leaving it as it is
+    :return: The contact and whether it was created; the contact is None when it existed and was left untouched
+    :doc-author: Poznanskyi
+    """
+    values = body.dict()
+    stmt = _dialect_insert(db)(Contact).values(**values)
+    if not update_existing:
+        contact = (await db.execute(stmt.on_conflict_do_nothing(index_elements=[Contact.email])
+                                    .returning(Contact))).scalars().first()
+        await db.commit()
+        await contact_cache.invalidate()
+        return contact, contact is not None
+    changes = {Contact.__mapper__.attrs[key].columns[0]: value for key, value in values.items()}
+    changes[Contact.updated_at] = func.now()
+    stmt = stmt.on_conflict_do_update(index_elements=[Contact.email], set_=changes)
+    if db.bind.dialect.name == 'postgresql':
+        # xmax is 0 only for a row version created by this INSERT, so it tells insert from update in the same trip
+        contact, inserted = (await db.execute(stmt.returning(Contact, literal_column('xmax = 0')))).first()
+        await db.commit()
+        await contact_cache.invalidate()
+        return contact, inserted
+    # SQLite cannot tell the two apart: insert-only first, and update only when that did nothing
+    contact = (await db.execute(_dialect_insert(db)(Contact).values(**values)
+                                .on_conflict_do_nothing(index_elements=[Contact.email])
+                                .returning(Contact))).scalars().first()
+    if contact is not None:
+        await db.commit()
+        await contact_cache.invalidate()
+        return contact, True
+    contact = (await db.execute(update(Contact).where(Contact.email == body.email).values(**values)
+                                .returning(Contact))).scalars().first()
+    await db.commit()
+    await contact_cache.invalidate()
+    return contact, False
+
+
+async def get_taken_emails_and_phones(emails: list[str], phones: list[str], db: AsyncSession):
+    """
+    The get_taken_emails_and_phones function checks a whole batch of emails and phones against the database at once.
+
+    :param emails: list[str]: Emails to check
+    :param phones: list[str]: Phones to check
+    :param db: AsyncSession: Pass the database session to the function
+    :return: Sets of the emails and phones that already belong to a contact
+    :doc-author: Poznanskyi
+    """
+    rows = (await db.execute(select(Contact.email, Contact.phone)
+                             .where(or_(Contact.email.in_(emails), Contact.phone.in_(phones))))).all()
+    return {row.email for row in rows}, {row.phone for row in rows}
+
+
+async def create_contacts(bodies: list[ContactModel], db: AsyncSession):
+    """
+    The create_contacts function inserts a batch of contacts with a single executemany INSERT and one commit.
+
+    :param bodies: list[ContactModel]: Validated contacts to insert
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The number of inserted contacts
+    :doc-author: Poznanskyi
+    """
+    if not bodies:
+        return 0
+    await db.execute(insert(Contact), [body.dict() for body in bodies])
+    await db.commit()
+    await contact_cache.invalidate()
+    return len(bodies)
+
+
+def _selection_criteria(selection: ContactSelection) -> list:
+    """
+    The _selection_criteria function translates the ids and filters of a bulk request into WHERE criteria.
+
+    :param selection: ContactSelection: Ids and/or exact name and surname
+    :return: A list of SQL criteria, all of which must hold
+    :doc-author: Poznanskyi
+    """
+    criteria = []
+    if selection.ids is not None:
+        criteria.append(Contact.id.in_(selection.ids))
+    if selection.name is not None:
+        criteria.append(Contact.name == selection.name)
+    if selection.surname is not None:
+        criteria.append(Contact.surname == selection.surname)
+    return criteria
+
+
+async def update_contacts(selection: ContactSelection, changes: dict, db: AsyncSession):
+    """
+    The update_contacts function applies the same changes to every selected contact
+        with one UPDATE ... RETURNING statement in one transaction.
+
+    :param selection: ContactSelection: Contacts to update
+    :param changes: dict: Values of the columns to change
+    :param db: AsyncSession: Pass the database session to the function
+    :return: Ids of the updated contacts
+    :doc-author: Poznanskyi
+    """
+    stmt = update(Contact).where(*_selection_criteria(selection)).values(**changes).returning(Contact.id) \
+        .execution_options(synchronize_session=False)
+    ids = (await db.execute(stmt)).scalars().all()
+    await db.commit()
+    await contact_cache.invalidate()
+    return ids
+
+
+async def remove_contacts(selection: ContactSelection, db: AsyncSession):
+    """
+    The remove_contacts function deletes every selected contact with one DELETE ... RETURNING statement
+        in one transaction.
+
+    :param selection: ContactSelection: Contacts to delete
+    :param db: AsyncSession: Pass the database session to the function
+    :return: Ids of the deleted contacts
+    :doc-author: Poznanskyi
+    """
+    stmt = delete(Contact).where(*_selection_criteria(selection)).returning(Contact.id) \
+        .execution_options(synchronize_session=False)
+    ids = (await db.execute(stmt)).scalars().all()
+    await db.commit()
+    await contact_cache.invalidate()
+    return ids
+
+
+async def update_contact(body: ContactModel | ContactUpdate, contact_id, db: AsyncSession):
+    """
+    The update_contact function updates a contact in the database with a single UPDATE ... RETURNING statement.
+        Only the fields that were set in the body are written, so a ContactUpdate makes a partial update.
         Args:
-            body (ContactModel): The updated contact information.
-            db (Session): A connection to the database.
+            body (ContactModel | ContactUpdate): The updated contact information.
+            db (AsyncSession): A connection to the database.
 
-    :param body: ContactModel: Get the data from the request body
+    :param body: ContactModel | ContactUpdate: Get the data from the request body
     :param contact_id: Get the contact from the database
-    :param db: Session: Pass the database session to the function
-    :return: A contact
-    :doc-author: Poznanskyi
-    """
-    contact = await get_contact_by_id(contact_id, db)
-    if contact:
-        contact.name = body.name
-        contact.surname = body.surname
-        contact.email = body.email
-        contact.birthday = body.birthday
-        contact.phone = body.phone
-        contact.description = body.description
-        db.commit()
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The updated contact, or None if there is no such contact
+    :doc-author: Poznanskyi
+    """
+    changes = body.dict(exclude_unset=True)
+    if not changes:
+        return await get_contact_by_id(contact_id, db)
+    stmt = update(Contact).where(Contact.id == contact_id).values(**changes).returning(Contact)
+    contact = (await db.execute(stmt)).scalars().first()
+    await db.commit()
+    await contact_cache.invalidate()
     return contact
 
 
-async def remove_contact(contact_id: int, db: Session):
+async def remove_contact(contact_id: int, db: AsyncSession):
     """
-    The remove_contact function removes a contact from the database.
+    The remove_contact function removes a contact from the database with a single DELETE ... RETURNING statement.
         Args:
             contact_id (int): The id of the contact to be removed.
-            db (Session): A connection to the database.
+            db (AsyncSession): A connection to the database.
 
     :param contact_id: Find the contact in the database
-    :param db: Session: Pass in the database session to the function
-    :return: The contact that was deleted
+    :param db: AsyncSession: Pass in the database session to the function
+    :return: The contact that was deleted, or None if there is no such contact
     :doc-author: Poznanskyi
     """
-    contact = await get_contact_by_id(contact_id, db)
-    if contact:
-        db.delete(contact)
-        db.commit()
-    return contact
\ No newline at end of file
+    stmt = delete(Contact).where(Contact.id == contact_id).returning(Contact)
+    contact = (await db.execute(stmt)).scalars().first()
+    await db.commit()
+    await contact_cache.invalidate()
+    return contact
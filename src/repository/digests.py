@@ -0,0 +1,93 @@
+from datetime import date
+
+from sqlalchemy import select, update, delete, exists, Row
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import BirthdayDigest, User
+
+
+async def get_digest_recipients(digest_date: date, after_id: int, limit: int, db: AsyncSession) -> list[Row]:
+    """
+    Next confirmed users, by id, that have no digest of the day yet. One indexed anti-join per batch.
+
+    :param digest_date: Day of the digest.
+    :type digest_date: date
+    :param after_id: Id of the last user of the previous batch, 0 for the first batch.
+    :type after_id: int
+    :param limit: Batch size.
+    :type limit: int
+    :param db: Database session.
+    :type db: AsyncSession
+    :return: Rows of id, email and username.
+    :rtype: list[Row]
+    """
+    handled = exists().where(BirthdayDigest.user_id == User.id, BirthdayDigest.digest_date == digest_date)
+    stmt = (select(User.id, User.email, User.username)
+            .where(User.confirmed.is_(True), User.id > after_id, ~handled)
+            .order_by(User.id).limit(limit))
+    return (await db.execute(stmt)).all()
+
+
+async def claim_digests(user_ids: list[int], digest_date: date, db: AsyncSession) -> set[int]:
+    """
+    Claim the day's digests of users. A digest claimed before, by this or a concurrent run, is not claimed again.
+
+    :param user_ids: Users to claim.
+    :type user_ids: list[int]
+    :param digest_date: Day of the digest.
+    :type digest_date: date
+    :param db: Database session.
+    :type db: AsyncSession
+    :return: Ids of the users whose digests this call claimed.
+    :rtype: set[int]
+    """
+    if not user_ids:
+        return set()
+    insert = postgresql.insert if db.bind.dialect.name == 'postgresql' else sqlite.insert
+    stmt = (insert(BirthdayDigest)
+            .values([{"user_id": user_id, "digest_date": digest_date, "status": "claimed"} for user_id in user_ids])
+            .on_conflict_do_nothing()
+            .returning(BirthdayDigest.user_id))
+    claimed = set((await db.execute(stmt)).scalars().all())
+    await db.commit()
+    return claimed
+
+
+async def mark_digests(user_ids: list[int], digest_date: date, status: str, db: AsyncSession) -> None:
+    """
+    Record the outcome of claimed digests.
+
+    :param user_ids: Users whose digests are marked.
+    :type user_ids: list[int]
+    :param digest_date: Day of the digest.
+    :type digest_date: date
+    :param status: ``sent`` or ``failed``.
+    :type status: str
+    :param db: Database session.
+    :type db: AsyncSession
+    """
+    if not user_ids:
+        return
+    await db.execute(update(BirthdayDigest)
+                     .where(BirthdayDigest.user_id.in_(user_ids), BirthdayDigest.digest_date == digest_date)
+                     .values(status=status)
+                     .execution_options(synchronize_session=False))
+    await db.commit()
+
+
+async def purge_digests(before: date, db: AsyncSession) -> int:
+    """
+    Delete digest records of days before ``before``; they no longer guard against anything.
+
+    :param before: First day to keep.
+    :type before: date
+    :param db: Database session.
+    :type db: AsyncSession
+    :return: Number of deleted records.
+    :rtype: int
+    """
+    result = await db.execute(delete(BirthdayDigest).where(BirthdayDigest.digest_date < before)
+                              .execution_options(synchronize_session=False))
+    await db.commit()
+    return result.rowcount
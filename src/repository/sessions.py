@@ -0,0 +1,128 @@
+from datetime import datetime
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import UserSession
+
+
+async def create_session(session_id: str, user_id: int, jti: str, device: str | None, expires_at: datetime,
+                         db: AsyncSession) -> UserSession:
+    """
+    Create a session of one device.
+
+    :param session_id: Session id.
+    :type session_id: str
+    :param user_id: Owner of the session.
+    :type user_id: int
+    :param jti: Id of the refresh token currently valid for the session.
+    :type jti: str
+    :param device: Device description, e.g. the User-Agent.
+    :type device: str | None
+    :param expires_at: UTC time after which the session is void.
+    :type expires_at: datetime
+    :param db: Database session.
+    :type db: AsyncSession
+    :return: Created session.
+    :rtype: UserSession
+    """
+    user_session = UserSession(id=session_id, user_id=user_id, jti=jti, device=device and device[:255],
+                               expires_at=expires_at, last_used_at=datetime.utcnow())
+    db.add(user_session)
+    await db.commit()
+    return user_session
+
+
+async def rotate_session(session_id: str, user_id: int, jti: str, new_jti: str, expires_at: datetime,
+                         db: AsyncSession) -> bool:
+    """
+    Replace the refresh token of a session, if ``jti`` is still the current one.
+
+    The check and the replacement are one UPDATE on the primary key, so of two concurrent refreshes
+    with the same token only one succeeds. When nothing matches, the token was already used, or the
+    session expired or was revoked: the session is deleted, which signs the device out.
+
+    :param session_id: Session id.
+    :type session_id: str
+    :param user_id: Owner of the session.
+    :type user_id: int
+    :param jti: Id of the presented refresh token.
+    :type jti: str
+    :param new_jti: Id of the refresh token that replaces it.
+    :type new_jti: str
+    :param expires_at: New expiry time, UTC.
+    :type expires_at: datetime
+    :param db: Database session.
+    :type db: AsyncSession
+    :return: Whether the token was current and has been replaced.
+    :rtype: bool
+    """
+    now = datetime.utcnow()
+    rotated = (await db.execute(
+        update(UserSession)
+        .where(UserSession.id == session_id, UserSession.user_id == user_id, UserSession.jti == jti,
+               UserSession.expires_at > now)
+        .values(jti=new_jti, last_used_at=now, expires_at=expires_at)
+        .returning(UserSession.id)
+        .execution_options(synchronize_session=False))).scalar_one_or_none() is not None
+    if not rotated:
+        await db.execute(delete(UserSession).where(UserSession.id == session_id, UserSession.user_id == user_id)
+                         .execution_options(synchronize_session=False))
+    await db.commit()
+    return rotated
+
+
+async def get_sessions(user_id: int, db: AsyncSession) -> list[UserSession]:
+    """
+    Live sessions of a user.
+
+    :param user_id: User id.
+    :type user_id: int
+    :param db: Database session.
+    :type db: AsyncSession
+    :return: Sessions, the most recently used first.
+    :rtype: list[UserSession]
+    """
+    stmt = select(UserSession).where(UserSession.user_id == user_id, UserSession.expires_at > datetime.utcnow())
+    return (await db.execute(stmt.order_by(UserSession.last_used_at.desc()))).scalars().all()
+
+
+async def remove_session(session_id: str, user_id: int, db: AsyncSession) -> bool:
+    """
+    Revoke a session of a user.
+
+    :param session_id: Session id.
+    :type session_id: str
+    :param user_id: Owner of the session.
+    :type user_id: int
+    :param db: Database session.
+    :type db: AsyncSession
+    :return: Whether the session existed.
+    :rtype: bool
+    """
+    result = await db.execute(delete(UserSession).where(UserSession.id == session_id, UserSession.user_id == user_id)
+                              .execution_options(synchronize_session=False))
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def purge_expired_sessions(db: AsyncSession, batch_size: int = 1000) -> int:
+    """
+    Delete expired sessions in batches, one short transaction per batch.
+
+    :param db: Database session.
+    :type db: AsyncSession
+    :param batch_size: Sessions deleted per statement.
+    :type batch_size: int
+    :return: Number of deleted sessions.
+    :rtype: int
+    """
+    total = 0
+    while True:
+        expired = select(UserSession.id).where(UserSession.expires_at <= datetime.utcnow()).limit(batch_size)
+        result = await db.execute(delete(UserSession).where(UserSession.id.in_(expired.scalar_subquery()))
+                                  .execution_options(synchronize_session=False))
+        await db.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
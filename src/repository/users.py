@@ -1,49 +1,76 @@
-from libgravatar import Gravatar
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.models import User
+from src.database.models import Role, User
 from src.schemas import UserModel
+from src.services.cache import principal_cache
+from src.services.gravatar import gravatar_url
 
+PRINCIPAL_FIELDS = ('id', 'username', 'email', 'avatar', 'confirmed', 'token_version')
 
-async def get_user_by_email(email: str, db: Session) -> User | None:
+
+def dump_principal(user: User) -> dict:
+    """
+    Public fields of a user for the principal cache. Password and refresh token are never cached.
+
+    :param user: Authenticated user.
+    :type user: User
+    :return: JSON-compatible principal.
+    :rtype: dict
+    """
+    data = {field: getattr(user, field) for field in PRINCIPAL_FIELDS}
+    data['role'] = user.role.value if user.role else None
+    return data
+
+
+def load_principal(data: dict) -> User:
+    """
+    Detached user built from :func:`dump_principal` data.
+
+    :param data: Cached principal.
+    :type data: dict
+    :return: User that is not attached to any session.
+    :rtype: User
+    """
+    data = dict(data)
+    data['role'] = Role(data['role']) if data['role'] else None
+    return User(**data)
+
+
+async def get_user_by_email(email: str, db: AsyncSession) -> User | None:
     """
     Get user by e-mail.
 
     :param email: User's e-mail.
     :type email: str
     :param db: Database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: Return the found user, or None if it does not exist
     :rtype: User | None
     """
-    return db.query(User).filter(User.email == email).first()
+    return (await db.execute(select(User).filter(User.email == email))).scalars().first()
 
 
-async def create_user(body: UserModel, db: Session) -> User:
+async def create_user(body: UserModel, db: AsyncSession) -> User:
     """
     Create user.
 
     :param body: User body.
     :type body: UserModel
     :param db: Database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: Created user.
     :rtype: User
     """
-    avatar = None
-    try:
-        g = Gravatar(body.email)
-        avatar = g.get_image()
-    except Exception as e:
-        print(e)
-    new_user = User(**body.dict(), avatar=avatar)
+    # the URL follows from the e-mail alone; whether the image exists is checked later, off the request
+    new_user = User(**body.dict(), avatar=gravatar_url(body.email))
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 
-async def update_token(user: User, token: str | None, db: Session) -> None:
+async def update_token(user: User, token: str | None, db: AsyncSession) -> None:
     """
     Update user token
 
@@ -52,29 +79,70 @@ async def update_token(user: User, token: str | None, db: Session) -> None:
     :param token: User's token.
     :type token: str
     :param db: Database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: Not return result.
     """
     user.refresh_token = token
-    db.commit()
+    await db.commit()
+    await principal_cache.invalidate(user.email)
 
 
-async def confirmed_email(email: str, db: Session) -> None:
+async def claim_refresh_token(email: str, token: str, db: AsyncSession) -> bool:
+    """
+    Consume a refresh token issued before sessions existed. The check and the removal are one
+    UPDATE ... RETURNING, so of two concurrent refreshes with the same token only one succeeds.
+
+    :param email: User's e-mail.
+    :type email: str
+    :param token: Presented refresh token.
+    :type token: str
+    :param db: Database session.
+    :type db: AsyncSession
+    :return: Whether the token was the user's current one; False means it was used before.
+    :rtype: bool
+    """
+    stmt = update(User).where(User.email == email, User.refresh_token == token).values(refresh_token=None) \
+        .returning(User.id).execution_options(synchronize_session=False)
+    claimed = (await db.execute(stmt)).scalar_one_or_none() is not None
+    await db.commit()
+    if claimed:
+        await principal_cache.invalidate(email)
+    return claimed
+
+
+async def update_password(user: User, password: str, db: AsyncSession) -> None:
+    """
+    Replace user's password hash.
+
+    :param user: Current user.
+    :type user: User
+    :param password: New password hash.
+    :type password: str
+    :param db: Database session.
+    :type db: AsyncSession
+    :return: Not return result.
+    """
+    user.password = password
+    await db.commit()
+
+
+async def confirmed_email(email: str, db: AsyncSession) -> None:
     """
     Set user's e-mail confirmed.
 
     :param email: User's e-mail
     :type email: str
     :param db: Database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: Not return result.
     """
     user = await get_user_by_email(email, db)
     user.confirmed = True
-    db.commit()
+    await db.commit()
+    await principal_cache.invalidate(email)
 
 
-async def update_avatar(email, url: str, db: Session) -> None:
+async def update_avatar(email, url: str, db: AsyncSession) -> None:
     """
     Update user's avatar
 
@@ -83,12 +151,62 @@ async def update_avatar(email, url: str, db: Session) -> None:
     :param url: User avatar link.
     :type url: str
     :param db: Database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: Updated user.
     :rtype: User
 
     """
     user = await get_user_by_email(email, db)
     user.avatar = url
-    db.commit()
+    await db.commit()
+    await principal_cache.invalidate(email)
+    return user
+
+
+async def replace_avatar(email: str, expected: str | None, url: str | None, db: AsyncSession) -> bool:
+    """
+    Set user's avatar only while it is still ``expected``, so a late background check never
+    overwrites an avatar the user has uploaded meanwhile.
+
+    :param email: User's e-mail.
+    :type email: str
+    :param expected: Avatar the user must still have.
+    :type expected: str | None
+    :param url: New avatar link.
+    :type url: str | None
+    :param db: Database session.
+    :type db: AsyncSession
+    :return: Whether the avatar was changed.
+    :rtype: bool
+    """
+    current = User.avatar.is_(None) if expected is None else User.avatar == expected
+    result = await db.execute(update(User).where(User.email == email, current).values(avatar=url))
+    await db.commit()
+    if not result.rowcount:
+        return False
+    await principal_cache.invalidate(email)
+    return True
+
+
+async def update_role(email: str, role: Role, db: AsyncSession) -> User | None:
+    """
+    Change user's role.
+
+    :param email: User's e-mail.
+    :type email: str
+    :param role: New role.
+    :type role: Role
+    :param db: Database session.
+    :type db: AsyncSession
+    :return: Updated user, or None if it does not exist.
+    :rtype: User | None
+    """
+    user = await get_user_by_email(email, db)
+    if user is None:
+        return None
+    user.role = role
+    # access tokens that carry the old role must not be accepted any more
+    user.token_version = (user.token_version or 0) + 1
+    await db.commit()
+    await principal_cache.invalidate(email)
     return user
\ No newline at end of file
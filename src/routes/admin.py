@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import EmailStr
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.db import engine, get_db
+from src.database.models import Role
+from src.repository import users as repository_users
+from src.schemas import AdmissionStatus, CacheStatus, MailStatus, PoolStatus, PrincipalCacheStatus, UserRoleResponse, \
+    UserRoleUpdate
+from src.services.admission import admission_stats
+from src.services.cache import contact_cache, principal_cache
+from src.services.email import mail_dispatcher
+from src.services.roles import RolesAccess
+
+router = APIRouter(prefix='/admin', tags=['admin'])
+
+access_admin = RolesAccess([Role.admin])
+
+
+@router.get('/pool', response_model=PoolStatus, dependencies=[Depends(access_admin)])
+async def pool_status():
+    return engine.pool.stats.snapshot(engine.pool)
+
+
+@router.get('/cache', response_model=CacheStatus, dependencies=[Depends(access_admin)])
+async def cache_status():
+    return contact_cache.stats()
+
+
+@router.get('/principal-cache', response_model=PrincipalCacheStatus, dependencies=[Depends(access_admin)])
+async def principal_cache_status():
+    return principal_cache.stats()
+
+
+@router.get('/admission', response_model=AdmissionStatus, dependencies=[Depends(access_admin)])
+async def admission_status():
+    return admission_stats.dict()
+
+
+@router.get('/mail', response_model=MailStatus, dependencies=[Depends(access_admin)])
+async def mail_status():
+    return mail_dispatcher.stats()
+
+
+@router.patch('/users/{email}/role', response_model=UserRoleResponse, dependencies=[Depends(access_admin)])
+async def update_user_role(email: EmailStr, body: UserRoleUpdate, db: AsyncSession = Depends(get_db)):
+    user = await repository_users.update_role(email, body.role, db)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No such user")
+    return user
@@ -1,58 +1,111 @@
 from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
+from typing import List
 
-from src.database.db import get_db
-from src.schemas import UserModel, UserResponse, TokenModel, RequestEmail
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.db import get_db, SessionLocal
+from src.database.models import User
+from src.schemas import UserModel, UserResponse, TokenModel, RequestEmail, SessionResponse
 from src.repository import users as repository_users
 from src.services.auth import auth_service
 from src.services.email import send_email
+from src.services.gravatar import gravatar_hash, gravatar_resolver, gravatar_url
+from src.services.sessions import session_store
 
 router = APIRouter(prefix='/auth', tags=["auth"])
 security = HTTPBearer()
 
 
+async def verify_gravatar(email: str):
+    """
+    Replace the Gravatar URL given at signup with a generated identicon when Gravatar has no image
+    for the address; the avatar is never left empty.
+
+    :param email: E-mail of the new user.
+    :type email: str
+    """
+    if await gravatar_resolver.exists(gravatar_hash(email)) is False:
+        async with SessionLocal() as db:
+            await repository_users.replace_avatar(email, gravatar_url(email), gravatar_url(email, 'identicon'), db)
+
+
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, db: Session = Depends(get_db)):
+async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request,
+                 db: AsyncSession = Depends(get_db)):
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.hash_password(body.password)
     new_user = await repository_users.create_user(body, db)
+    background_tasks.add_task(send_email, new_user.email, new_user.username, request.base_url)
+    if settings.gravatar_verify:
+        background_tasks.add_task(verify_gravatar, new_user.email)
     return new_user
 
 
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(request: Request, body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     user = await repository_users.get_user_by_email(body.username, db)
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
-    if not auth_service.verify_password(body.password, user.password):
+    # checked before bcrypt: an unconfirmed account costs no hashing
+    if not user.confirmed:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
+    verified, new_hash = await auth_service.verify_and_update(body.password, user.password)
+    if not verified:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
+    if new_hash:
+        await repository_users.update_password(user, new_hash, db)
+    # every login opens a session of its own, other devices stay signed in
+    session_id, jti = await session_store.create(user.id, request.headers.get('user-agent'), db)
     # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-    await repository_users.update_token(user, refresh_token, db)
+    access_token = await auth_service.create_access_token(data={"sub": user.email}, user=user)
+    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email, "sid": session_id, "jti": jti})
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def refresh_token(request: Request, credentials: HTTPAuthorizationCredentials = Security(security),
+                        db: AsyncSession = Depends(get_db)):
     token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
+    claims = await auth_service.decode_refresh_claims(token)
+    email = claims['sub']
     user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await repository_users.update_token(user, None, db)
+    if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    if 'sid' in claims:
+        session_id = claims['sid']
+        jti = await session_store.rotate(session_id, user.id, claims.get('jti'), db)
+        if jti is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    else:
+        # a token issued before sessions existed: accepted once, then moved to a session
+        if not await repository_users.claim_refresh_token(email, token, db):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+        session_id, jti = await session_store.create(user.id, request.headers.get('user-agent'), db)
 
-    access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    await repository_users.update_token(user, refresh_token, db)
+    access_token = await auth_service.create_access_token(data={"sub": email}, user=user)
+    refresh_token = await auth_service.create_refresh_token(data={"sub": email, "sid": session_id, "jti": jti})
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
+@router.get('/sessions', response_model=List[SessionResponse])
+async def get_sessions(current_user: User = Depends(auth_service.get_current_user),
+                       db: AsyncSession = Depends(get_db)):
+    return await session_store.list(current_user.id, db)
+
+
+@router.delete('/sessions/{session_id}', status_code=status.HTTP_204_NO_CONTENT)
+async def remove_session(session_id: str, current_user: User = Depends(auth_service.get_current_user),
+                         db: AsyncSession = Depends(get_db)):
+    if not await session_store.revoke(session_id, current_user.id, db):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No such session")
+
+
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     email = await auth_service.get_email_from_token(token)
     user = await repository_users.get_user_by_email(email, db)
     if user is None:
@@ -65,10 +118,10 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
 
 @router.post('/request_email')
 async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+                        db: AsyncSession = Depends(get_db)):
     user = await repository_users.get_user_by_email(body.email, db)
 
-    if user.confirmed:
+    if user and user.confirmed:
         return {"message": "Your email is already confirmed"}
     if user:
         background_tasks.add_task(send_email, user.email, user.username, request.base_url)
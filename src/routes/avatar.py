@@ -1,12 +1,13 @@
-from fastapi import APIRouter, Depends, UploadFile, File
-from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.database.models import User
 from src.repository import users as repository_users
 from src.services.auth import auth_service
+from src.services.storage import Storage, get_storage
+from src.services.upload_avatar import read_upload, make_thumbnails, avatar_digest, avatar_key, upload_thumbnails
+from src.services.workers import image_workers
 from src.conf.config import settings
 from src.schemas import UserDb
 
@@ -19,17 +20,17 @@ async def read_users_me(current_user: User = Depends(auth_service.get_current_us
 
 
 @router.patch('/avatar', response_model=UserDb)
-async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)):
-    cloudinary.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True
-    )
-
-    cloudinary.uploader.upload(file.file, public_id=f'GoIT_HW/{current_user.username}', overwrite=True)
-    src_url = cloudinary.CloudinaryImage(f'GoIT_HW/{current_user.username}')\
-                        .build_url(width=250, height=250, crop='fill')
-    user = await repository_users.update_avatar(current_user.email, src_url, db)
-    return user
\ No newline at end of file
+async def update_avatar_user(background_tasks: BackgroundTasks, file: UploadFile = File(),
+                             current_user: User = Depends(auth_service.get_current_user),
+                             db: AsyncSession = Depends(get_db), storage: Storage = Depends(get_storage)):
+    data = await read_upload(file, settings.avatar_max_bytes)
+    try:
+        thumbnails = await image_workers.run(make_thumbnails, data, settings.avatar_sizes, settings.avatar_max_pixels)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+    main_size = settings.avatar_sizes[0]
+    digest = avatar_digest(thumbnails[main_size])
+    # the URL is known before the upload: the response does not wait for the storage
+    background_tasks.add_task(upload_thumbnails, storage, thumbnails, digest)
+    user = await repository_users.update_avatar(current_user.email, storage.url(avatar_key(digest, main_size)), db)
+    return user
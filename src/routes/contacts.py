@@ -1,13 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Path
+import io
+from datetime import date
+
+from fastapi import APIRouter, Depends, HTTPException, status, Path, Query, UploadFile, File, Body, Request, Response
+from fastapi.responses import StreamingResponse
 from typing import List
 
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
-from src.schemas import ContactResponse, ContactModel
+from src.database.db import get_db, get_read_db
+from src.schemas import ContactResponse, ContactModel, ContactPage, ContactImportReport, ContactSelection, \
+    ContactBulkUpdate, ContactBulkResult, ContactUpdate
 from src.repository import contacts as repository_contacts
-from src.database.models import Role, User
+from src.database.models import Contact, Role
 from src.services.auth import auth_service
+from src.services.contacts_export import export_csv, export_ndjson, EXPORT_FORMATS
+from src.services.conditional import entity_tag, is_conditional, is_not_modified, not_modified, set_validators
+from src.services.contacts_import import import_contacts, IMPORT_FORMATS
+from src.services.pagination import decode_id_cursor, decode_score_cursor, make_page
 from src.services.roles import RolesAccess
 
 router = APIRouter(prefix='/contacts', tags=['contacts'])
@@ -18,49 +28,176 @@ access_update = RolesAccess([Role.admin, Role.moderator])
 access_delete = RolesAccess([Role.admin])
 
 
-@router.get('/', response_model=List[ContactResponse], dependencies=[Depends(access_get)])
-async def get_contacts(db: Session = Depends(get_db), _: User = Depends(auth_service.get_current_user)):
-    contacts = await repository_contacts.get_contacts(db)
-    return contacts
+def version_tag(version, *parts) -> str:
+    """
+    Entity tag of a list from its ``get_contacts_version`` summary and the parameters that select it.
+    """
+    return entity_tag(*parts, version.count, version.max_id, version.last_modified)
+
+
+def rows_version(contacts) -> tuple:
+    # the same summary as get_contacts_version, taken from the rows already loaded
+    return (len(contacts), max((contact.id for contact in contacts), default=None),
+            max((contact.updated_at for contact in contacts if contact.updated_at), default=None))
+
+
+@router.get('/', response_model=ContactPage, dependencies=[Depends(access_get)])
+async def get_contacts(request: Request, response: Response, limit: int = Query(20, ge=1, le=100),
+                       cursor: str | None = Query(None), db: AsyncSession = Depends(get_read_db),
+                       _: dict = Depends(auth_service.get_access_claims)):
+    after_id = decode_id_cursor(cursor)
+    if is_conditional(request):
+        version = await repository_contacts.get_contacts_version(db, limit + 1, after_id)
+        etag = version_tag(version, 'contacts', limit, after_id)
+        if is_not_modified(request, etag, version.last_modified):
+            return not_modified(etag, version.last_modified)
+    contacts = await repository_contacts.get_contacts(db, limit + 1, after_id)
+    count, max_id, last_modified = rows_version(contacts)
+    set_validators(response, entity_tag('contacts', limit, after_id, count, max_id, last_modified), last_modified)
+    return make_page(contacts, limit)
 
 
 @router.get('/birthdays', response_model=List[ContactResponse], dependencies=[Depends(access_get)])
-async def get_contacts_by_birthdays(db: Session = Depends(get_db), _: User = Depends(auth_service.get_current_user)):
-    contacts = await repository_contacts.get_contacts_by_birthdays(db)
+async def get_contacts_by_birthdays(request: Request, response: Response, days: int = Query(7, ge=0, le=365),
+                                    db: AsyncSession = Depends(get_read_db),
+                                    _: dict = Depends(auth_service.get_access_claims)):
+    today = date.today()
+    if is_conditional(request):
+        version = await repository_contacts.get_contacts_version(
+            db, None, where=repository_contacts.birthday_criteria(today, days))
+        etag = version_tag(version, 'birthdays', days, today)
+        if is_not_modified(request, etag, version.last_modified):
+            return not_modified(etag, version.last_modified)
+    contacts = await repository_contacts.get_contacts_by_birthdays(db, days, today)
+    count, max_id, last_modified = rows_version(contacts)
+    set_validators(response, entity_tag('birthdays', days, today, count, max_id, last_modified), last_modified)
     return contacts
 
 
+@router.get('/search', response_model=ContactPage, dependencies=[Depends(access_get)])
+async def search_contacts(request: Request, response: Response, q: str = Query(min_length=1, max_length=100),
+                          limit: int = Query(20, ge=1, le=100), cursor: str | None = Query(None),
+                          db: AsyncSession = Depends(get_read_db), _: dict = Depends(auth_service.get_access_claims)):
+    rows = await repository_contacts.search_contacts(q, db, limit + 1, decode_score_cursor(cursor))
+    # no cheaper summary exists than the indexed search itself: the tag is taken from the ranked rows, so a
+    # 304 saves the response, not the query. Without Last-Modified, since a row older than the client's copy
+    # can enter the results
+    etag = entity_tag('search', q, limit, cursor, [(row[0].id, row.score, row[0].updated_at) for row in rows])
+    if is_not_modified(request, etag, None):
+        return not_modified(etag, None)
+    set_validators(response, etag, None)
+    page = make_page(rows, limit, key=lambda row: (row.score, row[0].id))
+    page["items"] = [row[0] for row in page["items"]]
+    return page
+
+
+@router.get('/export', response_class=StreamingResponse, dependencies=[Depends(access_get)])
+async def export_contacts(format: str = Query('ndjson', regex='^(csv|ndjson)$'),
+                          after_id: int | None = Query(None, ge=0), db: AsyncSession = Depends(get_read_db),
+                          _: dict = Depends(auth_service.get_access_claims)):
+    rows = repository_contacts.stream_contacts(db, after_id)
+    body = export_csv(rows) if format == 'csv' else export_ndjson(rows)
+    return StreamingResponse(body, media_type=EXPORT_FORMATS[format],
+                             headers={"Content-Disposition": f'attachment; filename="contacts.{format}"'})
+
+
+@router.post('/import', response_model=ContactImportReport, dependencies=[Depends(access_create)])
+async def import_contacts_file(file: UploadFile = File(), format: str | None = Query(None, regex='^(csv|ndjson)$'),
+                               batch_size: int = Query(1000, ge=1, le=10000), db: AsyncSession = Depends(get_db),
+                               _: dict = Depends(auth_service.get_access_claims)):
+    fmt = format or (file.filename or '').rsplit('.', 1)[-1].lower()
+    if fmt not in IMPORT_FORMATS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown import format")
+    lines = io.TextIOWrapper(file.file, encoding='utf-8-sig', errors='replace', newline='')
+    try:
+        return await import_contacts(lines, fmt, db, batch_size)
+    finally:
+        lines.detach()
+
+
+@router.patch('/bulk', response_model=ContactBulkResult, dependencies=[Depends(access_update)])
+async def update_contacts(body: ContactBulkUpdate, db: AsyncSession = Depends(get_db),
+                          _: dict = Depends(auth_service.get_access_claims)):
+    changes = body.changes.dict(exclude_unset=True)
+    if not changes:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No fields to update")
+    try:
+        affected = await repository_contacts.update_contacts(body, changes, db)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Email or phone already exists')
+    return {"affected": affected, "missing": sorted(set(body.ids or []) - set(affected))}
+
+
+@router.delete('/bulk', response_model=ContactBulkResult, dependencies=[Depends(access_delete)])
+async def remove_contacts(body: ContactSelection = Body(), db: AsyncSession = Depends(get_db),
+                          _: dict = Depends(auth_service.get_access_claims)):
+    affected = await repository_contacts.remove_contacts(body, db)
+    return {"affected": affected, "missing": sorted(set(body.ids or []) - set(affected))}
+
+
 @router.get('/{contact_id}', response_model=ContactResponse, dependencies=[Depends(access_get)])
-async def get_contact_by_id(contact_id: int = Path(ge=1), db: Session = Depends(get_db),
-                            _: User = Depends(auth_service.get_current_user)):
+async def get_contact_by_id(request: Request, response: Response, contact_id: int = Path(ge=1),
+                            db: AsyncSession = Depends(get_read_db), _: dict = Depends(auth_service.get_access_claims)):
+    if is_conditional(request):
+        version = await repository_contacts.get_contact_version(contact_id, db)
+        if version:
+            etag = entity_tag('contact', contact_id, version.updated_at)
+            if is_not_modified(request, etag, version.updated_at):
+                return not_modified(etag, version.updated_at)
     contact = await repository_contacts.get_contact_by_id(contact_id, db)
     if not contact:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No such contact")
+    set_validators(response, entity_tag('contact', contact_id, contact.updated_at), contact.updated_at)
     return contact
 
 
-@router.get('/search_by_name/{contact_name}', response_model=List[ContactResponse], dependencies=[Depends(access_get)])
-async def get_contact_by_name(contact_name: str, db: Session = Depends(get_db),
-                              _: User = Depends(auth_service.get_current_user)):
-    contact = await repository_contacts.get_contact_by_name(contact_name, db)
+@router.get('/search_by_name/{contact_name}', response_model=ContactPage, dependencies=[Depends(access_get)])
+async def get_contact_by_name(request: Request, response: Response, contact_name: str,
+                              limit: int = Query(20, ge=1, le=100), cursor: str | None = Query(None),
+                              db: AsyncSession = Depends(get_read_db),
+                              _: dict = Depends(auth_service.get_access_claims)):
+    after_id = decode_id_cursor(cursor)
+    if is_conditional(request):
+        version = await repository_contacts.get_contacts_version(db, limit + 1, after_id,
+                                                                 where=(Contact.name == contact_name,))
+        etag = version_tag(version, 'name', contact_name, limit, after_id)
+        if version.count and is_not_modified(request, etag, version.last_modified):
+            return not_modified(etag, version.last_modified)
+    contact = await repository_contacts.get_contact_by_name(contact_name, db, limit + 1, after_id)
     if not contact:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No such contact")
-    return contact
+    count, max_id, last_modified = rows_version(contact)
+    set_validators(response, entity_tag('name', contact_name, limit, after_id, count, max_id, last_modified),
+                   last_modified)
+    return make_page(contact, limit)
 
 
-@router.get('/search_by_surname/{contact_surname}', response_model=List[ContactResponse],
+@router.get('/search_by_surname/{contact_surname}', response_model=ContactPage,
             dependencies=[Depends(access_get)])
-async def get_contact_by_surname(contact_surname: str, db: Session = Depends(get_db),
-                                 _: User = Depends(auth_service.get_current_user)):
-    contact = await repository_contacts.get_contact_by_surname(contact_surname, db)
+async def get_contact_by_surname(request: Request, response: Response, contact_surname: str,
+                                 limit: int = Query(20, ge=1, le=100), cursor: str | None = Query(None),
+                                 db: AsyncSession = Depends(get_read_db),
+                                 _: dict = Depends(auth_service.get_access_claims)):
+    after_id = decode_id_cursor(cursor)
+    if is_conditional(request):
+        version = await repository_contacts.get_contacts_version(db, limit + 1, after_id,
+                                                                 where=(Contact.surname == contact_surname,))
+        etag = version_tag(version, 'surname', contact_surname, limit, after_id)
+        if version.count and is_not_modified(request, etag, version.last_modified):
+            return not_modified(etag, version.last_modified)
+    contact = await repository_contacts.get_contact_by_surname(contact_surname, db, limit + 1, after_id)
     if not contact:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No such contact")
-    return contact
+    count, max_id, last_modified = rows_version(contact)
+    set_validators(response, entity_tag('surname', contact_surname, limit, after_id, count, max_id, last_modified),
+                   last_modified)
+    return make_page(contact, limit)
 
 
 @router.get('/search_by_email/{contact_email}', response_model=ContactResponse, dependencies=[Depends(access_get)])
-async def get_contact_by_email(contact_email: str, db: Session = Depends(get_db),
-                               _: User = Depends(auth_service.get_current_user)):
+async def get_contact_by_email(contact_email: str, db: AsyncSession = Depends(get_read_db),
+                               _: dict = Depends(auth_service.get_access_claims)):
     contact = await repository_contacts.get_contact_by_email(contact_email, db)
     if not contact:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Email already exists')
@@ -69,28 +206,61 @@ async def get_contact_by_email(contact_email: str, db: Session = Depends(get_db)
 
 @router.post('/', response_model=ContactResponse, status_code=status.HTTP_201_CREATED,
              dependencies=[Depends(access_get)])
-async def create_contact(body: ContactModel, db: Session = Depends(get_db),
-                         _: User = Depends(auth_service.get_current_user)):
-    contact = await repository_contacts.get_contact_by_email(body.email, db)
-    if contact:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Email already exists')
-    contact = await repository_contacts.create_contact(body, db)
+async def create_contact(body: ContactModel, response: Response,
+                         on_conflict: str = Query('error', regex='^(error|ignore|update)$'),
+                         db: AsyncSession = Depends(get_db), _: dict = Depends(auth_service.get_access_claims)):
+    if on_conflict == 'error':
+        try:
+            return await repository_contacts.create_contact(body, db)
+        except IntegrityError:
+            await db.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Email or phone already exists')
+    try:
+        contact, created = await repository_contacts.upsert_contact(body, db, on_conflict == 'update')
+    except IntegrityError:
+        # the phone belongs to another contact: only the email conflict is resolved
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Phone already exists')
+    if not created:
+        response.status_code = status.HTTP_200_OK
+    if contact is None:
+        # on_conflict=ignore left the existing contact as it is
+        contact = await repository_contacts.get_contact_by_email(body.email, db)
+        if contact is None:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Email already exists')
     return contact
 
 
 @router.put('/{contact_id}', response_model=ContactResponse, dependencies=[Depends(access_get)])
-async def update_contact(body: ContactModel, contact_id: int = Path(ge=1), db: Session = Depends(get_db),
-                         _: User = Depends(auth_service.get_current_user)):
-    contact = await repository_contacts.update_contact(body, contact_id, db)
+async def update_contact(body: ContactModel, contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
+                         _: dict = Depends(auth_service.get_access_claims)):
+    try:
+        contact = await repository_contacts.update_contact(body, contact_id, db)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Email or phone already exists')
+    if not contact:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No such contact")
+    return contact
+
+
+@router.patch('/{contact_id}', response_model=ContactResponse, dependencies=[Depends(access_update)])
+async def patch_contact(body: ContactUpdate, contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
+                        _: dict = Depends(auth_service.get_access_claims)):
+    try:
+        contact = await repository_contacts.update_contact(body, contact_id, db)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Email or phone already exists')
     if not contact:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No such contact")
     return contact
 
 
 @router.delete('/{contact_id}', response_model=ContactResponse, dependencies=[Depends(access_get)])
-async def remove_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_db),
-                         _: User = Depends(auth_service.get_current_user)):
+async def remove_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
+                         _: dict = Depends(auth_service.get_access_claims)):
     contact = await repository_contacts.remove_contact(contact_id, db)
     if not contact:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No such contact")
-    return contact
\ No newline at end of file
+    return contact
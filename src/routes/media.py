@@ -0,0 +1,84 @@
+import mimetypes
+import os
+import re
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+
+from src.conf.config import settings
+from src.services.conditional import entity_tag, http_date, is_not_modified
+from src.services.storage import LocalStorage, Storage, get_storage
+
+router = APIRouter(tags=['media'])
+
+BYTE_RANGE = re.compile(r'bytes=(\d*)-(\d*)$')
+READ_CHUNK = 64 * 1024
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parse a single-range ``Range`` header.
+
+    :param header: Header value.
+    :type header: str
+    :param size: File size.
+    :type size: int
+    :return: First and last byte, or None when the header is to be ignored (malformed or multi-range).
+    :rtype: tuple[int, int] | None
+    :raises HTTPException: 416 when the range lies outside the file.
+    """
+    match = BYTE_RANGE.match(header.strip())
+    if match is None or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPException(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                            detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def _read(path: str, start: int, end: int):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(READ_CHUNK, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+@router.get(settings.media_url + '/{key:path}')
+async def get_media(key: str, request: Request, storage: Storage = Depends(get_storage)):
+    path = storage.path(key) if isinstance(storage, LocalStorage) else None
+    if path is None or not os.path.isfile(path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+    stat = os.stat(path)
+    etag = entity_tag('media', key, stat.st_size)
+    last_modified = datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+    # keys are content addresses: what a key names never changes
+    headers = {"ETag": etag, "Last-Modified": http_date(last_modified), "Accept-Ranges": "bytes",
+               "Cache-Control": "public, max-age=31536000, immutable"}
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    start, end, status_code = 0, stat.st_size - 1, status.HTTP_200_OK
+    byte_range = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    # a Range with a stale If-Range gets the whole file
+    if byte_range and (if_range is None or if_range in (etag, headers["Last-Modified"])):
+        parsed = parse_range(byte_range, stat.st_size)
+        if parsed is not None:
+            start, end = parsed
+            status_code = status.HTTP_206_PARTIAL_CONTENT
+            headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(_read(path, start, end), status_code=status_code, headers=headers,
+                             media_type=mimetypes.guess_type(path)[0] or 'application/octet-stream')
@@ -0,0 +1,74 @@
+import secrets
+
+from fastapi import APIRouter, HTTPException, Request, Response, status
+
+from src.conf.config import settings
+from src.database.db import engine
+from src.services.admission import admission_stats
+from src.services.cache import contact_cache, principal_cache
+from src.services.email import mail_dispatcher
+from src.services.gravatar import gravatar_resolver
+from src.services.metrics import (ADMISSION_REQUESTS, CACHE_REQUESTS, DB_POOL_CONNECTIONS, DB_POOL_EVENTS,
+                                  MAIL_MESSAGES, REQUESTS_IN_FLIGHT, WORKER_POOL_CALLS, register_publisher, render_metrics)
+from src.services.workers import image_workers, import_workers, password_workers
+
+router = APIRouter(tags=['metrics'])
+
+
+@register_publisher
+def publish_pool():
+    pool = engine.pool.stats.snapshot(engine.pool)
+    for state in ('checked_out', 'idle', 'overflow'):
+        DB_POOL_CONNECTIONS.labels(state).set(pool[state])
+    for event in ('checkouts', 'connects', 'closes', 'invalidations', 'timeouts'):
+        DB_POOL_EVENTS.labels(event).set(pool[event])
+
+
+@register_publisher
+def publish_caches():
+    for name, stats in (('contacts', contact_cache.stats()), ('principal', principal_cache.stats())):
+        for result in ('local_hits', 'redis_hits', 'misses', 'errors'):
+            CACHE_REQUESTS.labels(name, result).set(stats[result])
+    stats = gravatar_resolver.stats()
+    CACHE_REQUESTS.labels('gravatar', 'local_hits').set(stats['hits'])
+    CACHE_REQUESTS.labels('gravatar', 'misses').set(stats['lookups'])
+
+
+@register_publisher
+def publish_workers():
+    for executor in (password_workers, image_workers, import_workers):
+        stats = executor.stats()
+        for state in ('pending', 'completed', 'rejected'):
+            WORKER_POOL_CALLS.labels(executor.name, state).set(stats[state])
+
+
+@register_publisher
+def publish_mail():
+    stats = mail_dispatcher.stats()
+    for state in ('pending', 'sent', 'retried', 'failed', 'dropped', 'connections'):
+        MAIL_MESSAGES.labels(state).set(stats[state])
+
+
+@register_publisher
+def publish_admission():
+    stats = admission_stats.dict()
+    for decision in ('admitted', 'rate_limited', 'shed_concurrency', 'shed_loop_lag'):
+        ADMISSION_REQUESTS.labels(decision).set(stats[decision])
+    REQUESTS_IN_FLIGHT.set(stats['in_flight'])
+
+
+@router.get('/metrics', include_in_schema=False)
+async def metrics(request: Request):
+    """
+    Metrics in the Prometheus text format. Cache hit ratios are ``cache_requests`` hits over all lookups.
+    With ``metrics_token`` set, the scraper must send it as a bearer token.
+    """
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if settings.metrics_token:
+        scheme, _, token = request.headers.get('authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not secrets.compare_digest(token.encode(), settings.metrics_token.encode()):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials",
+                                headers={"WWW-Authenticate": "Bearer"})
+    body, content_type = render_metrics()
+    return Response(body, headers={"Content-Type": content_type})
@@ -1,4 +1,7 @@
-from pydantic import BaseModel, EmailStr, Field
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, EmailStr, Field, root_validator, validator
 
 from src.database.models import Role
 
@@ -8,23 +11,78 @@ class ContactModel(BaseModel):
     surname: str = Field(min_length=1, max_length=20)
     email: EmailStr
     phone: str
-    birthday: str
+    birthday: date
     description: str
 
 
+class ContactUpdate(BaseModel):
+    name: Optional[str] = Field(None, min_length=1, max_length=20)
+    surname: Optional[str] = Field(None, min_length=1, max_length=20)
+    email: Optional[EmailStr]
+    phone: Optional[str]
+    birthday: Optional[date]
+    description: Optional[str]
+
+    @validator('name', 'surname', 'email', 'phone', pre=True)
+    def not_null(cls, value):
+        # fields may be left out, but only birthday and description may be cleared with null
+        if value is None:
+            raise ValueError('may not be null')
+        return value
+
+
+class ContactSelection(BaseModel):
+    ids: Optional[List[int]] = Field(None, min_items=1, max_items=10000)
+    name: Optional[str]
+    surname: Optional[str]
+
+    @root_validator(skip_on_failure=True)
+    def not_empty(cls, values):
+        if values.get('ids') is None and values.get('name') is None and values.get('surname') is None:
+            raise ValueError('ids, name or surname is required')
+        return values
+
+
+class ContactBulkUpdate(ContactSelection):
+    changes: ContactUpdate
+
+
+class ContactBulkResult(BaseModel):
+    affected: List[int]
+    missing: List[int] = []
+
+
 class ContactResponse(BaseModel):
     id: int
     name: str = 'Name'
     surname: str = 'Surname'
     email: EmailStr
     phone: str = '0993334567'
-    birthday: str
-    description: str
+    birthday: Optional[date] = None
+    description: Optional[str] = None
 
     class Config:
         orm_mode = True
 
 
+class ContactPage(BaseModel):
+    items: List[ContactResponse]
+    next_cursor: Optional[str] = None
+
+
+class ContactImportError(BaseModel):
+    line: int
+    error: str
+
+
+class ContactImportReport(BaseModel):
+    processed: int
+    inserted: int
+    duplicates: int
+    failed: int
+    errors: List[ContactImportError]
+
+
 class ContactName(BaseModel):
     name: str = 'Name'
 
@@ -57,6 +115,27 @@ class UserDb(BaseModel):
         orm_mode = True
 
 
+class UserRoleUpdate(BaseModel):
+    role: Role
+
+
+class UserRoleResponse(BaseModel):
+    id: int
+    email: str
+    role: Role
+
+    class Config:
+        orm_mode = True
+
+
+class SessionResponse(BaseModel):
+    id: str
+    device: Optional[str]
+    created_at: Optional[datetime]
+    last_used_at: Optional[datetime]
+    expires_at: datetime
+
+
 class TokenModel(BaseModel):
     access_token: str
     refresh_token: str
@@ -64,4 +143,69 @@ class TokenModel(BaseModel):
 
 
 class RequestEmail(BaseModel):
-    email: EmailStr
\ No newline at end of file
+    email: EmailStr
+
+
+class WaitHistogram(BaseModel):
+    buckets: Dict[str, int]
+    count: int
+    sum: float
+
+
+class PoolStatus(BaseModel):
+    size: int
+    checked_out: int
+    idle: int
+    overflow: int
+    checkouts: int
+    checkins: int
+    connects: int
+    closes: int
+    invalidations: int
+    timeouts: int
+    wait_seconds: WaitHistogram
+
+
+class CacheStatus(BaseModel):
+    enabled: bool
+    redis: bool
+    version: int
+    local_entries: int
+    local_hits: int
+    redis_hits: int
+    misses: int
+    invalidations: int
+    errors: int
+
+
+class PrincipalCacheStatus(BaseModel):
+    enabled: bool
+    redis: bool
+    local_entries: int
+    local_hits: int
+    redis_hits: int
+    misses: int
+    invalidations: int
+    errors: int
+
+
+class AdmissionStatus(BaseModel):
+    admitted: int
+    rate_limited: int
+    shed_concurrency: int
+    shed_loop_lag: int
+    backend_errors: int
+    in_flight: int
+    loop_lag: float
+
+
+class MailStatus(BaseModel):
+    workers: int
+    running: bool
+    pending: int
+    queued: int
+    sent: int
+    retried: int
+    failed: int
+    dropped: int
+    connections: int
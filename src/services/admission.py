@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from src.conf.config import settings
+from src.services.auth import auth_service
+
+try:
+    from redis import asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # pragma: no cover - redis is optional while the memory backend is used
+    aioredis = None
+    RedisError = OSError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RateRule:
+    """
+    ``requests`` per ``seconds`` for requests whose ``METHOD /path`` starts with ``pattern``.
+    The bucket holds ``requests`` tokens, so a full window may be spent in one burst.
+    """
+    pattern: str
+    requests: int
+    seconds: float
+
+    @property
+    def rate(self) -> float:
+        return self.requests / self.seconds
+
+    @classmethod
+    def parse(cls, pattern: str, limit: str) -> 'RateRule':
+        requests, _, seconds = limit.partition('/')
+        return cls(pattern, int(requests), float(seconds or 1))
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.pattern.startswith('/'):
+            return path.startswith(self.pattern)
+        return f"{method} {path}".startswith(self.pattern)
+
+
+class MemoryBuckets:
+    """
+    Token buckets of one process. The least recently used buckets are dropped beyond ``max_keys``.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """
+        Take one token.
+
+        :return: 0 when allowed, otherwise seconds until a token is available.
+        :rtype: float
+        """
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+class RedisBuckets:
+    """
+    Token buckets shared by all workers. The refill and the take run atomically in one script
+    on the Redis clock, so worker clocks do not matter.
+    """
+
+    SCRIPT = """
+    local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+    local retry_after = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        retry_after = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(retry_after)
+    """
+
+    def __init__(self, redis, prefix: str = 'ratelimit'):
+        self.redis = redis
+        self.prefix = prefix
+        self._script = redis.register_script(self.SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        return float(await self._script(keys=[f"{self.prefix}:{key}"], args=[rate, burst]))
+
+
+class AdmissionStats:
+    def __init__(self):
+        self.admitted = 0
+        self.rate_limited = 0
+        self.shed_concurrency = 0
+        self.shed_loop_lag = 0
+        self.backend_errors = 0
+        self.in_flight = 0
+        self.loop_lag = 0.0
+
+    def dict(self) -> dict:
+        return {"admitted": self.admitted, "rate_limited": self.rate_limited,
+                "shed_concurrency": self.shed_concurrency, "shed_loop_lag": self.shed_loop_lag,
+                "backend_errors": self.backend_errors, "in_flight": self.in_flight, "loop_lag": self.loop_lag}
+
+
+def rate_limit_keys(request: Request) -> list[str]:
+    """
+    Clients a request is counted against: its address, and its user when the bearer token is valid.
+    The signature is verified, so nobody can spend another user's budget.
+
+    :param request: Current request.
+    :type request: Request
+    :return: Client keys.
+    :rtype: list[str]
+    """
+    keys = []
+    if request.client:
+        keys.append(f"ip:{request.client.host}")
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if scheme.lower() == 'bearer' and token:
+        try:
+            keys.append(f"user:{auth_service.decode_access_token(token)['sub']}")
+        except HTTPException:
+            pass
+    return keys
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that refuses work the worker cannot take:
+
+    * 429 once a client exhausts the token bucket of the first rule matching the route;
+    * 503 while ``max_in_flight`` requests are being served, or while the event loop lags
+      more than ``max_loop_lag`` seconds behind.
+
+    Both answers carry ``Retry-After``. Paths in ``exempt`` are never refused.
+    """
+
+    def __init__(self, app, rules: list[RateRule] | None = None, buckets=None, max_in_flight: int = 0,
+                 max_loop_lag: float = 0, lag_interval: float = 0.05, exempt: tuple[str, ...] = (),
+                 stats: AdmissionStats | None = None):
+        self.app = app
+        # longest pattern first: the most specific rule wins
+        self.rules = sorted(rules or [], key=lambda rule: len(rule.pattern), reverse=True)
+        self.buckets = buckets or MemoryBuckets()
+        self.max_in_flight = max_in_flight
+        self.max_loop_lag = max_loop_lag
+        self.lag_interval = lag_interval
+        self.exempt = exempt
+        self.stats = stats or AdmissionStats()
+        self._monitor = None
+
+    def _ensure_lag_monitor(self):
+        loop = asyncio.get_running_loop()
+        if self._monitor is None or self._monitor.done() or self._monitor.get_loop() is not loop:
+            self._monitor = asyncio.create_task(self._watch_loop_lag())
+
+    async def _watch_loop_lag(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.lag_interval)
+            self.stats.loop_lag = max(time.perf_counter() - start - self.lag_interval, 0.0)
+
+    async def _rate_limit(self, request: Request) -> float:
+        rule = next((rule for rule in self.rules if rule.matches(request.method, request.url.path)), None)
+        if rule is None:
+            return 0
+        retry_after = 0.0
+        for client in rate_limit_keys(request):
+            try:
+                retry_after = max(retry_after, await self.buckets.take(f"{rule.pattern}:{client}", rule.rate,
+                                                                       rule.requests))
+            except RedisError as e:
+                # a broken limiter must not take the API down with it
+                self.stats.backend_errors += 1
+                logger.warning("Rate limit backend failed: %s", e)
+        return retry_after
+
+    @staticmethod
+    def _refuse(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+        return JSONResponse({"detail": detail}, status_code=status_code,
+                            headers={"Retry-After": str(max(math.ceil(retry_after), 1))})
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'].startswith(self.exempt):
+            return await self.app(scope, receive, send)
+        if self.max_loop_lag:
+            self._ensure_lag_monitor()
+            if self.stats.loop_lag > self.max_loop_lag:
+                self.stats.shed_loop_lag += 1
+                return await self._refuse(503, "Server is overloaded", self.stats.loop_lag)(scope, receive, send)
+        if self.max_in_flight and self.stats.in_flight >= self.max_in_flight:
+            self.stats.shed_concurrency += 1
+            return await self._refuse(503, "Server is overloaded", 1)(scope, receive, send)
+        retry_after = await self._rate_limit(Request(scope))
+        if retry_after:
+            self.stats.rate_limited += 1
+            return await self._refuse(429, "Too many requests", retry_after)(scope, receive, send)
+        self.stats.admitted += 1
+        self.stats.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.stats.in_flight -= 1
+
+
+admission_stats = AdmissionStats()
+
+
+def admission_options() -> dict:
+    """
+    Keyword arguments of :class:`AdmissionMiddleware` taken from the settings.
+
+    :rtype: dict
+    """
+    rules = [RateRule.parse(pattern, limit) for pattern, limit in settings.rate_limits.items()] \
+        if settings.rate_limit_enabled else []
+    buckets = None
+    if rules and settings.rate_limit_redis and aioredis is not None:
+        buckets = RedisBuckets(aioredis.Redis(host=settings.redis_host, port=settings.redis))
+    return {"rules": rules, "buckets": buckets, "max_in_flight": settings.max_in_flight,
+            "max_loop_lag": settings.max_loop_lag, "exempt": ('/api/healthchecker', '/metrics'), "stats": admission_stats}
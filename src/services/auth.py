@@ -5,14 +5,20 @@ from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.conf.config import settings
 from src.database.db import get_db
+from src.database.models import Role, User
 from src.repository import users as repository_users
+from src.services.cache import MISSING, principal_cache
+from src.services.workers import password_workers
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    # hashes of any other cost are reported by needs_update and rehashed on the next login
+    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=settings.bcrypt_rounds,
+                               bcrypt__min_rounds=settings.bcrypt_rounds, bcrypt__max_rounds=settings.bcrypt_rounds)
     SECRET_KEY = "secret_key"
     ALGORITHM = "HS256"
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
@@ -23,9 +29,39 @@ class Auth:
     def get_password_hash(self, password: str):
         return self.pwd_context.hash(password)
 
+    async def hash_password(self, password: str) -> str:
+        """
+        Hash a password in the password worker pool.
+
+        :param password: Plain password.
+        :type password: str
+        :return: bcrypt hash.
+        :rtype: str
+        """
+        return await password_workers.run(self.get_password_hash, password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+        """
+        Verify a password in the password worker pool.
+
+        :param plain_password: Plain password.
+        :type plain_password: str
+        :param hashed_password: Stored hash.
+        :type hashed_password: str
+        :return: Whether the password matches, and a new hash when the stored one uses outdated settings.
+        :rtype: tuple[bool, str | None]
+        """
+        return await password_workers.run(self.pwd_context.verify_and_update, plain_password, hashed_password)
+
     # define a function to generate a new access token
-    async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
+    async def create_access_token(self, data: dict, expires_delta: Optional[float] = None,
+                                  user: Optional[User] = None):
         to_encode = data.copy()
+        if user is not None and settings.access_token_role_claims:
+            # the role is trusted without a lookup until the token expires, so such tokens live briefly
+            to_encode.update({"role": (user.role or Role.user).value, "confirmed": bool(user.confirmed),
+                              "ver": user.token_version or 0})
+            expires_delta = expires_delta or settings.role_claims_ttl
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
@@ -40,22 +76,57 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(days=7)
+            expire = datetime.utcnow() + timedelta(days=settings.refresh_token_days)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
         encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_refresh_token
 
-    async def decode_refresh_token(self, refresh_token: str):
+    async def decode_refresh_claims(self, refresh_token: str) -> dict:
         try:
             payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
             if payload['scope'] == 'refresh_token':
-                email = payload['sub']
-                return email
+                return payload
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def decode_refresh_token(self, refresh_token: str):
+        return (await self.decode_refresh_claims(refresh_token))['sub']
+
+    def create_email_token(self, data: dict) -> str:
+        """
+        Token for the e-mail confirmation link.
+
+        :param data: Claims, ``sub`` is the e-mail to confirm.
+        :type data: dict
+        :return: Encoded token, valid for ``email_token_hours``.
+        :rtype: str
+        """
+        to_encode = data.copy()
+        expire = datetime.utcnow() + timedelta(hours=settings.email_token_hours)
+        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "email_token"})
+        return jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+
+    async def get_email_from_token(self, token: str) -> str:
+        """
+        E-mail confirmed by a token from :meth:`create_email_token`.
+
+        :param token: Token from the confirmation link.
+        :type token: str
+        :return: E-mail.
+        :rtype: str
+        :raises HTTPException: 422 when the token is invalid, expired or of another scope.
+        """
+        try:
+            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            if payload.get('scope') == 'email_token' and payload.get('sub'):
+                return payload['sub']
+        except JWTError:
+            pass
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="Invalid token for email verification")
+
+    def decode_access_token(self, token: str) -> dict:
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
@@ -66,16 +137,38 @@ class Auth:
             # Decode JWT
             payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
             if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
+                if payload["sub"] is None:
                     raise credentials_exception
             else:
                 raise credentials_exception
-        except JWTError as e:
+        except (JWTError, KeyError):
             raise credentials_exception
+        return payload
+
+    async def get_access_claims(self, token: str = Depends(oauth2_scheme)) -> dict:
+        # verified claims only: no database or cache lookup
+        return self.decode_access_token(token)
+
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+        credentials_exception = HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+        payload = self.decode_access_token(token)
+        email = payload["sub"]
 
-        user = await repository_users.get_user_by_email(email, db)
-        if user is None:
+        # a token seen before needs no query: the principal is cached until the user changes
+        principal = await principal_cache.get(email, payload.get('iat'))
+        if principal is not MISSING:
+            user = repository_users.load_principal(principal)
+        else:
+            user = await repository_users.get_user_by_email(email, db)
+            if user is None:
+                raise credentials_exception
+            await principal_cache.set(email, payload.get('iat'), repository_users.dump_principal(user))
+        # claims signed before a role change are no longer accepted where the user is loaded anyway
+        if payload.get('ver', user.token_version) != user.token_version:
             raise credentials_exception
         return user
 
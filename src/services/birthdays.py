@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from datetime import date, datetime, time, timedelta
+from email.message import EmailMessage
+from email.utils import formataddr
+from typing import Awaitable, Callable
+
+from src.conf.config import settings
+from src.repository import contacts as repository_contacts
+from src.repository import digests as repository_digests
+from src.services.email import MailDispatcher, mail_dispatcher, templates
+
+logger = logging.getLogger(__name__)
+
+digest_template = templates.get_template('birthday_digest.html')
+
+
+def digest_message(email: str, username: str, contacts: list, days: int) -> EmailMessage:
+    message = EmailMessage()
+    message['Subject'] = "Upcoming birthdays"
+    message['From'] = formataddr((settings.mail_from_name, settings.mail_from))
+    message['To'] = email
+    message.set_content(digest_template.render(username=username, contacts=contacts, days=days), subtype='html')
+    return message
+
+
+async def send_birthday_digests(session_factory, today: date | None = None, days: int | None = None,
+                                batch_size: int | None = None, dispatcher: MailDispatcher = mail_dispatcher) -> dict:
+    """
+    Send every confirmed user one digest of the contacts whose birthdays fall in the next ``days`` days.
+
+    The contacts are read once, with the indexed birthday query. Recipients are walked in batches by id;
+    each batch is claimed in the database before its mail goes out, over one SMTP connection reused for
+    the whole run. A second run for the same day, after a crash or in another process, skips every
+    claimed recipient: a digest whose fate is unknown is not sent again.
+
+    :param session_factory: Makes database sessions, e.g. ``SessionLocal``.
+    :param today: Day of the digest, defaults to the current date.
+    :type today: date | None
+    :param days: Length of the window, defaults to ``birthday_digest_days``.
+    :type days: int | None
+    :param batch_size: Recipients per batch, defaults to ``birthday_digest_batch``.
+    :type batch_size: int | None
+    :param dispatcher: Delivers the messages and holds the retry policy.
+    :type dispatcher: MailDispatcher
+    :return: Report with the number of contacts and of sent, failed and skipped digests.
+    :rtype: dict
+    """
+    today = today or date.today()
+    days = days or settings.birthday_digest_days
+    batch_size = batch_size or settings.birthday_digest_batch
+    async with session_factory() as db:
+        await repository_digests.purge_digests(today - timedelta(days=settings.birthday_digest_keep_days), db)
+        contacts = await repository_contacts.get_contacts_by_birthdays(db, days, today)
+    report = {"date": today.isoformat(), "contacts": len(contacts), "sent": 0, "failed": 0, "skipped": 0}
+    if not contacts:
+        return report
+
+    smtp, after_id = None, 0
+    try:
+        async with session_factory() as db:
+            while recipients := await repository_digests.get_digest_recipients(today, after_id, batch_size, db):
+                after_id = recipients[-1].id
+                claimed = await repository_digests.claim_digests([user.id for user in recipients], today, db)
+                report["skipped"] += len(recipients) - len(claimed)
+                outcome = {"sent": [], "failed": []}
+                for user in recipients:
+                    if user.id in claimed:
+                        smtp, delivered = await dispatcher.deliver(
+                            smtp, digest_message(user.email, user.username, contacts, days))
+                        outcome["sent" if delivered else "failed"].append(user.id)
+                for status, user_ids in outcome.items():
+                    await repository_digests.mark_digests(user_ids, today, status, db)
+                    report[status] += len(user_ids)
+    finally:
+        await dispatcher.close(smtp)
+    logger.info("Birthday digests of %s: %s", today, report)
+    return report
+
+
+def seconds_until(at: time, now: datetime) -> float:
+    """
+    Seconds from ``now`` to the next ``at`` o'clock.
+
+    :param at: Time of day.
+    :type at: time
+    :param now: Current time.
+    :type now: datetime
+    :rtype: float
+    """
+    run = datetime.combine(now.date(), at)
+    if run <= now:
+        run += timedelta(days=1)
+    return (run - now).total_seconds()
+
+
+async def run_daily(at: time, job: Callable[[], Awaitable]):
+    """
+    Background task that runs ``job`` every day at ``at`` local time. A failed run is logged and the
+    schedule goes on.
+
+    :param at: Time of day.
+    :type at: time
+    :param job: Coroutine function to run.
+    """
+    while True:
+        await asyncio.sleep(seconds_until(at, datetime.now()))
+        try:
+            await job()
+        except Exception as e:  # noqa - tomorrow's run retries
+            logger.error("Daily job %s failed: %s", getattr(job, '__name__', job), e)
@@ -0,0 +1,51 @@
+from fastapi import HTTPException, status
+from starlette.responses import JSONResponse
+
+# room for the multipart boundaries and part headers around an uploaded file
+MULTIPART_OVERHEAD = 16 * 1024
+
+
+class BodyLimitMiddleware:
+    """
+    ASGI middleware that caps request bodies per path, before the form parser spools them to disk:
+
+    * a ``Content-Length`` above the limit is answered with 413 without reading the body;
+    * a body sent without one, or longer than announced, fails with 413 as soon as the limit is passed.
+
+    :param limits: Largest body in bytes by path prefix.
+    """
+
+    def __init__(self, app, limits: dict[str, int]):
+        self.app = app
+        # longest prefix first: the most specific limit wins
+        self.limits = sorted(limits.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _limit(self, path: str) -> int | None:
+        return next((limit for prefix, limit in self.limits if path.startswith(prefix)), None)
+
+    @staticmethod
+    def _too_large(limit: int) -> HTTPException:
+        return HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                             detail=f"Request body is larger than {limit} bytes")
+
+    async def __call__(self, scope, receive, send):
+        limit = self._limit(scope['path']) if scope['type'] == 'http' else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+        length = dict(scope['headers']).get(b'content-length')
+        if length is not None and length.isdigit() and int(length) > limit:
+            error = self._too_large(limit)
+            return await JSONResponse({"detail": error.detail}, status_code=error.status_code)(scope, receive, send)
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    # raised inside the body parser: the route answers it like any HTTPException
+                    raise self._too_large(limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,339 @@
+import functools
+import inspect
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from src.conf.config import settings
+
+try:
+    from redis import asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # pragma: no cover - redis is optional while the cache is disabled
+    aioredis = None
+    RedisError = OSError
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU with a per-entry expiry.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard_prefix(self, prefix: str):
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+
+class Cache:
+    """
+    Two-tier read cache: a bounded local LRU in front of an optional Redis.
+
+    Keys carry the namespace version, so invalidating the whole namespace is a single ``INCR``: entries
+    of older versions are never read again and expire on their own. Other processes see a new version
+    after at most ``version_ttl`` seconds; the process that wrote sees it at once.
+    A disabled cache, or a failing Redis, only makes every lookup a miss.
+    """
+
+    def __init__(self, namespace: str, redis=None, enabled: bool = False, ttl: float = 60,
+                 local_size: int = 1024, local_ttl: float = 1, version_ttl: float = 1):
+        self.namespace = namespace
+        self.redis = redis
+        self.enabled = enabled
+        self.ttl = ttl
+        self.local = LocalCache(local_size)
+        self.local_ttl = local_ttl
+        self.version_ttl = version_ttl
+        self._version = 0
+        self._version_checked_at = float('-inf')
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    @classmethod
+    def from_settings(cls, namespace: str) -> 'Cache':
+        redis = None
+        if settings.cache_enabled and aioredis is not None:
+            redis = aioredis.Redis(host=settings.redis_host, port=settings.redis)
+        return cls(namespace, redis, settings.cache_enabled, settings.cache_ttl, settings.cache_local_size,
+                   settings.cache_local_ttl, settings.cache_version_ttl)
+
+    @property
+    def version_key(self) -> str:
+        return f"{self.namespace}:version"
+
+    async def version(self) -> int:
+        if self.redis is None or time.monotonic() - self._version_checked_at < self.version_ttl:
+            return self._version
+        try:
+            self._version = int(await self.redis.get(self.version_key) or 0)
+        except RedisError as e:
+            self.errors += 1
+            logger.warning("Cache version read failed: %s", e)
+        self._version_checked_at = time.monotonic()
+        return self._version
+
+    async def get(self, key: str) -> Any:
+        """
+        Look the key up in the local tier, then in Redis.
+
+        :param key: Key without namespace and version.
+        :type key: str
+        :return: Cached JSON-compatible value, or :data:`MISSING`.
+        """
+        if not self.enabled:
+            return MISSING
+        return await self._get(f"{self.namespace}:{await self.version()}:{key}")
+
+    async def _get(self, full_key: str) -> Any:
+        value = self.local.get(full_key)
+        if value is not MISSING:
+            self.local_hits += 1
+            return value
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(full_key)
+            except RedisError as e:
+                self.errors += 1
+                logger.warning("Cache read failed: %s", e)
+                raw = None
+            if raw is not None:
+                self.redis_hits += 1
+                value = json.loads(raw)
+                self.local.set(full_key, value, min(self.local_ttl, self.ttl))
+                return value
+        self.misses += 1
+        return MISSING
+
+    async def set(self, key: str, value: Any, ttl: float | None = None):
+        """
+        Store a JSON-compatible value in both tiers.
+
+        :param key: Key without namespace and version.
+        :type key: str
+        :param value: JSON-compatible value.
+        :param ttl: Lifetime in seconds, the cache's default when None.
+        :type ttl: float | None
+        """
+        if not self.enabled:
+            return
+        await self._set(f"{self.namespace}:{await self.version()}:{key}", value, ttl)
+
+    async def _set(self, full_key: str, value: Any, ttl: float | None):
+        ttl = self.ttl if ttl is None else ttl
+        self.local.set(full_key, value, min(self.local_ttl, ttl))
+        if self.redis is not None:
+            try:
+                await self.redis.set(full_key, json.dumps(value, separators=(',', ':')), ex=max(int(ttl), 1))
+            except RedisError as e:
+                self.errors += 1
+                logger.warning("Cache write failed: %s", e)
+
+    async def invalidate(self):
+        """
+        Drop every entry of the namespace by moving to the next version.
+        """
+        if not self.enabled:
+            return
+        self.invalidations += 1
+        self.local.clear()
+        if self.redis is None:
+            self._version += 1
+            return
+        try:
+            self._version = int(await self.redis.incr(self.version_key))
+            self._version_checked_at = time.monotonic()
+        except RedisError as e:
+            # the local tier is already empty; other processes catch up when their entries expire
+            self.errors += 1
+            logger.warning("Cache invalidation failed: %s", e)
+
+    def cached(self, name: str, dump: Callable[[Any], Any], load: Callable[[Any], Any],
+               key: Callable[..., tuple] | None = None, ttl: float | None = None):
+        """
+        Cache an async repository function. The ``db`` argument is not part of the key.
+
+        A session marked ``info['replica']`` may be served from the cache but never fills it: a lagging
+        replica would otherwise store pre-write rows under the version a write has just moved to, and
+        hand them to the writer's own reads on the primary.
+
+        :param name: Key prefix, usually the function name.
+        :type name: str
+        :param dump: Turns the result into a JSON-compatible value.
+        :param load: Turns the cached value back into a result.
+        :param key: Builds the key from the function's arguments except ``db``; all of them by default.
+        :param ttl: Lifetime of the entries, the cache's default when None.
+        :type ttl: float | None
+        """
+        def decorator(func):
+            signature = inspect.signature(func)
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return await func(*args, **kwargs)
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                arguments = {k: v for k, v in bound.arguments.items() if k != 'db'}
+                parts = key(**arguments) if key else tuple(arguments.values())
+                # the version is taken before loading: a write that lands meanwhile makes this entry unreachable
+                cache_key = f"{self.namespace}:{await self.version()}:{name}:" \
+                            + json.dumps(parts, default=str, separators=(',', ':'))
+                value = await self._get(cache_key)
+                if value is not MISSING:
+                    return load(value)
+                result = await func(*args, **kwargs)
+                db = bound.arguments.get('db')
+                if db is None or not db.info.get('replica'):
+                    await self._set(cache_key, dump(result), ttl)
+                return result
+
+            return wrapper
+
+        return decorator
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "redis": self.redis is not None, "version": self._version,
+                "local_entries": len(self.local), "local_hits": self.local_hits, "redis_hits": self.redis_hits,
+                "misses": self.misses, "invalidations": self.invalidations, "errors": self.errors}
+
+
+class PrincipalCache:
+    """
+    Authenticated users by token subject and issue time, so that a request with a known token needs no query.
+
+    In Redis every subject is one hash with a field per ``iat``: dropping the hash invalidates all
+    tokens of the user at once. Without Redis the local tier keeps entries for the whole ``ttl``,
+    which is only coherent with a single worker.
+    """
+
+    def __init__(self, redis=None, enabled: bool = False, ttl: float = 30, local_size: int = 4096,
+                 local_ttl: float = 1):
+        self.redis = redis
+        self.enabled = enabled
+        self.ttl = ttl
+        self.local = LocalCache(local_size)
+        self.local_ttl = local_ttl if redis is not None else ttl
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    @classmethod
+    def from_settings(cls) -> 'PrincipalCache':
+        redis = None
+        if settings.principal_cache_enabled and settings.principal_cache_redis and aioredis is not None:
+            redis = aioredis.Redis(host=settings.redis_host, port=settings.redis)
+        return cls(redis, settings.principal_cache_enabled, settings.principal_cache_ttl,
+                   settings.principal_cache_size, settings.cache_local_ttl)
+
+    @staticmethod
+    def redis_key(sub: str) -> str:
+        return f"principal:{sub}"
+
+    async def get(self, sub: str, iat) -> Any:
+        """
+        Cached principal of a token.
+
+        :param sub: Token subject.
+        :type sub: str
+        :param iat: Token issue time.
+        :return: JSON-compatible principal, or :data:`MISSING`.
+        """
+        if not self.enabled:
+            return MISSING
+        local_key = f"{sub}\x00{iat}"
+        value = self.local.get(local_key)
+        if value is not MISSING:
+            self.local_hits += 1
+            return value
+        if self.redis is not None:
+            try:
+                raw = await self.redis.hget(self.redis_key(sub), str(iat))
+            except RedisError as e:
+                self.errors += 1
+                logger.warning("Principal cache read failed: %s", e)
+                raw = None
+            if raw is not None:
+                self.redis_hits += 1
+                value = json.loads(raw)
+                self.local.set(local_key, value, self.local_ttl)
+                return value
+        self.misses += 1
+        return MISSING
+
+    async def set(self, sub: str, iat, value: Any):
+        if not self.enabled:
+            return
+        self.local.set(f"{sub}\x00{iat}", value, self.local_ttl)
+        if self.redis is not None:
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.hset(self.redis_key(sub), str(iat), json.dumps(value, separators=(',', ':')))
+                    pipe.expire(self.redis_key(sub), max(int(self.ttl), 1))
+                    await pipe.execute()
+            except RedisError as e:
+                self.errors += 1
+                logger.warning("Principal cache write failed: %s", e)
+
+    async def invalidate(self, sub: str):
+        """
+        Forget every cached token of a user.
+
+        :param sub: Token subject, the user's e-mail.
+        :type sub: str
+        """
+        if not self.enabled:
+            return
+        self.invalidations += 1
+        self.local.discard_prefix(f"{sub}\x00")
+        if self.redis is not None:
+            try:
+                await self.redis.delete(self.redis_key(sub))
+            except RedisError as e:
+                self.errors += 1
+                logger.warning("Principal cache invalidation failed: %s", e)
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "redis": self.redis is not None, "local_entries": len(self.local),
+                "local_hits": self.local_hits, "redis_hits": self.redis_hits, "misses": self.misses,
+                "invalidations": self.invalidations, "errors": self.errors}
+
+
+contact_cache = Cache.from_settings('contacts')
+principal_cache = PrincipalCache.from_settings()
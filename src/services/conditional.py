@@ -0,0 +1,114 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response, status
+
+
+def entity_tag(*parts) -> str:
+    """
+    Strong entity tag of a representation identified by ``parts``.
+
+    The parts must be cheap to obtain without loading the representation itself (ids, timestamps, counts),
+    so that a conditional request can be answered from an aggregate query.
+
+    :param parts: JSON-serializable values, datetimes included, that change whenever the representation does.
+    :return: Quoted entity tag.
+    :rtype: str
+    """
+    raw = json.dumps(parts, default=lambda value: value.isoformat(), separators=(',', ':')).encode()
+    return '"' + hashlib.sha1(raw).hexdigest() + '"'
+
+
+def http_date(value: datetime) -> str:
+    """
+    Format a timestamp for ``Last-Modified``. Naive timestamps are stored in UTC.
+
+    :param value: Timestamp.
+    :type value: datetime
+    :return: IMF-fixdate.
+    :rtype: str
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def is_conditional(request: Request) -> bool:
+    """
+    Whether the request carries validators, i.e. whether it is worth checking them before loading the resource.
+
+    :param request: Incoming request.
+    :type request: Request
+    :rtype: bool
+    """
+    return 'if-none-match' in request.headers or 'if-modified-since' in request.headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime | None) -> bool:
+    """
+    Evaluate ``If-None-Match`` and ``If-Modified-Since`` the way RFC 9110 orders them:
+    when ``If-None-Match`` is present, ``If-Modified-Since`` is ignored.
+
+    :param request: Incoming request.
+    :type request: Request
+    :param etag: Current entity tag of the resource.
+    :type etag: str
+    :param last_modified: Current modification time of the resource, if known.
+    :type last_modified: datetime | None
+    :return: True when the client's copy is current and 304 can be sent.
+    :rtype: bool
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        if if_none_match.strip() == '*':
+            return True
+        # If-None-Match uses the weak comparison
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return etag in tags
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # HTTP dates have a resolution of one second
+    return last_modified.replace(microsecond=0) <= since
+
+
+def set_validators(response: Response, etag: str, last_modified: datetime | None):
+    """
+    Attach ``ETag``, ``Last-Modified`` and a ``Cache-Control`` that makes clients revalidate every time.
+
+    :param response: Response to decorate.
+    :type response: Response
+    :param etag: Entity tag.
+    :type etag: str
+    :param last_modified: Modification time, if known.
+    :type last_modified: datetime | None
+    """
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified)
+
+
+def not_modified(etag: str, last_modified: datetime | None) -> Response:
+    """
+    Empty 304 response carrying the current validators.
+
+    :param etag: Entity tag.
+    :type etag: str
+    :param last_modified: Modification time, if known.
+    :type last_modified: datetime | None
+    :rtype: Response
+    """
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_validators(response, etag, last_modified)
+    return response
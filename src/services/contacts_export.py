@@ -0,0 +1,64 @@
+import csv
+import io
+import json
+from typing import AsyncIterable, AsyncIterator
+
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_FIELDS = ('id', 'name', 'surname', 'email', 'phone', 'birthday', 'description')
+
+
+async def _chunks(rows: AsyncIterable, render, batch_size: int) -> AsyncIterator[str]:
+    # one chunk per batch keeps the number of writes to the socket low without buffering the whole export
+    buffer = []
+    async for row in rows:
+        buffer.append(render(row))
+        if len(buffer) >= batch_size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def export_ndjson(rows: AsyncIterable, batch_size: int = 1000) -> AsyncIterator[str]:
+    """
+    Render contact rows as newline-delimited JSON, one object per line.
+
+    :param rows: Rows with the fields of EXPORT_FIELDS.
+    :type rows: AsyncIterable
+    :param batch_size: Number of rows per yielded chunk.
+    :type batch_size: int
+    :return: Chunks of the document.
+    :rtype: AsyncIterator[str]
+    """
+    def render(row):
+        record = dict(zip(EXPORT_FIELDS, row))
+        if record['birthday'] is not None:
+            record['birthday'] = record['birthday'].isoformat()
+        return json.dumps(record, ensure_ascii=False) + '\n'
+
+    return _chunks(rows, render, batch_size)
+
+
+async def export_csv(rows: AsyncIterable, batch_size: int = 1000) -> AsyncIterator[str]:
+    """
+    Render contact rows as CSV with a header line.
+
+    :param rows: Rows with the fields of EXPORT_FIELDS.
+    :type rows: AsyncIterable
+    :param batch_size: Number of rows per yielded chunk.
+    :type batch_size: int
+    :return: Chunks of the document.
+    :rtype: AsyncIterator[str]
+    """
+    line = io.StringIO()
+    writer = csv.writer(line)
+
+    def render(row):
+        line.seek(0)
+        line.truncate()
+        writer.writerow(row)
+        return line.getvalue()
+
+    yield render(EXPORT_FIELDS)
+    async for chunk in _chunks(rows, render, batch_size):
+        yield chunk
@@ -0,0 +1,158 @@
+import csv
+import json
+from typing import Iterable, Iterator
+
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactModel
+from src.services.workers import import_workers
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+
+def _read_rows(lines: Iterable[str], fmt: str) -> Iterator[tuple[int, dict | None, str | None]]:
+    """
+    Yield ``(line, row, error)`` for every record of the stream without reading it whole.
+
+    :param lines: Text stream or any iterable of lines.
+    :type lines: Iterable[str]
+    :param fmt: ``csv`` (with a header line) or ``ndjson``.
+    :type fmt: str
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            # values beyond the header end up under the None key
+            yield reader.line_num, {key: value for key, value in row.items() if key is not None}, None
+        return
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield number, None, "invalid JSON: expected an object"
+            continue
+        yield number, row, None
+
+
+def _validation_message(error: ValidationError) -> str:
+    return '; '.join(f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors())
+
+
+class ImportReport:
+    def __init__(self, max_errors: int):
+        self.max_errors = max_errors
+        self.processed = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line: int, message: str, duplicate: bool = False):
+        if duplicate:
+            self.duplicates += 1
+        else:
+            self.failed += 1
+        # the report must not grow with the file: only the first max_errors rows are described
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "error": message})
+
+    def dict(self) -> dict:
+        return {"processed": self.processed, "inserted": self.inserted, "duplicates": self.duplicates,
+                "failed": self.failed, "errors": self.errors}
+
+
+def _parse_batch(rows: Iterator[tuple[int, dict | None, str | None]], batch_size: int,
+                 report: ImportReport) -> tuple[list[tuple[int, ContactModel]], bool]:
+    """
+    Read and validate records until ``batch_size`` of them are valid or the stream ends.
+
+    :param rows: Records from ``_read_rows``; consumed only as far as the batch goes.
+    :type rows: Iterator[tuple[int, dict | None, str | None]]
+    :param batch_size: Number of valid rows to collect.
+    :type batch_size: int
+    :param report: Report that counts the records and collects the rejected ones.
+    :type report: ImportReport
+    :return: The valid rows with their line numbers, and whether the stream has more records.
+    :rtype: tuple[list[tuple[int, ContactModel]], bool]
+    """
+    batch = []
+    for line, row, error in rows:
+        report.processed += 1
+        if error:
+            report.error(line, error)
+            continue
+        try:
+            batch.append((line, ContactModel(**row)))
+        except ValidationError as e:
+            report.error(line, _validation_message(e))
+            continue
+        if len(batch) >= batch_size:
+            return batch, True
+    return batch, False
+
+
+async def _flush(batch: list[tuple[int, ContactModel]], report: ImportReport, db: AsyncSession):
+    emails, phones = await repository_contacts.get_taken_emails_and_phones(
+        [body.email for _, body in batch], [body.phone for _, body in batch], db)
+    accepted = []
+    for line, body in batch:
+        if body.email in emails:
+            report.error(line, "Email already exists", duplicate=True)
+        elif body.phone in phones:
+            report.error(line, "Phone already exists", duplicate=True)
+        else:
+            # later rows of the same file must not repeat it either
+            emails.add(body.email)
+            phones.add(body.phone)
+            accepted.append((line, body))
+    try:
+        report.inserted += await repository_contacts.create_contacts([body for _, body in accepted], db)
+    except IntegrityError:
+        # a concurrent writer took some of the keys: fall back to row by row to find which ones
+        await db.rollback()
+        for line, body in accepted:
+            try:
+                report.inserted += await repository_contacts.create_contacts([body], db)
+            except IntegrityError:
+                await db.rollback()
+                report.error(line, "Email or phone already exists", duplicate=True)
+
+
+async def import_contacts(lines: Iterable[str], fmt: str, db: AsyncSession, batch_size: int = 1000,
+                          max_errors: int = 100) -> dict:
+    """
+    Validate contacts from a CSV or NDJSON stream and insert them in batches.
+
+    Memory use is bounded by ``batch_size`` and ``max_errors``, not by the size of the stream.
+    Rows whose email or phone already exists, in the database or earlier in the stream, are skipped.
+
+    :param lines: Text stream or any iterable of lines.
+    :type lines: Iterable[str]
+    :param fmt: ``csv`` (with a header line) or ``ndjson``.
+    :type fmt: str
+    :param db: Database session.
+    :type db: AsyncSession
+    :param batch_size: Number of rows per INSERT and transaction.
+    :type batch_size: int
+    :param max_errors: Number of rejected rows described in the report.
+    :type max_errors: int
+    :return: Import report.
+    :rtype: dict
+    """
+    report = ImportReport(max_errors)
+    rows = _read_rows(lines, fmt)
+    more = True
+    while more:
+        # reading and validating is CPU-bound: done in the pool, so a large file does not stall the loop
+        batch, more = await import_workers.run(_parse_batch, rows, batch_size, report)
+        if batch:
+            await _flush(batch, report, db)
+    return report.dict()
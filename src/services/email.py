@@ -1,38 +1,242 @@
-from pathlib import Path
+import asyncio
 import logging
+import time
+from email.message import EmailMessage
+from email.utils import formataddr
+from pathlib import Path
+from typing import Callable
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+import aiosmtplib
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pydantic import EmailStr
 
+from src.conf.config import settings
 from src.services.auth import auth_service
+from src.services.metrics import MAIL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# loaded and compiled once; rendering a message is then a plain function call
+templates = Environment(loader=FileSystemLoader(Path(__file__).parent / 'templates'),
+                        autoescape=select_autoescape(), auto_reload=False)
+confirmation_template = templates.get_template('email_template.html')
+
+
+def smtp_client() -> aiosmtplib.SMTP:
+    """
+    SMTP client configured from the settings; not connected yet.
+
+    :rtype: aiosmtplib.SMTP
+    """
+    return aiosmtplib.SMTP(hostname=settings.mail_server, port=settings.mail_port,
+                           username=settings.mail_username or None, password=settings.mail_password or None,
+                           use_tls=settings.mail_ssl_tls, start_tls=settings.mail_starttls,
+                           validate_certs=settings.mail_validate_certs, timeout=settings.mail_timeout)
+
+
+def is_permanent(error: Exception) -> bool:
+    # 5xx replies and refused recipients will fail the same way on every attempt
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, aiosmtplib.SMTPResponseException) and error.code >= 500
+
+
+class MailDispatcher:
+    """
+    Outbound mail queue served by a few workers. Each worker keeps one SMTP connection open and sends
+    message after message over it, so a burst of mail costs one TLS handshake per worker, not per message.
+    A connection idle for ``idle_timeout`` seconds is closed; the next message opens a new one.
+
+    Transient failures are retried with exponential backoff; a dropped connection is reopened.
+    """
+
+    def __init__(self, connect: Callable[[], aiosmtplib.SMTP], workers: int, queue_size: int, retries: int,
+                 backoff: float, idle_timeout: float):
+        self.connect = connect
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retries = retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._backlog: list[EmailMessage] = []
+        self.queued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+        self.connections = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def send(self, message: EmailMessage) -> bool:
+        """
+        Queue a message without waiting for delivery.
 
-conf = ConnectionConfig(
-    MAIL_USERNAME="shazampoz@meta.ua",
-    MAIL_PASSWORD="RbN342PoZ",
-    MAIL_FROM=EmailStr("shazampoz@meta.ua"),
-    MAIL_PORT=465,
-    MAIL_SERVER="smtp.meta.ua",
-    MAIL_FROM_NAME="It`s me!",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
+        :param message: Message with its recipients set.
+        :type message: EmailMessage
+        :return: False when the queue is full and the message was dropped.
+        :rtype: bool
+        """
+        if self._queue is None:
+            # not started yet: kept until start(), within the same bound
+            if len(self._backlog) >= self.queue_size:
+                return self._drop(message)
+            self._backlog.append(message)
+        else:
+            try:
+                self._queue.put_nowait(message)
+            except asyncio.QueueFull:
+                return self._drop(message)
+        self.queued += 1
+        return True
+
+    def _drop(self, message: EmailMessage) -> bool:
+        self.dropped += 1
+        logger.error("Mail queue is full, dropped a message to %s", message['To'])
+        return False
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(self.queue_size)
+        for message in self._backlog:
+            self._queue.put_nowait(message)
+        self._backlog.clear()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10):
+        """
+        Stop the workers, giving queued messages up to ``timeout`` seconds to go out.
+        """
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Mail queue stopped with %s messages undelivered", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    async def _work(self):
+        smtp = None
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(self._queue.get(),
+                                                     self.idle_timeout if smtp is not None else None)
+                except asyncio.TimeoutError:
+                    smtp = await self.close(smtp)
+                    continue
+                try:
+                    smtp, _ = await self.deliver(smtp, message)
+                finally:
+                    self._queue.task_done()
+        finally:
+            await self.close(smtp)
+
+    async def deliver(self, smtp: aiosmtplib.SMTP | None,
+                      message: EmailMessage) -> tuple[aiosmtplib.SMTP | None, bool]:
+        """
+        Send a message now, over ``smtp`` or over a new connection when it is None or closed,
+        with the dispatcher's retries. For jobs that need the outcome of each message.
+
+        :param smtp: Connection to reuse.
+        :type smtp: aiosmtplib.SMTP | None
+        :param message: Message with its recipients set.
+        :type message: EmailMessage
+        :return: Connection to pass to the next call, and whether the message was delivered.
+        :rtype: tuple[aiosmtplib.SMTP | None, bool]
+        """
+        start = time.perf_counter()
+        smtp, delivered = await self._deliver(smtp, message)
+        MAIL_SECONDS.labels('sent' if delivered else 'failed').observe(time.perf_counter() - start)
+        return smtp, delivered
+
+    async def _deliver(self, smtp: aiosmtplib.SMTP | None,
+                       message: EmailMessage) -> tuple[aiosmtplib.SMTP | None, bool]:
+        for attempt in range(self.retries + 1):
+            try:
+                if smtp is None or not smtp.is_connected:
+                    smtp = self.connect()
+                    await smtp.connect()
+                    self.connections += 1
+                await smtp.send_message(message)
+                self.sent += 1
+                return smtp, True
+            except (aiosmtplib.SMTPException, OSError) as e:
+                if not isinstance(e, aiosmtplib.SMTPResponseException):
+                    # the connection is in an unknown state
+                    smtp = await self.close(smtp)
+                if is_permanent(e) or attempt == self.retries:
+                    self.failed += 1
+                    logger.error("Mail to %s failed: %s", message['To'], e)
+                    return smtp, False
+                self.retried += 1
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+            except Exception as e:  # noqa - a bad message or a client bug must not end the worker
+                smtp = await self.close(smtp)
+                self.failed += 1
+                logger.exception("Mail to %s failed: %s", message['To'], e)
+                return smtp, False
+        return smtp, False
+
+    @staticmethod
+    async def close(smtp: aiosmtplib.SMTP | None) -> None:
+        if smtp is not None and smtp.is_connected:
+            try:
+                await smtp.quit()
+            except (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError):
+                smtp.close()
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "running": self.running,
+                "pending": self._queue.qsize() if self._queue is not None else len(self._backlog),
+                "queued": self.queued, "sent": self.sent, "retried": self.retried, "failed": self.failed,
+                "dropped": self.dropped, "connections": self.connections}
+
+
+mail_dispatcher = MailDispatcher(smtp_client, settings.mail_workers, settings.mail_queue, settings.mail_retries,
+                                 settings.mail_retry_backoff, settings.mail_idle_timeout)
+
+
+def confirmation_message(email: str, username: str, host: str) -> EmailMessage:
+    """
+    E-mail confirmation message with a fresh token.
+
+    :param email: Recipient.
+    :type email: str
+    :param username: Recipient's name.
+    :type username: str
+    :param host: Base URL of the API, ending with a slash.
+    :type host: str
+    :rtype: EmailMessage
+    """
+    token_verification = auth_service.create_email_token({"sub": email})
+    message = EmailMessage()
+    message['Subject'] = "Confirm your email"
+    message['From'] = formataddr((settings.mail_from_name, settings.mail_from))
+    message['To'] = email
+    message.set_content(confirmation_template.render(host=host, username=username, token=token_verification),
+                        subtype='html')
+    return message
 
 
 async def send_email(email: EmailStr, username: str, host: str):
-    try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        logging.error(err)
\ No newline at end of file
+    """
+    Queue the confirmation e-mail; delivery happens in :data:`mail_dispatcher`.
+
+    :param email: Recipient.
+    :type email: EmailStr
+    :param username: Recipient's name.
+    :type username: str
+    :param host: Base URL of the API.
+    :type host: str
+    """
+    mail_dispatcher.send(confirmation_message(email, username, str(host)))
@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import logging
+
+import httpx
+
+from src.conf.config import settings
+from src.services.cache import LocalCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+
+def gravatar_hash(email: str) -> str:
+    """
+    Gravatar hash of an e-mail, computed locally.
+
+    :param email: E-mail address.
+    :type email: str
+    :return: Hex digest of the trimmed, lower-cased address.
+    :rtype: str
+    """
+    return hashlib.md5(email.strip().lower().encode()).hexdigest()
+
+
+def gravatar_url(email: str, default: str | None = None) -> str:
+    """
+    Gravatar image URL of an e-mail. No request is made: the URL is known from the hash alone.
+
+    :param email: E-mail address.
+    :type email: str
+    :param default: Picture Gravatar serves when it has no image for the address, e.g. ``identicon``.
+    :type default: str | None
+    :return: Image URL.
+    :rtype: str
+    """
+    url = f"{settings.gravatar_url}/{gravatar_hash(email)}"
+    return f"{url}?d={default}" if default else url
+
+
+class GravatarResolver:
+    """
+    Checks whether Gravatar has an image for a hash. At most ``concurrency`` lookups are in flight,
+    and answers are kept for ``ttl`` seconds, so a burst of signups does not turn into a burst of requests.
+    Lookups share one HTTP client, and with it its open connections, until :meth:`close`.
+    """
+
+    def __init__(self, base_url: str, concurrency: int, timeout: float, ttl: float, cache_size: int,
+                 transport: httpx.AsyncBaseTransport | None = None):
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.ttl = ttl
+        self.transport = transport
+        self.cache = LocalCache(cache_size)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._client: httpx.AsyncClient | None = None
+        self.lookups = 0
+        self.hits = 0
+        self.errors = 0
+
+    async def exists(self, email_hash: str) -> bool | None:
+        """
+        Whether Gravatar has an image for the hash.
+
+        :param email_hash: Hash from :func:`gravatar_hash`.
+        :type email_hash: str
+        :return: True or False, or None when Gravatar could not tell; such answers are not cached.
+        :rtype: bool | None
+        """
+        found = self.cache.get(email_hash)
+        if found is not MISSING:
+            self.hits += 1
+            return found
+        async with self._semaphore:
+            self.lookups += 1
+            try:
+                # d=404 makes Gravatar answer 404 instead of serving a default picture
+                response = await self.client.head(f"{self.base_url}/{email_hash}", params={"d": "404"})
+            except httpx.HTTPError as e:
+                self.errors += 1
+                logger.warning("Gravatar lookup failed: %s", e)
+                return None
+        if response.status_code not in (200, 404):
+            self.errors += 1
+            return None
+        found = response.status_code == 200
+        self.cache.set(email_hash, found, self.ttl)
+        return found
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # created on first use, inside the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout, transport=self.transport,
+                                             limits=httpx.Limits(max_connections=self.concurrency,
+                                                                 max_keepalive_connections=self.concurrency))
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {"concurrency": self.concurrency, "lookups": self.lookups, "hits": self.hits,
+                "errors": self.errors, "cached": len(self.cache)}
+
+
+gravatar_resolver = GravatarResolver(settings.gravatar_url, settings.gravatar_concurrency, settings.gravatar_timeout,
+                                     settings.gravatar_cache_ttl, settings.gravatar_cache_size)
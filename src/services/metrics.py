@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Callable
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+logger = logging.getLogger(__name__)
+
+# With PROMETHEUS_MULTIPROC_DIR set before the workers start, every metric below is kept in files of that
+# directory and /metrics adds up all workers. Live gauges are summed over the processes that are running.
+MULTIPROCESS = 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'HTTP request latency',
+                            ['method', 'route', 'status'], buckets=LATENCY_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge('http_requests_in_flight', 'HTTP requests being served', multiprocess_mode='livesum')
+WORKER_WAIT_SECONDS = Histogram('worker_pool_wait_seconds', 'Time calls queue for a worker thread', ['pool'],
+                                buckets=LATENCY_BUCKETS)
+WORKER_RUN_SECONDS = Histogram('worker_pool_run_seconds', 'Time calls run in a worker thread', ['pool'],
+                               buckets=LATENCY_BUCKETS)
+MAIL_SECONDS = Histogram('mail_delivery_seconds', 'Time to deliver one message, retries included', ['outcome'],
+                         buckets=LATENCY_BUCKETS)
+STORAGE_PUT_SECONDS = Histogram('storage_put_seconds', 'Time to store one object', ['backend'],
+                                buckets=LATENCY_BUCKETS)
+
+# counters kept by the components themselves, copied in by publish_stats()
+DB_POOL_CONNECTIONS = Gauge('db_pool_connections', 'Database connections by state', ['state'],
+                            multiprocess_mode='livesum')
+DB_POOL_EVENTS = Gauge('db_pool_events', 'Database pool events since start', ['event'],
+                       multiprocess_mode='livesum')
+CACHE_REQUESTS = Gauge('cache_requests', 'Cache lookups since start by result', ['cache', 'result'],
+                       multiprocess_mode='livesum')
+WORKER_POOL_CALLS = Gauge('worker_pool_calls', 'Worker pool calls since start by state', ['pool', 'state'],
+                          multiprocess_mode='livesum')
+MAIL_MESSAGES = Gauge('mail_messages', 'Outbound mail since start by state', ['state'],
+                      multiprocess_mode='livesum')
+ADMISSION_REQUESTS = Gauge('admission_requests', 'Admission decisions since start', ['decision'],
+                           multiprocess_mode='livesum')
+
+_publishers: list[Callable[[], None]] = []
+
+
+def register_publisher(publisher: Callable[[], None]) -> Callable[[], None]:
+    """
+    Register a function that copies a component's counters into the gauges above.
+    Usable as a decorator.
+    """
+    _publishers.append(publisher)
+    return publisher
+
+
+def publish_stats():
+    for publisher in _publishers:
+        try:
+            publisher()
+        except Exception as e:  # noqa - one broken source must not hide the others
+            logger.warning("Metrics publisher %s failed: %s", publisher.__name__, e)
+
+
+async def publish_periodically(interval: float):
+    """
+    Background task that publishes this process's counters every ``interval`` seconds, so that
+    a scrape served by another worker sees them too.
+    """
+    while True:
+        publish_stats()
+        await asyncio.sleep(interval)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    All metrics in the Prometheus text format, summed over the workers in multiprocess mode.
+
+    :return: Body and content type.
+    :rtype: tuple[bytes, str]
+    """
+    publish_stats()
+    registry = REGISTRY
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead():
+    # live gauges of this process must stop counting once it exits
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that times every HTTP request with ``perf_counter`` and records it by route template,
+    e.g. ``/api/contacts/{contact_id}``, so that the number of series stays bounded. Requests that match
+    no route are recorded as ``unmatched``. Also sets the ``Process-Time`` header.
+
+    Nothing else happens per request: in-flight and other gauges are published from the components'
+    own counters, see :func:`register_publisher`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: dict | None = None
+        self._children: dict[tuple[str, str, int], object] = {}
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            return 'unmatched'
+        if self._routes is None or endpoint not in self._routes:
+            # the router leaves the matched endpoint in the scope; its template is looked up once
+            self._routes = {**(self._routes or {}), endpoint: 'unmatched',
+                            **{route.endpoint: route.path for route in scope['app'].routes
+                               if hasattr(route, 'endpoint')}}
+        return self._routes[endpoint]
+
+    def _observe(self, method: str, route: str, status: int, seconds: float):
+        key = (method, route, status)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = REQUEST_SECONDS.labels(method, route, str(status))
+        child.observe(seconds)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                message['headers'] = [*message.get('headers', ()),
+                                      (b'process-time', b'%.6f' % (time.perf_counter() - start))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            self._observe(scope['method'], self._route(scope), status, time.perf_counter() - start)
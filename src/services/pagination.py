@@ -0,0 +1,92 @@
+import base64
+import json
+from typing import Any, Callable, Sequence
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Pack the sort key of the last row of a page into an opaque, url-safe cursor.
+
+    :param values: Sort key values of the last returned row.
+    :return: Opaque cursor string.
+    :rtype: str
+    """
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str | None, size: int = 1) -> list | None:
+    """
+    Unpack a cursor produced by :func:`encode_cursor`.
+
+    :param cursor: Cursor received from the client, or None for the first page.
+    :type cursor: str | None
+    :param size: Expected number of values in the sort key.
+    :type size: int
+    :return: Sort key values, or None for the first page.
+    :rtype: list | None
+    """
+    if cursor is None:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
+
+
+def decode_id_cursor(cursor: str | None) -> int | None:
+    """
+    Unpack a cursor of a list ordered by primary key.
+
+    :param cursor: Cursor received from the client, or None for the first page.
+    :type cursor: str | None
+    :return: Id of the last row of the previous page, or None for the first page.
+    :rtype: int | None
+    """
+    values = decode_cursor(cursor)
+    if values is None:
+        return None
+    if not isinstance(values[0], int) or isinstance(values[0], bool):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values[0]
+
+
+def decode_score_cursor(cursor: str | None) -> tuple[float, int] | None:
+    """
+    Unpack a cursor of a list ordered by relevance score and id.
+
+    :param cursor: Cursor received from the client, or None for the first page.
+    :type cursor: str | None
+    :return: Score and id of the last row of the previous page, or None for the first page.
+    :rtype: tuple[float, int] | None
+    """
+    values = decode_cursor(cursor, 2)
+    if values is None:
+        return None
+    score, last_id = values
+    if not isinstance(score, (int, float)) or not isinstance(last_id, int) \
+            or isinstance(score, bool) or isinstance(last_id, bool):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return float(score), last_id
+
+
+def make_page(rows: Sequence, limit: int, key: Callable[[Any], tuple] = lambda row: (row.id,)) -> dict:
+    """
+    Build a page from ``limit + 1`` fetched rows: the extra row only tells whether a next page exists.
+
+    :param rows: Rows fetched with ``LIMIT limit + 1``.
+    :type rows: Sequence
+    :param limit: Page size requested by the client.
+    :type limit: int
+    :param key: Returns the sort key of a row.
+    :return: Page with ``items`` and ``next_cursor``.
+    :rtype: dict
+    """
+    items = list(rows[:limit])
+    next_cursor = encode_cursor(*key(items[-1])) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
@@ -1,8 +1,10 @@
 from typing import List
 
 from fastapi import Request, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.models import User, Role
+from src.database.db import get_db
+from src.database.models import Role
 from src.services.auth import auth_service
 
 
@@ -10,6 +12,12 @@ class RolesAccess:
     def __init__(self, allowed_roles: List[Role]):
         self.allowed_roles = allowed_roles
 
-    async def __call__(self, request: Request, current_user: User = Depends(auth_service.get_current_user)):
-        if current_user.role not in self.allowed_roles:
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operation forbidden")
\ No newline at end of file
+    async def __call__(self, request: Request, token: str = Depends(auth_service.oauth2_scheme),
+                       claims: dict = Depends(auth_service.get_access_claims), db: AsyncSession = Depends(get_db)):
+        if 'role' in claims:
+            role = Role(claims['role'])
+        else:
+            # the token was issued without role claims: the role has to be looked up
+            role = (await auth_service.get_current_user(token, db)).role
+        if role not in self.allowed_roles:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operation forbidden")
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.repository import sessions as repository_sessions
+
+try:
+    from redis import asyncio as aioredis
+except ImportError:  # pragma: no cover - redis is optional while sessions are kept in the database
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+
+def new_token_id() -> str:
+    return uuid.uuid4().hex
+
+
+class SqlSessionStore:
+    """
+    Sessions in the ``user_sessions`` table. Refreshing a token is one UPDATE by primary key.
+    """
+
+    def __init__(self, ttl: timedelta):
+        self.ttl = ttl
+
+    async def create(self, user_id: int, device: str | None, db: AsyncSession) -> tuple[str, str]:
+        """
+        Open a session for a device.
+
+        :return: Session id and the id of its first refresh token.
+        :rtype: tuple[str, str]
+        """
+        session_id, jti = new_token_id(), new_token_id()
+        await repository_sessions.create_session(session_id, user_id, jti, device, datetime.utcnow() + self.ttl, db)
+        return session_id, jti
+
+    async def rotate(self, session_id: str, user_id: int, jti: str, db: AsyncSession) -> str | None:
+        """
+        Exchange the current refresh token of a session for a new one. A token that is not the
+        current one revokes the session: it has been used before, so it may have been stolen.
+
+        :return: Id of the new refresh token, or None when the presented one was not accepted.
+        :rtype: str | None
+        """
+        new_jti = new_token_id()
+        if await repository_sessions.rotate_session(session_id, user_id, jti, new_jti,
+                                                    datetime.utcnow() + self.ttl, db):
+            return new_jti
+        return None
+
+    async def list(self, user_id: int, db: AsyncSession) -> list[dict]:
+        return [{"id": s.id, "device": s.device, "created_at": s.created_at, "last_used_at": s.last_used_at,
+                 "expires_at": s.expires_at} for s in await repository_sessions.get_sessions(user_id, db)]
+
+    async def revoke(self, session_id: str, user_id: int, db: AsyncSession) -> bool:
+        return await repository_sessions.remove_session(session_id, user_id, db)
+
+    async def purge(self, db: AsyncSession) -> int:
+        return await repository_sessions.purge_expired_sessions(db, settings.session_purge_batch)
+
+
+class RedisSessionStore:
+    """
+    Sessions in Redis: a hash per session that expires by itself, and a set of session ids per user.
+    """
+
+    ROTATE = """
+    local session = redis.call('HMGET', KEYS[1], 'user_id', 'jti')
+    if session[1] == ARGV[1] and session[2] == ARGV[2] then
+        redis.call('HSET', KEYS[1], 'jti', ARGV[3], 'last_used_at', ARGV[4], 'expires_at', ARGV[5])
+        redis.call('EXPIRE', KEYS[1], ARGV[6])
+        return 1
+    end
+    redis.call('DEL', KEYS[1])
+    redis.call('SREM', KEYS[2], ARGV[7])
+    return 0
+    """
+
+    def __init__(self, redis, ttl: timedelta, prefix: str = 'session'):
+        self.redis = redis
+        self.ttl = ttl
+        self.prefix = prefix
+        self._rotate = redis.register_script(self.ROTATE)
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}:{session_id}"
+
+    def _user_key(self, user_id: int) -> str:
+        return f"{self.prefix}s:{user_id}"
+
+    async def create(self, user_id: int, device: str | None, db: AsyncSession | None = None) -> tuple[str, str]:
+        session_id, jti = new_token_id(), new_token_id()
+        now = datetime.utcnow()
+        seconds = int(self.ttl.total_seconds())
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._key(session_id), mapping={
+                "user_id": user_id, "jti": jti, "device": (device or '')[:255], "created_at": now.isoformat(),
+                "last_used_at": now.isoformat(), "expires_at": (now + self.ttl).isoformat()})
+            pipe.expire(self._key(session_id), seconds)
+            pipe.sadd(self._user_key(user_id), session_id)
+            pipe.expire(self._user_key(user_id), seconds)
+            await pipe.execute()
+        return session_id, jti
+
+    async def rotate(self, session_id: str, user_id: int, jti: str, db: AsyncSession | None = None) -> str | None:
+        new_jti = new_token_id()
+        now = datetime.utcnow()
+        rotated = await self._rotate(keys=[self._key(session_id), self._user_key(user_id)],
+                                     args=[user_id, jti, new_jti, now.isoformat(), (now + self.ttl).isoformat(),
+                                           int(self.ttl.total_seconds()), session_id])
+        if rotated:
+            await self.redis.expire(self._user_key(user_id), int(self.ttl.total_seconds()))
+            return new_jti
+        return None
+
+    async def list(self, user_id: int, db: AsyncSession | None = None) -> list[dict]:
+        session_ids = sorted(member.decode() for member in await self.redis.smembers(self._user_key(user_id)))
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for session_id in session_ids:
+                pipe.hgetall(self._key(session_id))
+            found = await pipe.execute()
+        sessions, gone = [], []
+        for session_id, data in zip(session_ids, found):
+            if not data:
+                gone.append(session_id)
+                continue
+            data = {key.decode(): value.decode() for key, value in data.items()}
+            sessions.append({"id": session_id, "device": data["device"] or None,
+                             **{key: datetime.fromisoformat(data[key])
+                                for key in ("created_at", "last_used_at", "expires_at")}})
+        if gone:
+            # expired hashes are gone already; drop their ids from the user's set
+            await self.redis.srem(self._user_key(user_id), *gone)
+        return sorted(sessions, key=lambda session: session["last_used_at"], reverse=True)
+
+    async def revoke(self, session_id: str, user_id: int, db: AsyncSession | None = None) -> bool:
+        if await self.redis.hget(self._key(session_id), "user_id") != str(user_id).encode():
+            return False
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self._key(session_id))
+            pipe.srem(self._user_key(user_id), session_id)
+            await pipe.execute()
+        return True
+
+    async def purge(self, db: AsyncSession | None = None) -> int:
+        # Redis expires sessions by itself
+        return 0
+
+
+def create_session_store():
+    ttl = timedelta(days=settings.refresh_token_days)
+    if settings.session_store == 'redis' and aioredis is not None:
+        return RedisSessionStore(aioredis.Redis(host=settings.redis_host, port=settings.redis), ttl)
+    return SqlSessionStore(ttl)
+
+
+session_store = create_session_store()
+
+
+async def purge_sessions_periodically(session_factory, interval: float):
+    """
+    Background task that purges expired sessions every ``interval`` seconds.
+
+    :param session_factory: Makes database sessions, e.g. ``SessionLocal``.
+    :param interval: Seconds between purges.
+    :type interval: float
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_factory() as db:
+                purged = await session_store.purge(db)
+            if purged:
+                logger.info("Purged %s expired sessions", purged)
+        except Exception as e:  # noqa - the next round retries
+            logger.warning("Session purge failed: %s", e)
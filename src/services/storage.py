@@ -0,0 +1,155 @@
+import functools
+import io
+import os
+import tempfile
+
+import cloudinary
+import cloudinary.api
+import cloudinary.exceptions
+import cloudinary.uploader
+
+from src.conf.config import settings
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # pragma: no cover - boto3 is only needed for the s3 backend
+    boto3 = None
+    ClientError = Exception
+
+
+class Storage:
+    """
+    Blob storage for content-addressed objects: a key always names the same bytes, so an object
+    that exists never has to be written again, and its URL can be cached forever.
+
+    The methods block; call them from worker threads or background tasks.
+    """
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def put(self, key: str, data: bytes, content_type: str):
+        raise NotImplementedError
+
+    def url(self, key: str) -> str:
+        raise NotImplementedError
+
+    def put_if_absent(self, key: str, data: bytes, content_type: str) -> bool:
+        """
+        Store an object unless an object with the same key, hence the same content, is already there.
+
+        :return: Whether any bytes were sent.
+        :rtype: bool
+        """
+        if self.exists(key):
+            return False
+        self.put(key, data, content_type)
+        return True
+
+
+class LocalStorage(Storage):
+    """
+    Objects as files under ``root``, served by the application at ``base_url``.
+    """
+
+    def __init__(self, root: str, base_url: str):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip('/')
+
+    def path(self, key: str) -> str | None:
+        """
+        File of a key, or None when the key points outside the storage root.
+        """
+        path = os.path.abspath(os.path.join(self.root, key))
+        return path if path.startswith(self.root + os.sep) else None
+
+    def exists(self, key: str) -> bool:
+        path = self.path(key)
+        return path is not None and os.path.isfile(path)
+
+    def put(self, key: str, data: bytes, content_type: str):
+        path = self.path(key)
+        if path is None:
+            raise ValueError(f"Invalid key: {key}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write aside and rename: readers never see a partial file
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(data)
+        os.replace(temporary, path)
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+
+class S3Storage(Storage):
+    """
+    Objects in an S3-compatible bucket (AWS, MinIO, Ceph, ...).
+    """
+
+    def __init__(self, client, bucket: str, public_url: str):
+        self.client = client
+        self.bucket = bucket
+        self.public_url = public_url.rstrip('/')
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def put(self, key: str, data: bytes, content_type: str):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=content_type,
+                               CacheControl='public, max-age=31536000, immutable')
+
+    def url(self, key: str) -> str:
+        return f"{self.public_url}/{key}"
+
+
+class CloudinaryStorage(Storage):
+    """
+    Objects in Cloudinary. Public ids are the keys without their extension.
+    """
+
+    def __init__(self, cloud_name: str, api_key, api_secret: str):
+        cloudinary.config(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret, secure=True)
+
+    @staticmethod
+    def public_id(key: str) -> str:
+        return os.path.splitext(key)[0]
+
+    def exists(self, key: str) -> bool:
+        try:
+            cloudinary.api.resource(self.public_id(key))
+        except cloudinary.exceptions.NotFound:
+            return False
+        return True
+
+    def put(self, key: str, data: bytes, content_type: str):
+        cloudinary.uploader.upload(io.BytesIO(data), public_id=self.public_id(key), overwrite=False)
+
+    def url(self, key: str) -> str:
+        public_id, extension = os.path.splitext(key)
+        return cloudinary.CloudinaryImage(public_id).build_url(format=extension.lstrip('.') or None)
+
+
+@functools.lru_cache
+def get_storage() -> Storage:
+    """
+    Storage selected by ``STORAGE_BACKEND``: ``cloudinary``, ``local`` or ``s3``. Usable as a dependency.
+
+    :rtype: Storage
+    """
+    if settings.storage_backend == 'local':
+        return LocalStorage(settings.storage_local_path, settings.media_url)
+    if settings.storage_backend == 's3':
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs boto3")
+        client = boto3.client('s3', endpoint_url=settings.s3_endpoint_url, region_name=settings.s3_region,
+                              aws_access_key_id=settings.s3_access_key, aws_secret_access_key=settings.s3_secret_key)
+        return S3Storage(client, settings.s3_bucket, settings.s3_public_url)
+    return CloudinaryStorage(settings.cloudinary_name, settings.cloudinary_api_key, settings.cloudinary_api_secret)
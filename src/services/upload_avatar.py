@@ -1,31 +1,107 @@
 import hashlib
+import io
+import logging
+import time
 
-import cloudinary
-import cloudinary.uploader
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image, ImageOps
 
-from src.conf.config import settings
+from src.services.metrics import STORAGE_PUT_SECONDS
+from src.services.storage import Storage
 
+logger = logging.getLogger(__name__)
 
-class UploadService:
-    cloudinary.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True
-    )
+READ_CHUNK = 64 * 1024
 
-    @staticmethod
-    def create_name_avatar(email: str, prefix: str):
-        name = hashlib.sha256(email.encode()).hexdigest()[:12]
-        return f"{prefix}/{name}"
 
-    @staticmethod
-    def upload(file, public_id):
-        r = cloudinary.uploader.upload(file, public_id=public_id, overwrite=True)
-        return r
+async def read_upload(file: UploadFile, max_bytes: int) -> bytes:
+    """
+    Read an uploaded file chunk by chunk, giving up as soon as it exceeds ``max_bytes``.
 
-    @staticmethod
-    def get_url_avatar(public_id, version):
-        src_url = cloudinary.CloudinaryImage(public_id) \
-            .build_url(width=250, height=250, crop='fill', version=version)
-        return src_url
\ No newline at end of file
+    :param file: Uploaded file.
+    :type file: UploadFile
+    :param max_bytes: Size limit.
+    :type max_bytes: int
+    :return: File content.
+    :rtype: bytes
+    :raises HTTPException: 413 when the file is too large.
+    """
+    data = bytearray()
+    while chunk := await file.read(READ_CHUNK):
+        data += chunk
+        if len(data) > max_bytes:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f"File is larger than {max_bytes} bytes")
+    return bytes(data)
+
+
+def make_thumbnails(data: bytes, sizes: list[int], max_pixels: int) -> dict[int, bytes]:
+    """
+    Decode an image and cut square JPEG thumbnails of the given sizes. CPU-bound: run it in a worker pool.
+
+    :param data: Encoded image.
+    :type data: bytes
+    :param sizes: Thumbnail side lengths in pixels.
+    :type sizes: list[int]
+    :param max_pixels: Largest accepted image, a guard against decompression bombs.
+    :type max_pixels: int
+    :return: Encoded thumbnail by size.
+    :rtype: dict[int, bytes]
+    :raises ValueError: When the data is not a supported image or is too large.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Unsupported image: {e}") from e
+    if image.width * image.height > max_pixels:
+        raise ValueError("Image is too large")
+    # JPEG can decode straight at a reduced scale, which is much cheaper than decoding in full
+    image.draft('RGB', (max(sizes), max(sizes)))
+    try:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    except OSError as e:
+        raise ValueError(f"Unsupported image: {e}") from e
+    thumbnails = {}
+    for size in sorted(sizes, reverse=True):
+        thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, format='JPEG', quality=85, optimize=True)
+        thumbnails[size] = buffer.getvalue()
+    return thumbnails
+
+
+def avatar_digest(image: bytes) -> str:
+    """
+    Content address of an avatar: the same picture always gets the same keys, and a new one new URLs.
+
+    :param image: Encoded main thumbnail.
+    :type image: bytes
+    :return: Hex digest.
+    :rtype: str
+    """
+    return hashlib.sha256(image).hexdigest()
+
+
+def avatar_key(digest: str, size: int) -> str:
+    return f"avatars/{digest}_{size}.jpg"
+
+
+def upload_thumbnails(storage: Storage, thumbnails: dict[int, bytes], digest: str):
+    """
+    Store the thumbnails that the storage does not hold yet. Blocking: meant for a background task.
+
+    :param storage: Target storage.
+    :type storage: Storage
+    :param thumbnails: Encoded thumbnail by size.
+    :type thumbnails: dict[int, bytes]
+    :param digest: Content address from :func:`avatar_digest`.
+    :type digest: str
+    """
+    for size, image in thumbnails.items():
+        key = avatar_key(digest, size)
+        start = time.perf_counter()
+        try:
+            storage.put_if_absent(key, image, 'image/jpeg')
+            STORAGE_PUT_SECONDS.labels(type(storage).__name__).observe(time.perf_counter() - start)
+        except Exception as e:  # noqa - the response is already sent, nobody else can report it
+            logger.error("Avatar upload of %s failed: %s", key, e)
@@ -0,0 +1,73 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from fastapi import HTTPException, status
+
+from src.conf.config import settings
+from src.services.metrics import WORKER_RUN_SECONDS, WORKER_WAIT_SECONDS
+
+
+class BoundedExecutor:
+    """
+    Thread pool for CPU-heavy calls made from async handlers, with a cap on queued work.
+
+    Calls beyond ``max_workers + max_queue`` are rejected at once with 503 instead of piling up
+    behind the busy workers: a client retrying later is better than every client timing out.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, name: str = 'worker', retry_after: int = 1):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix=name)
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run ``func`` in the pool without blocking the event loop.
+
+        :param func: Blocking callable.
+        :param args: Positional arguments of the callable.
+        :param kwargs: Keyword arguments of the callable.
+        :return: Result of the callable.
+        :raises HTTPException: 503 with ``Retry-After`` when the pool and its queue are full.
+        """
+        if self.pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is busy",
+                                headers={"Retry-After": str(self.retry_after)})
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(self._timed, time.perf_counter(),
+                                                                                func, *args, **kwargs))
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def _timed(self, submitted: float, func: Callable[..., Any], *args, **kwargs) -> Any:
+        started = time.perf_counter()
+        WORKER_WAIT_SECONDS.labels(self.name).observe(started - submitted)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            WORKER_RUN_SECONDS.labels(self.name).observe(time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        return {"max_workers": self.max_workers, "max_queue": self.max_queue, "pending": self.pending,
+                "completed": self.completed, "rejected": self.rejected}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# bcrypt releases the GIL while hashing, so threads run it in parallel without a process pool
+password_workers = BoundedExecutor(settings.password_workers, settings.password_queue, name='password')
+image_workers = BoundedExecutor(settings.image_workers, settings.image_queue, name='image')
+import_workers = BoundedExecutor(settings.import_workers, settings.import_queue, name='import')
@@ -1,30 +1,38 @@
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, pool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import DatabaseError
 
 from main import app
-from src.database.models import Base
-from src.database.db import get_db
+from src.database.models import Base, User
+from src.database.db import get_db, get_read_db
+from src.database.instrumentation import instrument_engine
 
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# The app talks to the database through aiosqlite. NullPool: TestClient runs the app in its own event loop,
+# so connections must not outlive a request.
+engine = instrument_engine(create_async_engine(SQLALCHEMY_DATABASE_URL, poolclass=pool.NullPool))
+TestingSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+# Tests prepare and inspect data through a plain synchronous session on the same file. AUTOCOMMIT keeps
+# it from holding a read transaction open, which would lock SQLite against the app's writes.
+sync_engine = create_engine("sqlite:///./test.db", connect_args={"check_same_thread": False},
+                            isolation_level="AUTOCOMMIT")
+SyncSessionLocal = sessionmaker(autoflush=False, bind=sync_engine)
 
 
 @pytest.fixture(scope="module")
 def session():
     # Create the database
 
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.drop_all(bind=sync_engine)
+    Base.metadata.create_all(bind=sync_engine)
 
-    db = TestingSessionLocal()
+    db = SyncSessionLocal()
     try:
         yield db
     except DatabaseError:  # noqa
@@ -37,17 +45,29 @@ def session():
 def client(session):
     # Dependency override
 
-    def override_get_db():
-        try:
-            yield session
-        finally:
-            session.close()
+    async def override_get_db():
+        async with TestingSessionLocal() as db:
+            yield db
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
 
     yield TestClient(app)
 
 
 @pytest.fixture(scope="module")
 def user():
-    return {"username": "deadpool", "email": "deadpool@example.com", "password": "12345678"}
\ No newline at end of file
+    return {"username": "deadpool", "email": "deadpool@example.com", "password": "12345678"}
+
+
+@pytest.fixture(scope="module")
+def token(client, session, user):
+    client.post("/api/auth/signup", json=user)
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.confirmed = True
+    session.commit()
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    return response.json()["access_token"]
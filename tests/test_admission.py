@@ -0,0 +1,109 @@
+import asyncio
+import unittest
+
+import httpx
+from fakeredis import aioredis as fakeredis
+from fastapi import FastAPI
+from jose import jwt
+from starlette.requests import Request
+
+from src.services.admission import AdmissionMiddleware, AdmissionStats, MemoryBuckets, RateRule, RedisBuckets, \
+    rate_limit_keys
+from src.services.auth import auth_service
+
+
+def make_app(**options) -> tuple[FastAPI, asyncio.Event]:
+    release = asyncio.Event()
+    app = FastAPI()
+
+    @app.post("/api/auth/login")
+    async def login():
+        return {}
+
+    @app.get("/api/contacts/")
+    async def contacts():
+        return {}
+
+    @app.get("/slow")
+    async def slow():
+        await release.wait()
+        return {}
+
+    app.add_middleware(AdmissionMiddleware, **options)
+    return app, release
+
+
+class AdmissionMiddlewareTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_rate_limit_per_route(self):
+        stats = AdmissionStats()
+        app, _ = make_app(rules=[RateRule.parse("POST /api/auth/login", "2/60")], stats=stats)
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            statuses = [(await client.post("/api/auth/login")).status_code for _ in range(3)]
+            self.assertEqual(statuses, [200, 200, 429])
+            response = await client.post("/api/auth/login")
+            self.assertGreaterEqual(int(response.headers["Retry-After"]), 1)
+            self.assertEqual((await client.get("/api/contacts/")).status_code, 200)
+        self.assertEqual((stats.admitted, stats.rate_limited), (3, 2))
+
+    async def test_sheds_above_max_in_flight(self):
+        stats = AdmissionStats()
+        app, release = make_app(max_in_flight=1, stats=stats)
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            slow = asyncio.create_task(client.get("/slow"))
+            while stats.in_flight == 0:
+                await asyncio.sleep(0.001)
+            response = await client.get("/api/contacts/")
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers["Retry-After"], "1")
+            release.set()
+            self.assertEqual((await slow).status_code, 200)
+        self.assertEqual(stats.shed_concurrency, 1)
+        self.assertEqual(stats.in_flight, 0)
+
+    async def test_sheds_while_loop_lags(self):
+        stats = AdmissionStats()
+        app, _ = make_app(max_loop_lag=0.5, lag_interval=60, stats=stats)
+        stats.loop_lag = 2.0
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            response = await client.get("/api/contacts/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "2")
+        self.assertEqual(stats.shed_loop_lag, 1)
+
+
+class BucketTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_memory_bucket_refills(self):
+        buckets = MemoryBuckets()
+        self.assertEqual(await buckets.take("key", rate=1000, burst=1), 0)
+        self.assertGreater(await buckets.take("key", rate=1000, burst=1), 0)
+        await asyncio.sleep(0.01)
+        self.assertEqual(await buckets.take("key", rate=1000, burst=1), 0)
+
+    async def test_memory_buckets_are_bounded(self):
+        buckets = MemoryBuckets(max_keys=2)
+        for key in ("a", "b", "c"):
+            await buckets.take(key, rate=1, burst=1)
+        self.assertEqual(list(buckets._buckets), ["b", "c"])
+
+    async def test_redis_bucket(self):
+        buckets = RedisBuckets(fakeredis.FakeRedis())
+        self.assertEqual(await buckets.take("key", rate=1, burst=2), 0)
+        self.assertEqual(await buckets.take("key", rate=1, burst=2), 0)
+        self.assertGreater(await buckets.take("key", rate=1, burst=2), 0)
+        self.assertEqual(await buckets.take("other", rate=1, burst=2), 0)
+
+
+class RateLimitKeysTests(unittest.IsolatedAsyncioTestCase):
+
+    @staticmethod
+    def request(token: str) -> Request:
+        return Request({"type": "http", "client": ("10.0.0.1", 1234),
+                        "headers": [(b"authorization", f"Bearer {token}".encode())]})
+
+    async def test_only_verified_users_are_keys(self):
+        token = await auth_service.create_access_token(data={"sub": "user@example.com"})
+        forged = jwt.encode({"sub": "victim@example.com", "scope": "access_token"}, "wrong key")
+        self.assertEqual(rate_limit_keys(self.request(token)), ["ip:10.0.0.1", "user:user@example.com"])
+        self.assertEqual(rate_limit_keys(self.request(forged)), ["ip:10.0.0.1"])
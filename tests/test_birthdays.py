@@ -0,0 +1,135 @@
+import asyncio
+from datetime import date, datetime, time
+
+import pytest
+
+from src.cli import main
+from src.database.models import BirthdayDigest, Contact, User
+from src.services.birthdays import seconds_until, send_birthday_digests
+from tests.conftest import TestingSessionLocal
+
+TODAY = date(2030, 3, 1)
+
+
+class FakeDispatcher:
+    """
+    Records messages instead of sending them; ``fail`` addresses are refused.
+    """
+
+    def __init__(self, fail: tuple = (), crash_after: int | None = None):
+        self.fail = fail
+        self.crash_after = crash_after
+        self.messages = []
+        self.connections = 0
+
+    async def deliver(self, smtp, message):
+        if self.crash_after is not None and len(self.messages) == self.crash_after:
+            raise RuntimeError("crash")
+        if smtp is None:
+            self.connections += 1
+            smtp = object()
+        self.messages.append(message)
+        return smtp, message["To"] not in self.fail
+
+    async def close(self, smtp):
+        pass
+
+
+@pytest.fixture(scope="module")
+def people(session):
+    session.add_all([User(username=f"reader{i}", email=f"reader{i}@example.com", password="hash", confirmed=True)
+                     for i in range(5)])
+    session.add(User(username="stranger", email="stranger@example.com", password="hash", confirmed=False))
+    session.add_all([
+        Contact(name="Lesya", surname="Ukrainka", email="ukrainka@example.com", phone="0500000001",
+                birthday=date(1871, 3, 3), description="Soon"),
+        Contact(name="Taras", surname="Shevchenko", email="shevchenko@example.com", phone="0500000002",
+                birthday=date(1814, 3, 9), description="Later"),
+    ])
+    session.commit()
+
+
+def digests(session, status: str | None = None) -> list[BirthdayDigest]:
+    query = session.query(BirthdayDigest)
+    if status:
+        query = query.filter(BirthdayDigest.status == status)
+    return query.all()
+
+
+def run(dispatcher, today: date = TODAY, **options) -> dict:
+    return asyncio.run(send_birthday_digests(TestingSessionLocal, today, dispatcher=dispatcher, **options))
+
+
+def test_sends_one_digest_per_user(session, people):
+    dispatcher = FakeDispatcher()
+    report = run(dispatcher, days=7, batch_size=2)
+    assert report == {"date": "2030-03-01", "contacts": 1, "sent": 5, "failed": 0, "skipped": 0}
+    assert sorted(message["To"] for message in dispatcher.messages) == [f"reader{i}@example.com" for i in range(5)]
+    assert "Ukrainka" in dispatcher.messages[0].get_content()
+    assert "Shevchenko" not in dispatcher.messages[0].get_content()
+    # one connection for the whole run
+    assert dispatcher.connections == 1
+    assert len(digests(session, "sent")) == 5
+
+
+def test_second_run_sends_nothing(session, people):
+    dispatcher = FakeDispatcher()
+    report = run(dispatcher, days=7)
+    assert (report["sent"], report["failed"]) == (0, 0)
+    assert dispatcher.messages == []
+
+
+def test_resumes_after_a_crash_without_resending(session, people):
+    day = date(2030, 3, 2)
+    with pytest.raises(RuntimeError):
+        run(FakeDispatcher(crash_after=3), day, days=14, batch_size=2)
+    # the first batch went out, the second was claimed when the run died
+    assert len(digests(session, "sent")) == 5 + 2
+
+    dispatcher = FakeDispatcher()
+    report = run(dispatcher, day, days=14, batch_size=2)
+    assert report["sent"] == 1
+    assert [message["To"] for message in dispatcher.messages] == ["reader4@example.com"]
+    assert "Shevchenko" in dispatcher.messages[0].get_content()
+
+
+def test_failed_digests_are_recorded(session, people):
+    day = date(2030, 3, 3)
+    report = run(FakeDispatcher(fail=("reader1@example.com",)), day, days=7)
+    assert (report["sent"], report["failed"]) == (4, 1)
+    assert [digest.user_id for digest in digests(session, "failed")] == \
+        [session.query(User).filter(User.email == "reader1@example.com").one().id]
+
+
+def test_no_birthdays_no_mail(session, people):
+    dispatcher = FakeDispatcher()
+    report = run(dispatcher, date(2030, 7, 1), days=7)
+    assert (report["contacts"], report["sent"]) == (0, 0)
+    assert dispatcher.messages == []
+
+
+def test_old_records_are_purged(session, people):
+    run(FakeDispatcher(), date(2030, 7, 1))
+    assert {digest.digest_date for digest in digests(session)} <= {date(2030, 7, 1)}
+
+
+@pytest.mark.parametrize("now, seconds", [
+    (datetime(2030, 3, 1, 7, 0), 3600),
+    (datetime(2030, 3, 1, 8, 0), 24 * 3600),
+    (datetime(2030, 3, 1, 9, 0), 23 * 3600),
+])
+def test_seconds_until(now, seconds):
+    assert seconds_until(time(8, 0), now) == seconds
+
+
+def test_cli_birthday_digest(monkeypatch, capsys):
+    calls = []
+
+    async def fake_send(session_factory, today, days, batch_size):
+        calls.append((today, days, batch_size))
+        return {"date": today.isoformat(), "contacts": 0, "sent": 0, "failed": 0, "skipped": 0}
+
+    monkeypatch.setattr("src.cli.send_birthday_digests", fake_send)
+    assert main(["birthday-digest", "--date", "2030-03-01", "--days", "3"]) == 0
+    assert calls == [(date(2030, 3, 1), 3, None)]
+    assert '"sent": 0' in capsys.readouterr().out
@@ -0,0 +1,180 @@
+import unittest
+from datetime import date
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fakeredis import aioredis as fakeredis
+from redis.exceptions import ConnectionError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database import db as database
+from src.database.db import ReplicaRouter, get_read_db
+from src.database.models import Base, Role, User
+from src.repository import contacts as repository_contacts
+from src.repository import users as repository_users
+from src.schemas import ContactModel, ContactUpdate
+from src.services.auth import auth_service
+from src.services.cache import Cache, LocalCache, MISSING, PrincipalCache, contact_cache, principal_cache
+
+
+class LocalCacheTests(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LocalCache(max_size=2)
+        cache.set("a", 1, 60)
+        cache.set("b", 2, 60)
+        cache.get("a")
+        cache.set("c", 3, 60)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIs(cache.get("b"), MISSING)
+        self.assertEqual(len(cache), 2)
+
+    def test_expires_entries(self):
+        cache = LocalCache()
+        cache.set("a", 1, -1)
+        self.assertIs(cache.get("a"), MISSING)
+
+
+class CacheTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_redis_tier_is_shared_and_versioned(self):
+        redis = fakeredis.FakeRedis()
+        first = Cache('test', redis, enabled=True, version_ttl=0)
+        second = Cache('test', redis, enabled=True, version_ttl=0)
+        await first.set("key", {"value": 1})
+        self.assertEqual(await second.get("key"), {"value": 1})
+        self.assertEqual(await second.get("key"), {"value": 1})
+        self.assertEqual((second.redis_hits, second.local_hits), (1, 1))
+
+        await first.invalidate()
+        second.local.clear()
+        self.assertIs(await second.get("key"), MISSING)
+        self.assertEqual(second.misses, 1)
+
+    async def test_redis_errors_are_misses(self):
+        redis = AsyncMock()
+        redis.get.side_effect = ConnectionError("down")
+        redis.set.side_effect = ConnectionError("down")
+        cache = Cache('test', redis, enabled=True, local_ttl=0)
+        await cache.set("key", 1)
+        self.assertIs(await cache.get("key"), MISSING)
+        self.assertGreaterEqual(cache.errors, 3)
+
+    async def test_disabled_cache_stores_nothing(self):
+        cache = Cache('test')
+        await cache.set("key", 1)
+        self.assertIs(await cache.get("key"), MISSING)
+
+
+class CachedRepositoryTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.enabled = patch.multiple(contact_cache, enabled=True, redis=fakeredis.FakeRedis(), local_hits=0,
+                                      redis_hits=0, misses=0, invalidations=0)
+        self.enabled.start()
+
+    async def asyncTearDown(self):
+        self.enabled.stop()
+        contact_cache.local.clear()
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def test_reads_are_cached_until_a_write(self):
+        body = ContactModel(name="Lesya", surname="Ukrainka", email="ukrainka@example.com", phone="0501112233",
+                            birthday=date(1871, 2, 25), description="Poet")
+        contact = await repository_contacts.create_contact(body, self.session)
+
+        first = await repository_contacts.get_contact_by_id(contact.id, self.session)
+        cached = await repository_contacts.get_contact_by_id(contact.id, self.session)
+        self.assertEqual(contact_cache.misses, 1)
+        self.assertEqual(contact_cache.local_hits, 1)
+        self.assertIsNot(cached, first)
+        self.assertEqual((cached.email, cached.birthday, cached.updated_at),
+                         (first.email, first.birthday, first.updated_at))
+
+        invalidations = contact_cache.invalidations
+        await repository_contacts.update_contact(ContactUpdate(description="Writer"), contact.id, self.session)
+        self.assertEqual(contact_cache.invalidations, invalidations + 1)
+        updated = await repository_contacts.get_contact_by_id(contact.id, self.session)
+        self.assertEqual(updated.description, "Writer")
+        self.assertEqual(contact_cache.misses, 2)
+
+    async def test_lists_and_missing_rows_are_cached(self):
+        self.assertEqual(await repository_contacts.get_contacts(self.session), [])
+        self.assertIsNone(await repository_contacts.get_contact_by_email("nobody@example.com", self.session))
+        self.assertEqual(await repository_contacts.get_contacts(self.session), [])
+        self.assertIsNone(await repository_contacts.get_contact_by_email("nobody@example.com", self.session))
+        self.assertEqual((contact_cache.misses, contact_cache.local_hits), (2, 2))
+
+    async def test_lagging_replica_does_not_fill_the_cache(self):
+        replica = create_async_engine("sqlite+aiosqlite://")
+        async with replica.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        body = ContactModel(name="Lesya", surname="Ukrainka", email="ukrainka@example.com", phone="0501112233",
+                            birthday=date(1871, 2, 25), description="Poet")
+        async with async_sessionmaker(replica, expire_on_commit=False)() as replica_session:
+            await repository_contacts.create_contact(body, replica_session)
+        contact = await repository_contacts.create_contact(body, self.session)
+        # the write reaches the primary only; the replica still has the old row
+        await repository_contacts.update_contact(ContactUpdate(description="Writer"), contact.id, self.session)
+
+        router = ReplicaRouter(self.engine, [replica])
+        request = MagicMock()
+        request.client.host = "1.1.1.1"
+        token = await auth_service.create_access_token({"sub": "writer@example.com"})
+        request.headers = {"authorization": f"Bearer {token}"}
+
+        async def read():
+            async for db in get_read_db(request):
+                return (await repository_contacts.get_contact_by_id(contact.id, db)).description
+
+        with patch.object(database, 'replica_router', router):
+            self.assertEqual(await read(), "Poet")
+            await router.mark_write(database.client_keys(request))
+            self.assertEqual(await read(), "Writer")
+            self.assertEqual(await read(), "Writer")
+        self.assertEqual(contact_cache.local_hits, 1)
+        await replica.dispose()
+
+
+class PrincipalCacheTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_invalidation_drops_every_token_of_the_user(self):
+        redis = fakeredis.FakeRedis()
+        first = PrincipalCache(redis, enabled=True)
+        second = PrincipalCache(redis, enabled=True)
+        await first.set("user@example.com", 1, {"id": 1})
+        await first.set("user@example.com", 2, {"id": 1})
+        self.assertEqual(await second.get("user@example.com", 2), {"id": 1})
+        self.assertEqual(second.redis_hits, 1)
+
+        await first.invalidate("user@example.com")
+        self.assertIs(await first.get("user@example.com", 1), MISSING)
+        second.local.clear()
+        self.assertIs(await second.get("user@example.com", 2), MISSING)
+
+    async def test_current_user_is_loaded_once_per_token(self):
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        db = async_sessionmaker(engine, expire_on_commit=False)()
+        db.add(User(username="deadpool", email="deadpool@example.com", password="hash", avatar="url"))
+        await db.commit()
+        token = await auth_service.create_access_token(data={"sub": "deadpool@example.com"})
+
+        with patch.multiple(principal_cache, enabled=True, misses=0, local_hits=0), \
+                patch.object(repository_users, 'get_user_by_email', wraps=repository_users.get_user_by_email) as load:
+            first = await auth_service.get_current_user(token, db)
+            cached = await auth_service.get_current_user(token, db)
+            self.assertEqual(load.await_count, 1)
+            self.assertEqual((cached.id, cached.email, cached.role), (first.id, first.email, Role.user))
+
+            await repository_users.update_role("deadpool@example.com", Role.admin, db)
+            self.assertEqual((await auth_service.get_current_user(token, db)).role, Role.admin)
+            self.assertEqual(load.await_count, 3)
+        principal_cache.local.clear()
+        await db.close()
+        await engine.dispose()
@@ -0,0 +1,170 @@
+import asyncio
+import socket
+import unittest
+from email.message import EmailMessage
+from unittest.mock import MagicMock
+
+import aiosmtplib
+from aiosmtpd.controller import Controller
+
+from src.database.models import User
+from src.services.auth import auth_service
+from src.services.email import MailDispatcher, confirmation_message
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Handler:
+    def __init__(self):
+        self.messages = []
+        self.peers = set()
+        self.replies = []
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.replies:
+            return self.replies.pop(0)
+        self.messages.append(envelope)
+        self.peers.add(session.peer)
+        return "250 OK"
+
+
+def message(to: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = "api@example.com"
+    msg["To"] = to
+    msg["Subject"] = "Hello"
+    msg.set_content("Hello")
+    return msg
+
+
+class MailDispatcherTests(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.handler = Handler()
+        self.controller = Controller(self.handler, hostname="127.0.0.1", port=free_port())
+        self.controller.start()
+
+    def tearDown(self):
+        self.controller.stop()
+
+    def dispatcher(self, port: int | None = None, **options) -> MailDispatcher:
+        port = port or self.controller.port
+        options = {"workers": 2, "queue_size": 1000, "retries": 2, "backoff": 0, "idle_timeout": 60, **options}
+        return MailDispatcher(lambda: aiosmtplib.SMTP(hostname="127.0.0.1", port=port, start_tls=False), **options)
+
+    async def test_connections_are_reused(self):
+        mail = self.dispatcher()
+        for i in range(50):
+            self.assertTrue(mail.send(message(f"user{i}@example.com")))
+        await mail.start()
+        await mail.stop()
+        self.assertEqual(len(self.handler.messages), 50)
+        self.assertLessEqual(len(self.handler.peers), 2)
+        stats = mail.stats()
+        self.assertEqual((stats["sent"], stats["connections"], stats["pending"]), (50, len(self.handler.peers), 0))
+
+    async def test_transient_failures_are_retried(self):
+        self.handler.replies = ["451 Try again later", "421 Busy"]
+        mail = self.dispatcher(workers=1)
+        await mail.start()
+        mail.send(message("user@example.com"))
+        await mail.stop()
+        self.assertEqual(len(self.handler.messages), 1)
+        self.assertEqual((mail.sent, mail.retried, mail.failed), (1, 2, 0))
+
+    async def test_worker_survives_unexpected_errors(self):
+        mail = self.dispatcher(workers=1)
+        connect = mail.connect
+
+        def connect_with_a_bug():
+            smtp = connect()
+            send_message = smtp.send_message
+
+            async def send(msg):
+                if msg["To"] == "broken@example.com":
+                    raise ValueError("not an SMTP error")
+                return await send_message(msg)
+
+            smtp.send_message = send
+            return smtp
+
+        mail.connect = connect_with_a_bug
+        await mail.start()
+        mail.send(message("broken@example.com"))
+        mail.send(message("user@example.com"))
+        await mail.stop()
+        self.assertEqual([envelope.rcpt_tos for envelope in self.handler.messages], [["user@example.com"]])
+        self.assertEqual((mail.sent, mail.failed), (1, 1))
+
+    async def test_permanent_failures_are_not_retried(self):
+        self.handler.replies = ["550 No such user"]
+        mail = self.dispatcher(workers=1)
+        await mail.start()
+        mail.send(message("nobody@example.com"))
+        mail.send(message("user@example.com"))
+        await mail.stop()
+        self.assertEqual((mail.sent, mail.retried, mail.failed), (1, 0, 1))
+        # the connection survived the refusal
+        self.assertEqual(mail.connections, 1)
+
+    async def test_unreachable_server(self):
+        mail = self.dispatcher(port=free_port(), workers=1)
+        await mail.start()
+        mail.send(message("user@example.com"))
+        await mail.stop()
+        self.assertEqual((mail.sent, mail.retried, mail.failed), (0, 2, 1))
+
+    async def test_idle_connection_is_closed(self):
+        mail = self.dispatcher(workers=1, idle_timeout=0.05)
+        await mail.start()
+        mail.send(message("first@example.com"))
+        await asyncio.sleep(0.2)
+        mail.send(message("second@example.com"))
+        await mail.stop()
+        self.assertEqual((mail.sent, mail.connections), (2, 2))
+
+    async def test_full_queue_drops(self):
+        mail = self.dispatcher(queue_size=1)
+        self.assertTrue(mail.send(message("first@example.com")))
+        self.assertFalse(mail.send(message("second@example.com")))
+        self.assertEqual(mail.stats()["dropped"], 1)
+
+
+def test_confirmation_message():
+    msg = confirmation_message("reader@example.com", "Reader", "http://testserver/")
+    html = msg.get_content()
+    assert msg["To"] == "reader@example.com"
+    assert "Reader" in html
+    token = html.split("api/auth/confirmed_email/")[1].split('"')[0]
+    assert asyncio.run(auth_service.get_email_from_token(token)) == "reader@example.com"
+
+
+def test_confirmed_email(client, session, monkeypatch):
+    send_email = MagicMock()
+    monkeypatch.setattr("src.routes.auth.send_email", send_email)
+    user = {"username": "reader", "email": "reader@example.com", "password": "12345678"}
+    assert client.post("/api/auth/signup", json=user).status_code == 201
+    send_email.assert_called_once_with("reader@example.com", "reader", "http://testserver/")
+
+    token = auth_service.create_email_token({"sub": user["email"]})
+    response = client.get(f"/api/auth/confirmed_email/{token}")
+    assert response.json() == {"message": "Email confirmed"}
+    assert session.query(User).filter(User.email == user["email"]).first().confirmed
+    response = client.get(f"/api/auth/confirmed_email/{token}")
+    assert response.json() == {"message": "Your email is already confirmed"}
+
+
+def test_confirmed_email_invalid_token(client):
+    access_token = asyncio.run(auth_service.create_access_token({"sub": "reader@example.com"}))
+    for token in ("not-a-token", access_token):
+        response = client.get(f"/api/auth/confirmed_email/{token}")
+        assert response.status_code == 422, response.text
+
+
+def test_request_email_unknown_user(client):
+    response = client.post("/api/auth/request_email", json={"email": "stranger@example.com"})
+    assert response.status_code == 200, response.text
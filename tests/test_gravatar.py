@@ -0,0 +1,111 @@
+import asyncio
+import unittest
+
+import httpx
+
+from src.conf.config import settings
+from src.database.models import User
+from src.services.gravatar import GravatarResolver, gravatar_hash, gravatar_url
+from tests.conftest import TestingSessionLocal
+
+
+def resolver(handler, concurrency: int = 4) -> GravatarResolver:
+    return GravatarResolver("https://gravatar.test/avatar", concurrency, timeout=1, ttl=60, cache_size=16,
+                            transport=httpx.MockTransport(handler))
+
+
+def test_gravatar_url_is_computed_locally():
+    assert gravatar_hash(" Foo@Example.com ") == "b48def645758b95537d4424c84d1a9ff"
+    assert gravatar_url("foo@example.com") == f"{settings.gravatar_url}/b48def645758b95537d4424c84d1a9ff"
+    assert gravatar_url("foo@example.com", "identicon").endswith("b48def645758b95537d4424c84d1a9ff?d=identicon")
+
+
+class GravatarResolverTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_answers_are_cached(self):
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            return httpx.Response(200 if request.url.path.endswith("/found") else 404)
+
+        gravatar = resolver(handler)
+        self.assertTrue(await gravatar.exists("found"))
+        self.assertFalse(await gravatar.exists("missing"))
+        self.assertTrue(await gravatar.exists("found"))
+        self.assertFalse(await gravatar.exists("missing"))
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(requests[0].method, "HEAD")
+        self.assertEqual(requests[0].url.params["d"], "404")
+        self.assertEqual(gravatar.stats()["hits"], 2)
+
+    async def test_lookups_share_one_client(self):
+        gravatar = resolver(lambda request: httpx.Response(200))
+        await gravatar.exists("first")
+        client = gravatar.client
+        await gravatar.exists("second")
+        self.assertIs(gravatar.client, client)
+        await gravatar.close()
+        self.assertTrue(client.is_closed)
+        self.assertTrue(await gravatar.exists("third"))
+
+    async def test_failures_are_not_cached(self):
+        calls = 0
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise httpx.ConnectError("unreachable", request=request)
+            return httpx.Response(503) if calls == 2 else httpx.Response(200)
+
+        gravatar = resolver(handler)
+        self.assertIsNone(await gravatar.exists("hash"))
+        self.assertIsNone(await gravatar.exists("hash"))
+        self.assertTrue(await gravatar.exists("hash"))
+        self.assertEqual(gravatar.stats()["errors"], 2)
+
+    async def test_lookups_are_bounded(self):
+        in_flight = peak = 0
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return httpx.Response(200)
+
+        gravatar = resolver(handler, concurrency=2)
+        await asyncio.gather(*(gravatar.exists(f"hash{i}") for i in range(8)))
+        self.assertEqual(peak, 2)
+
+
+def signup(client, monkeypatch, email: str, status_code: int):
+    monkeypatch.setattr(settings, "gravatar_verify", True)
+    monkeypatch.setattr("src.routes.auth.SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr("src.routes.auth.gravatar_resolver", resolver(lambda request: httpx.Response(status_code)))
+    response = client.post("/api/auth/signup", json={"username": "gravatar", "email": email, "password": "12345678"})
+    assert response.status_code == 201, response.text
+    # the response carries the URL computed at signup, the check runs after it
+    assert response.json()["avatar"] == gravatar_url(email)
+
+
+def test_signup_keeps_existing_gravatar(client, session, monkeypatch):
+    signup(client, monkeypatch, "gravatar.found@example.com", 200)
+    user = session.query(User).filter(User.email == "gravatar.found@example.com").first()
+    assert user.avatar == gravatar_url("gravatar.found@example.com")
+
+
+def test_signup_replaces_missing_gravatar(client, session, monkeypatch):
+    signup(client, monkeypatch, "gravatar.missing@example.com", 404)
+    user = session.query(User).filter(User.email == "gravatar.missing@example.com").first()
+    assert user.avatar == gravatar_url("gravatar.missing@example.com", "identicon")
+
+    user.confirmed = True
+    session.commit()
+    response = client.post("/api/auth/login",
+                           data={"username": "gravatar.missing@example.com", "password": "12345678"})
+    response = client.get("/api/users/me/", headers={"Authorization": f"Bearer {response.json()['access_token']}"})
+    assert response.status_code == 200, response.text
+    assert response.json()["avatar"] == gravatar_url("gravatar.missing@example.com", "identicon")
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import subprocess
+import sys
+import textwrap
+
+from prometheus_client import REGISTRY
+
+from src.conf.config import settings
+from src.services.storage import LocalStorage
+from src.services.upload_avatar import upload_thumbnails
+from src.services.workers import BoundedExecutor
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_metrics_by_route_template(client, token):
+    before = sample("http_request_duration_seconds_count", method="GET", route="/api/contacts/{contact_id}",
+                    status="404")
+    response = client.get("/api/contacts/987654", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404
+    assert float(response.headers["Process-Time"]) > 0
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert sample("http_request_duration_seconds_count", method="GET", route="/api/contacts/{contact_id}",
+                  status="404") == before + 1
+    assert 'route="/api/contacts/987654"' not in response.text
+    for name in ("http_requests_in_flight", "db_pool_connections", "cache_requests", "worker_pool_calls",
+                 "mail_messages", "admission_requests"):
+        assert f"# TYPE {name} gauge" in response.text
+
+
+def test_unmatched_routes_share_one_series(client):
+    before = sample("http_request_duration_seconds_count", method="GET", route="unmatched", status="404")
+    for i in range(3):
+        assert client.get(f"/no/such/page/{i}").status_code == 404
+    assert sample("http_request_duration_seconds_count", method="GET", route="unmatched", status="404") == before + 3
+
+
+def test_metrics_disabled(client, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_enabled", False)
+    assert client.get("/metrics").status_code == 404
+
+
+def test_metrics_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", "scrape-secret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
+
+
+def test_worker_pool_durations():
+    executor = BoundedExecutor(max_workers=1, max_queue=1, name="metrics-test")
+    try:
+        asyncio.run(executor.run(sum, [1, 2]))
+    finally:
+        executor.shutdown()
+    assert sample("worker_pool_run_seconds_count", pool="metrics-test") == 1
+    assert sample("worker_pool_wait_seconds_count", pool="metrics-test") == 1
+
+
+def test_storage_put_durations(tmp_path):
+    before = sample("storage_put_seconds_count", backend="LocalStorage")
+    upload_thumbnails(LocalStorage(str(tmp_path), "/media"), {64: b"small", 250: b"large"}, "digest")
+    assert sample("storage_put_seconds_count", backend="LocalStorage") == before + 2
+
+
+def test_multiprocess_collection(tmp_path):
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+    worker = textwrap.dedent("""
+        from src.services.metrics import REQUEST_SECONDS
+        REQUEST_SECONDS.labels("GET", "/", "200").observe(0.01)
+    """)
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", worker], env=env, check=True)
+    scrape = textwrap.dedent("""
+        from src.services.metrics import render_metrics
+        print(render_metrics()[0].decode())
+    """)
+    output = subprocess.run([sys.executable, "-c", scrape], env=env, check=True, capture_output=True,
+                            text=True).stdout
+    assert 'http_request_duration_seconds_count{method="GET",route="/",status="200"} 2.0' in output
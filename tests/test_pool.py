@@ -0,0 +1,52 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.database.pool import InstrumentedPool, PoolStats
+
+
+class PoolStatsTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory.name, 'pool.db')}",
+                                          poolclass=InstrumentedPool, pool_size=2, max_overflow=1, pool_timeout=0.2)
+        self.engine.pool.stats = PoolStats().attach(self.engine)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def query(self, hold: float = 0):
+        async with self.engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+            await asyncio.sleep(hold)
+
+    async def test_snapshot_counts_checkouts_and_connections(self):
+        await asyncio.gather(*(self.query() for _ in range(3)))
+        snapshot = self.engine.pool.stats.snapshot(self.engine.pool)
+        self.assertEqual(snapshot["checkouts"], 3)
+        self.assertEqual(snapshot["checkins"], 3)
+        self.assertEqual(snapshot["checked_out"], 0)
+        self.assertGreaterEqual(snapshot["connects"], 1)
+        self.assertEqual(snapshot["wait_seconds"]["count"], 3)
+        self.assertEqual(snapshot["wait_seconds"]["buckets"]["+Inf"], 3)
+
+    async def test_snapshot_counts_timeouts(self):
+        results = await asyncio.gather(*(self.query(hold=0.5) for _ in range(4)), return_exceptions=True)
+        snapshot = self.engine.pool.stats.snapshot(self.engine.pool)
+        self.assertEqual(sum(isinstance(result, Exception) for result in results), 1)
+        self.assertEqual(snapshot["timeouts"], 1)
+        self.assertEqual(snapshot["overflow"], 0)
+
+    async def test_stats_survive_dispose(self):
+        stats = self.engine.pool.stats
+        await self.query()
+        await self.engine.dispose()
+        await self.query()
+        self.assertIs(self.engine.pool.stats, stats)
+        self.assertEqual(stats.checkouts, 2)
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import re
+from unittest.mock import MagicMock
+
+from sqlalchemy import select, text
+
+from src.conf.config import settings
+from src.database.instrumentation import QueryStats, QueryStatsMiddleware, _explain, current_query_stats
+from src.database.models import Contact, User
+from tests.conftest import TestingSessionLocal
+
+
+def test_repeated_statements():
+    stats = QueryStats()
+    for i in range(5):
+        stats.record("SELECT * FROM contacts WHERE id = ?", 0.001)
+    stats.record("SELECT * FROM users WHERE email = ?", 0.002)
+    assert stats.count == 6
+    assert stats.repeated(5) == [("SELECT * FROM contacts WHERE id = ?", 5)]
+    assert stats.repeated(6) == []
+    assert stats.server_timing() == 'db;dur=7.00;desc="6 queries"'
+
+
+def test_server_timing_in_debug(client, token, monkeypatch):
+    monkeypatch.setattr(settings, "debug", True)
+    response = client.get("/api/contacts", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    match = re.fullmatch(r'db;dur=[\d.]+;desc="(\d+) queries"', response.headers["server-timing"])
+    assert match and int(match.group(1)) >= 1
+
+
+def test_no_server_timing_by_default(client, token):
+    response = client.get("/api/contacts", headers={"Authorization": f"Bearer {token}"})
+    assert "server-timing" not in response.headers
+
+
+async def lookup_users_one_by_one(scope, receive, send):
+    async with TestingSessionLocal() as db:
+        for i in range(6):
+            await db.execute(select(User).where(User.id == i))
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def call(app) -> list:
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await app({"type": "http", "method": "GET", "path": "/users"}, None, send)
+    return messages
+
+
+def test_n_plus_one_is_logged(session, caplog, monkeypatch):
+    monkeypatch.setattr(settings, "debug", True)
+    with caplog.at_level(logging.WARNING, logger="src.database.instrumentation"):
+        messages = asyncio.run(call(QueryStatsMiddleware(lookup_users_one_by_one)))
+    (name, value), = messages[0]["headers"]
+    assert name == b"server-timing" and value.endswith(b'desc="6 queries"')
+    assert "Likely N+1: GET /users ran 6 times" in caplog.text
+    assert current_query_stats.get() is None
+
+
+def test_n_plus_one_threshold(session, caplog, monkeypatch):
+    monkeypatch.setattr(settings, "n_plus_one_threshold", 7)
+    with caplog.at_level(logging.WARNING, logger="src.database.instrumentation"):
+        asyncio.run(call(QueryStatsMiddleware(lookup_users_one_by_one)))
+    assert "Likely N+1" not in caplog.text
+
+
+def test_slow_query_is_logged_with_plan(session, caplog, monkeypatch):
+    monkeypatch.setattr(settings, "slow_query_seconds", 1e-9)
+
+    async def query():
+        async with TestingSessionLocal() as db:
+            await db.execute(select(Contact).where(Contact.email == "slow@example.com"))
+            await db.execute(text("UPDATE contacts SET description = description WHERE id = -1"))
+
+    with caplog.at_level(logging.WARNING, logger="src.database.instrumentation"):
+        asyncio.run(query())
+    select_log, update_log = [record.getMessage() for record in caplog.records
+                              if record.getMessage().startswith("Slow query")]
+    assert "slow@example.com" in select_log
+    assert "Plan:" in select_log and "contacts" in select_log.split("Plan:")[1]
+    # only reads are explained
+    assert "Plan:" not in update_log
+
+
+def test_slow_query_on_users_is_redacted(session, caplog, monkeypatch):
+    monkeypatch.setattr(settings, "slow_query_seconds", 1e-9)
+
+    async def query():
+        async with TestingSessionLocal() as db:
+            await db.execute(select(User).where(User.refresh_token == "secret-refresh-token"))
+
+    with caplog.at_level(logging.WARNING, logger="src.database.instrumentation"):
+        asyncio.run(query())
+    assert "Slow query" in caplog.text
+    assert "Parameters: <redacted>" in caplog.text
+    assert "secret-refresh-token" not in caplog.text
+
+
+def test_failed_explain_is_rolled_back_to_a_savepoint():
+    conn = MagicMock()
+    conn.dialect.name = "postgresql"
+    conn.in_transaction.return_value = True
+    cursor = conn.connection.cursor.return_value
+    executed = []
+
+    def execute(statement, parameters=None):
+        executed.append(statement)
+        if statement.startswith("EXPLAIN"):
+            raise RuntimeError("syntax error")
+
+    cursor.execute.side_effect = execute
+    assert _explain(conn, "SELECT 1", ()) == "EXPLAIN failed: syntax error"
+    assert executed == ["SAVEPOINT slow_query_explain", "EXPLAIN SELECT 1", "ROLLBACK TO SAVEPOINT slow_query_explain",
+                        "RELEASE SAVEPOINT slow_query_explain"]
+    cursor.close.assert_called_once()
@@ -0,0 +1,86 @@
+from jose import jwt
+
+from src.conf.config import settings
+from src.database.models import Role, User
+from src.services.auth import auth_service
+
+
+def test_pool_status_forbidden_for_user(client, token):
+    response = client.get("/api/admin/pool", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403, response.text
+
+
+def test_pool_status(client, session, token, user):
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.role = Role.admin
+    session.commit()
+    response = client.get("/api/admin/pool", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert {"checked_out", "idle", "overflow", "connects", "closes", "timeouts"} <= data.keys()
+    assert "+Inf" in data["wait_seconds"]["buckets"]
+
+
+def test_cache_status(client, token):
+    response = client.get("/api/admin/cache", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert {"enabled", "local_hits", "redis_hits", "misses", "invalidations"} <= response.json().keys()
+
+
+def test_principal_cache_status(client, token):
+    response = client.get("/api/admin/principal-cache", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert {"enabled", "local_hits", "misses", "invalidations"} <= response.json().keys()
+
+
+def test_admission_status(client, token):
+    response = client.get("/api/admin/admission", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert {"admitted", "rate_limited", "shed_concurrency", "shed_loop_lag", "in_flight"} <= response.json().keys()
+
+
+def test_mail_status(client, token):
+    response = client.get("/api/admin/mail", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert {"running", "pending", "sent", "retried", "failed", "dropped", "connections"} <= response.json().keys()
+
+
+def login(client, user):
+    response = client.post("/api/auth/login",
+                           data={"username": user.get('email'), "password": user.get('password')})
+    assert response.status_code == 200, response.text
+    return response.json()["access_token"]
+
+
+def test_role_claims(client, session, user, monkeypatch):
+    monkeypatch.setattr(settings, "access_token_role_claims", True)
+    admin_token = login(client, user)
+    claims = jwt.decode(admin_token, auth_service.SECRET_KEY, algorithms=[auth_service.ALGORITHM])
+    assert (claims["role"], claims["confirmed"]) == ("admin", True)
+    assert claims["exp"] - claims["iat"] <= settings.role_claims_ttl
+
+    response = client.patch(f"/api/admin/users/{user.get('email')}/role", json={"role": "moderator"},
+                            headers={"Authorization": f"Bearer {admin_token}"})
+    assert response.status_code == 200, response.text
+    assert response.json()["role"] == "moderator"
+
+    # role-only routes trust the signed claims until the token expires
+    response = client.get("/api/contacts/", headers={"Authorization": f"Bearer {admin_token}"})
+    assert response.status_code == 200, response.text
+    # routes that load the user reject claims signed before the change
+    response = client.get("/api/users/me/", headers={"Authorization": f"Bearer {admin_token}"})
+    assert response.status_code == 401, response.text
+
+    moderator_token = login(client, user)
+    response = client.get("/api/admin/pool", headers={"Authorization": f"Bearer {moderator_token}"})
+    assert response.status_code == 403, response.text
+
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.role = Role.admin
+    session.commit()
+
+
+def test_update_role_missing_user(client, token):
+    response = client.patch("/api/admin/users/nobody@example.com/role", json={"role": "user"},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404, response.text
@@ -1,5 +1,8 @@
 from unittest.mock import MagicMock
 
+from passlib.hash import bcrypt
+
+from src.conf.config import settings
 from src.database.models import User
 
 
@@ -14,6 +17,7 @@ def test_create_user(client, user, monkeypatch):
     data = response.json()
     assert data["email"] == user.get("email")
     assert "id" in data
+    mock_send_email.assert_called_once()
 
 
 def test_repeat_create_user(client, user):
@@ -66,4 +70,65 @@ def test_login_user_wrong_email(client, user):
     )
     assert response.status_code == 401, response.text
     data = response.json()
-    assert data["detail"] == "Invalid email"
\ No newline at end of file
+    assert data["detail"] == "Invalid email"
+
+
+def test_login_rehashes_outdated_password(client, session, user):
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.password = bcrypt.using(rounds=4).hash(user.get('password'))
+    session.commit()
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    assert response.status_code == 200, response.text
+    session.refresh(current_user)
+    assert bcrypt.from_string(current_user.password).rounds == settings.bcrypt_rounds
+
+
+def login(client, user, device):
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+        headers={"User-Agent": device},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_refresh_token_rotation(client, user):
+    phone, laptop = login(client, user, "phone"), login(client, user, "laptop")
+    response = client.get("/api/auth/refresh_token",
+                          headers={"Authorization": f"Bearer {phone['refresh_token']}"})
+    assert response.status_code == 200, response.text
+    rotated = response.json()["refresh_token"]
+    assert rotated != phone["refresh_token"]
+
+    # the old token again: treated as stolen, the phone's session is revoked
+    response = client.get("/api/auth/refresh_token",
+                          headers={"Authorization": f"Bearer {phone['refresh_token']}"})
+    assert response.status_code == 401, response.text
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {rotated}"})
+    assert response.status_code == 401, response.text
+
+    # other devices are not affected
+    response = client.get("/api/auth/refresh_token",
+                          headers={"Authorization": f"Bearer {laptop['refresh_token']}"})
+    assert response.status_code == 200, response.text
+
+
+def test_sessions(client, user):
+    tablet = login(client, user, "tablet")
+    headers = {"Authorization": f"Bearer {tablet['access_token']}"}
+    response = client.get("/api/auth/sessions", headers=headers)
+    assert response.status_code == 200, response.text
+    sessions = response.json()
+    assert sessions[0]["device"] == "tablet"
+
+    response = client.delete(f"/api/auth/sessions/{sessions[0]['id']}", headers=headers)
+    assert response.status_code == 204, response.text
+    response = client.get("/api/auth/refresh_token",
+                          headers={"Authorization": f"Bearer {tablet['refresh_token']}"})
+    assert response.status_code == 401, response.text
+    response = client.delete(f"/api/auth/sessions/{sessions[0]['id']}", headers=headers)
+    assert response.status_code == 404, response.text
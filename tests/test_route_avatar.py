@@ -0,0 +1,233 @@
+import asyncio
+import io
+import os
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from PIL import Image
+
+from main import app
+from src.conf.config import settings
+from src.services.body_limit import BodyLimitMiddleware
+from src.services.storage import LocalStorage, S3Storage, get_storage
+from src.services.upload_avatar import make_thumbnails
+
+
+class ClientError(Exception):
+    def __init__(self, code: str):
+        self.response = {"Error": {"Code": code}}
+
+
+def png(width: int, height: int, color: str = "orange") -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture()
+def storage(tmp_path):
+    storage = LocalStorage(str(tmp_path), settings.media_url)
+    app.dependency_overrides[get_storage] = lambda: storage
+    yield storage
+    del app.dependency_overrides[get_storage]
+
+
+def upload(client, token, data: bytes):
+    return client.patch("/api/users/avatar", files={"file": ("me.png", data, "image/png")},
+                        headers={"Authorization": f"Bearer {token}"})
+
+
+def test_make_thumbnails():
+    thumbnails = make_thumbnails(png(640, 480), [250, 64], max_pixels=10 ** 6)
+    assert sorted(thumbnails) == [64, 250]
+    assert Image.open(io.BytesIO(thumbnails[64])).size == (64, 64)
+    assert Image.open(io.BytesIO(thumbnails[250])).format == "JPEG"
+
+
+def test_update_avatar(client, token, storage):
+    response = upload(client, token, png(640, 480))
+    assert response.status_code == 200, response.text
+    avatar = response.json()["avatar"]
+    assert avatar.startswith(f"{settings.media_url}/avatars/")
+    assert avatar.endswith(f"_{settings.avatar_sizes[0]}.jpg")
+    # stored in the background after the response, one object per size
+    key = avatar[len(settings.media_url) + 1:]
+    for size in settings.avatar_sizes:
+        assert storage.exists(key.replace(f"_{settings.avatar_sizes[0]}.jpg", f"_{size}.jpg"))
+
+
+def test_update_avatar_same_image_is_not_uploaded_again(client, token, storage, monkeypatch):
+    first = upload(client, token, png(320, 320, "navy")).json()["avatar"]
+    put = MagicMock()
+    monkeypatch.setattr(storage, "put", put)
+    second = upload(client, token, png(320, 320, "navy")).json()["avatar"]
+    assert second == first
+    put.assert_not_called()
+    third = upload(client, token, png(320, 320, "teal")).json()["avatar"]
+    assert third != first
+    assert put.call_count == len(settings.avatar_sizes)
+
+
+def test_update_avatar_too_large(client, token, storage, monkeypatch):
+    monkeypatch.setattr(settings, "avatar_max_bytes", 100)
+    response = upload(client, token, png(640, 480))
+    assert response.status_code == 413, response.text
+    assert not any(os.scandir(storage.root))
+
+
+def limited_app(limit: int):
+    inner = FastAPI()
+    inner.state.uploaded = []
+
+    @inner.post("/upload")
+    async def receive_file(file: UploadFile = File()):
+        inner.state.uploaded.append(len(await file.read()))
+        return "ok"
+
+    return inner, BodyLimitMiddleware(inner, {"/upload": limit})
+
+
+async def post(asgi_app, headers: list, chunks: list[bytes]) -> tuple[int, int]:
+    """
+    Send a body in chunks straight through ASGI; returns the status and how many chunks were read.
+    """
+    read = 0
+    sent = []
+
+    async def receive():
+        nonlocal read
+        read += 1
+        return {"type": "http.request", "body": chunks[read - 1], "more_body": read < len(chunks)}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/upload", "raw_path": b"/upload", "root_path": "",
+             "scheme": "http", "query_string": b"", "headers": headers, "server": ("testserver", 80),
+             "client": ("127.0.0.1", 1), "http_version": "1.1", "asgi": {"version": "3.0"}}
+    await asgi_app(scope, receive, send)
+    return sent[0]["status"], read
+
+
+def multipart(size: int) -> tuple[list, bytes]:
+    body = (b'--x\r\nContent-Disposition: form-data; name="file"; filename="me.png"\r\n'
+            b'Content-Type: image/png\r\n\r\n' + b"a" * size + b"\r\n--x--\r\n")
+    return [(b"content-type", b"multipart/form-data; boundary=x")], body
+
+
+def test_body_limit_rejects_announced_length_without_reading():
+    inner, limited = limited_app(1000)
+    headers, body = multipart(5000)
+    chunks = [body[i:i + 500] for i in range(0, len(body), 500)]
+    status, read = asyncio.run(post(limited, headers + [(b"content-length", str(len(body)).encode())],
+                                  chunks))
+    assert (status, read, inner.state.uploaded) == (413, 0, [])
+
+
+def test_body_limit_stops_reading_an_unannounced_body():
+    inner, limited = limited_app(1000)
+    headers, body = multipart(5000)
+    chunks = [body[i:i + 500] for i in range(0, len(body), 500)]
+    status, read = asyncio.run(post(limited, headers, chunks))
+    assert (status, inner.state.uploaded) == (413, [])
+    assert read == 3 < len(chunks)
+
+
+def test_body_limit_passes_small_bodies():
+    inner, limited = limited_app(1000)
+    headers, body = multipart(200)
+    status, _ = asyncio.run(post(limited, headers, [body]))
+    assert (status, inner.state.uploaded) == (200, [200])
+
+
+def test_update_avatar_not_an_image(client, token, storage):
+    response = upload(client, token, b"not an image")
+    assert response.status_code == 415, response.text
+
+
+def test_get_media(client, storage):
+    storage.put("avatars/abc_64.jpg", b"0123456789", "image/jpeg")
+    response = client.get(f"{settings.media_url}/avatars/abc_64.jpg")
+    assert response.status_code == 200, response.text
+    assert response.content == b"0123456789"
+    assert response.headers["content-type"] == "image/jpeg"
+    assert "immutable" in response.headers["cache-control"]
+    etag = response.headers["etag"]
+
+    response = client.get(f"{settings.media_url}/avatars/abc_64.jpg", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    response = client.get(f"{settings.media_url}/avatars/abc_64.jpg",
+                          headers={"If-Modified-Since": response.headers["last-modified"]})
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize("byte_range, content, content_range", [
+    ("bytes=2-5", b"2345", "bytes 2-5/10"),
+    ("bytes=7-", b"789", "bytes 7-9/10"),
+    ("bytes=-3", b"789", "bytes 7-9/10"),
+    ("bytes=8-100", b"89", "bytes 8-9/10"),
+])
+def test_get_media_range(client, storage, byte_range, content, content_range):
+    storage.put("avatars/abc_64.jpg", b"0123456789", "image/jpeg")
+    response = client.get(f"{settings.media_url}/avatars/abc_64.jpg", headers={"Range": byte_range})
+    assert response.status_code == 206, response.text
+    assert response.content == content
+    assert response.headers["content-range"] == content_range
+
+
+def test_get_media_range_not_satisfiable(client, storage):
+    storage.put("avatars/abc_64.jpg", b"0123456789", "image/jpeg")
+    response = client.get(f"{settings.media_url}/avatars/abc_64.jpg", headers={"Range": "bytes=10-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */10"
+
+
+def test_get_media_if_range(client, storage):
+    storage.put("avatars/abc_64.jpg", b"0123456789", "image/jpeg")
+    etag = client.get(f"{settings.media_url}/avatars/abc_64.jpg").headers["etag"]
+    response = client.get(f"{settings.media_url}/avatars/abc_64.jpg",
+                          headers={"Range": "bytes=0-1", "If-Range": etag})
+    assert response.status_code == 206
+    response = client.get(f"{settings.media_url}/avatars/abc_64.jpg",
+                          headers={"Range": "bytes=0-1", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == b"0123456789"
+
+
+@pytest.mark.parametrize("path", ["avatars/missing.jpg", "..%2F..%2Fetc%2Fpasswd", "%2E%2E/secret"])
+def test_get_media_not_found(client, storage, path):
+    response = client.get(f"{settings.media_url}/{path}")
+    assert response.status_code == 404
+
+
+def test_local_storage_rejects_keys_outside_root(tmp_path):
+    storage = LocalStorage(str(tmp_path / "media"), "/media")
+    assert storage.path("../escape.jpg") is None
+    with pytest.raises(ValueError):
+        storage.put("../escape.jpg", b"x", "image/jpeg")
+    assert not (tmp_path / "escape.jpg").exists()
+
+
+def test_s3_storage_put_if_absent(monkeypatch):
+    monkeypatch.setattr("src.services.storage.ClientError", ClientError)
+    client = MagicMock()
+    client.head_object.side_effect = ClientError("404")
+    storage = S3Storage(client, "bucket", "https://cdn.example.com/")
+    assert storage.put_if_absent("avatars/abc_64.jpg", b"data", "image/jpeg") is True
+    assert client.put_object.call_args.kwargs["Key"] == "avatars/abc_64.jpg"
+    assert "immutable" in client.put_object.call_args.kwargs["CacheControl"]
+
+    client.reset_mock()
+    client.head_object.side_effect = None
+    assert storage.put_if_absent("avatars/abc_64.jpg", b"data", "image/jpeg") is False
+    client.put_object.assert_not_called()
+    assert storage.url("avatars/abc_64.jpg") == "https://cdn.example.com/avatars/abc_64.jpg"
+
+
+def test_s3_storage_exists_raises_other_errors(monkeypatch):
+    monkeypatch.setattr("src.services.storage.ClientError", ClientError)
+    client = MagicMock()
+    client.head_object.side_effect = ClientError("403")
+    with pytest.raises(ClientError):
+        S3Storage(client, "bucket", "https://cdn.example.com").exists("avatars/abc_64.jpg")
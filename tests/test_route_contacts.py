@@ -0,0 +1,454 @@
+import csv
+import io
+import json
+import threading
+from datetime import date, timedelta
+
+import pytest
+
+from src.database.models import Contact, Role, User
+from src.repository import contacts as repository_contacts
+from src.services import contacts_import
+
+
+@pytest.fixture(scope="module")
+def contacts(session):
+    rows = [Contact(name="Taras" if i % 2 else "Lesya", surname=f"Surname{i}", email=f"contact{i}@example.com",
+                    phone=f"0990000{i:03}", birthday=date(2000, 1, 1), description="Nothing")
+            for i in range(25)]
+    session.add_all(rows)
+    session.commit()
+    return [{"id": row.id, "name": row.name} for row in rows]
+
+
+def test_get_contacts_first_page(client, token, contacts):
+    response = client.get("/api/contacts/", params={"limit": 10}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [item["id"] for item in data["items"]] == [contact["id"] for contact in contacts[:10]]
+    assert data["next_cursor"]
+
+
+def test_get_contacts_walks_all_pages(client, token, contacts):
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 10} if cursor is None else {"limit": 10, "cursor": cursor}
+        response = client.get("/api/contacts/", params=params, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200, response.text
+        data = response.json()
+        seen.extend(item["id"] for item in data["items"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [contact["id"] for contact in contacts]
+
+
+def test_get_contacts_invalid_cursor(client, token, contacts):
+    response = client.get("/api/contacts/", params={"cursor": "not-a-cursor"},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_search_by_name_paginated(client, token, contacts):
+    expected = [contact["id"] for contact in contacts if contact["name"] == "Taras"]
+    response = client.get("/api/contacts/search_by_name/Taras", params={"limit": 5},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    first = response.json()
+    response = client.get("/api/contacts/search_by_name/Taras", params={"limit": 5, "cursor": first["next_cursor"]},
+                          headers={"Authorization": f"Bearer {token}"})
+    second = response.json()
+    assert [item["id"] for item in first["items"] + second["items"]] == expected[:10]
+
+
+def test_get_contacts_not_modified(client, token, contacts):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/api/contacts/", params={"limit": 5}, headers=headers)
+    etag = response.headers["ETag"]
+    assert response.headers["Last-Modified"]
+
+    response = client.get("/api/contacts/", params={"limit": 5}, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+    response = client.get("/api/contacts/", params={"limit": 6}, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 6
+
+
+def test_get_contact_not_modified(client, token, contacts):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get(f"/api/contacts/{contacts[0]['id']}", headers=headers)
+    etag, last_modified = response.headers["ETag"], response.headers["Last-Modified"]
+
+    response = client.get(f"/api/contacts/{contacts[0]['id']}", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    response = client.get(f"/api/contacts/{contacts[0]['id']}",
+                          headers={**headers, "If-Modified-Since": last_modified})
+    assert response.status_code == 304
+    response = client.get(f"/api/contacts/{contacts[0]['id']}", headers={**headers, "If-None-Match": '"stale"'})
+    assert response.status_code == 200
+    assert response.json()["id"] == contacts[0]["id"]
+    response = client.get("/api/contacts/999999", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("path, params", [
+    ("/api/contacts/search_by_name/Taras", {"limit": 5}),
+    ("/api/contacts/search_by_surname/Surname3", {}),
+    ("/api/contacts/birthdays", {"days": 365}),
+    ("/api/contacts/search", {"q": "Taras"}),
+])
+def test_contact_lists_not_modified(client, token, contacts, path, params):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get(path, params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    etag = response.headers["ETag"]
+
+    response = client.get(path, params=params, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+@pytest.mark.parametrize("path", ["/api/contacts/", "/api/contacts/birthdays", "/api/contacts/search_by_name/Taras",
+                                  "/api/contacts/search_by_surname/Surname3"])
+def test_unconditional_list_reads_take_the_version_from_the_rows(client, token, contacts, monkeypatch, path):
+    calls = []
+    version = repository_contacts.get_contacts_version
+
+    async def spy(*args, **kwargs):
+        calls.append(args)
+        return await version(*args, **kwargs)
+
+    monkeypatch.setattr(repository_contacts, "get_contacts_version", spy)
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200, response.text
+    assert calls == []
+    # the tag from the rows is the one the aggregate computes on the conditional path
+    response = client.get(path, headers={**headers, "If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+    assert len(calls) == 1
+
+
+def test_search_runs_no_table_wide_version(client, token, contacts, monkeypatch):
+    async def version(*args, **kwargs):
+        raise AssertionError("get_contacts_version called")
+
+    monkeypatch.setattr("src.repository.contacts.get_contacts_version", version)
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/api/contacts/search", params={"q": "Taras"}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert "Last-Modified" not in response.headers
+    response = client.get("/api/contacts/search", params={"q": "Taras"},
+                          headers={**headers, "If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+
+def test_get_contacts_by_birthdays(client, token, session):
+    today = date.today()
+    upcoming = Contact(name="Ivan", surname="Franko", email="franko@example.com", phone="0671112233",
+                       birthday=(today + timedelta(days=3)).replace(year=1992), description="Soon")
+    later = Contact(name="Olha", surname="Kobylianska", email="kobylianska@example.com", phone="0671112244",
+                    birthday=(today + timedelta(days=20)).replace(year=1992), description="Later")
+    session.add_all([upcoming, later])
+    session.commit()
+    upcoming_id, later_id = upcoming.id, later.id
+
+    response = client.get("/api/contacts/birthdays", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    ids = [item["id"] for item in response.json()]
+    assert upcoming_id in ids
+    assert later_id not in ids
+
+    response = client.get("/api/contacts/birthdays", params={"days": 30}, headers={"Authorization": f"Bearer {token}"})
+    ids = [item["id"] for item in response.json()]
+    assert upcoming_id in ids and later_id in ids
+
+
+def test_search_contacts_by_prefix(client, token, session):
+    session.add_all([
+        Contact(name="Mykhailo", surname="Kotsiubynskyi", email="kotsiubynskyi@example.com", phone="0501234501",
+                birthday=date(1864, 9, 17), description="Writer"),
+        Contact(name="Mykola", surname="Lysenko", email="lysenko@example.com", phone="0501234502",
+                birthday=date(1842, 3, 22), description="Composer"),
+    ])
+    session.commit()
+    response = client.get("/api/contacts/search", params={"q": "myk"}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert sorted(item["surname"] for item in response.json()["items"]) == ["Kotsiubynskyi", "Lysenko"]
+
+    response = client.get("/api/contacts/search", params={"q": "lysenko@exam"},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert [item["surname"] for item in response.json()["items"]] == ["Lysenko"]
+
+    response = client.get("/api/contacts/search", params={"q": "050123450"},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert len(response.json()["items"]) == 2
+
+
+def test_search_contacts_paginated(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/api/contacts/search", params={"q": "contact", "limit": 10}, headers=headers)
+    first = response.json()
+    assert len(first["items"]) == 10
+    response = client.get("/api/contacts/search", params={"q": "contact", "limit": 10, "cursor": first["next_cursor"]},
+                          headers=headers)
+    second = response.json()
+    ids = [item["id"] for item in first["items"] + second["items"]]
+    assert len(ids) == len(set(ids)) == 20
+
+
+def test_import_contacts_csv(client, token, session, user):
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.role = Role.moderator
+    session.commit()
+    content = (
+        "name,surname,email,phone,birthday,description\n"
+        "Lina,Kostenko,kostenko@example.com,0931110001,1930-03-19,Poet\n"
+        "Vasyl,Stus,stus@example.com,0931110002,1938-01-06,Poet\n"
+        "Copy,Stus,stus@example.com,0931110003,1938-01-06,Duplicate email in the file\n"
+        "Taken,Phone,taken@example.com,0990000001,2000-01-01,Phone of an existing contact\n"
+        "Bad,Email,not-an-email,0931110004,2000-01-01,Invalid\n"
+    )
+    response = client.post("/api/contacts/import", params={"batch_size": 2},
+                           files={"file": ("contacts.csv", content, "text/csv")},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert report["processed"] == 5
+    assert report["inserted"] == 2
+    assert report["duplicates"] == 2
+    assert report["failed"] == 1
+    assert [error["line"] for error in report["errors"]] == [4, 5, 6]
+
+
+def test_import_contacts_ndjson(client, token):
+    content = (
+        '{"name": "Ivan", "surname": "Bahrianyi", "email": "bahrianyi@example.com", "phone": "0931110010", '
+        '"birthday": "1906-10-02", "description": "Writer"}\n'
+        '\n'
+        'not json\n'
+    )
+    response = client.post("/api/contacts/import", params={"format": "ndjson"},
+                           files={"file": ("contacts.txt", content, "application/x-ndjson")},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert report["inserted"] == 1
+    assert report["failed"] == 1
+    assert report["errors"][0]["line"] == 3
+
+
+def test_import_parses_in_the_worker_pool(client, token, monkeypatch):
+    threads = []
+
+    def parse_batch(*args):
+        threads.append(threading.current_thread().name)
+        return parse(*args)
+
+    parse = contacts_import._parse_batch
+    monkeypatch.setattr(contacts_import, "_parse_batch", parse_batch)
+    content = "".join(
+        json.dumps({"name": "Import", "surname": f"Batch{i}", "email": f"batch{i}@example.com",
+                    "phone": f"09422200{i:02}", "birthday": "2000-01-01", "description": "Batch"}) + "\n"
+        for i in range(5))
+    response = client.post("/api/contacts/import", params={"format": "ndjson", "batch_size": 2},
+                           files={"file": ("contacts.ndjson", content, "application/x-ndjson")},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert response.json()["inserted"] == 5
+    # one call per batch, none of them on the event loop's thread
+    assert len(threads) == 3
+    assert all(name.startswith("import") for name in threads)
+
+
+def test_export_contacts_ndjson(client, token, session):
+    total = session.query(Contact).count()
+    response = client.get("/api/contacts/export", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/x-ndjson"
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert len(records) == total
+    assert [record["id"] for record in records] == sorted(record["id"] for record in records)
+
+    resumed = client.get("/api/contacts/export", params={"after_id": records[9]["id"]},
+                         headers={"Authorization": f"Bearer {token}"})
+    assert [json.loads(line)["id"] for line in resumed.text.splitlines()] == [record["id"] for record in records[10:]]
+
+
+def test_export_contacts_csv(client, token, session):
+    response = client.get("/api/contacts/export", params={"format": "csv"},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["id", "name", "surname", "email", "phone", "birthday", "description"]
+    assert len(rows) == session.query(Contact).count() + 1
+
+
+def new_contact(**fields):
+    body = {"name": "Hryhorii", "surname": "Skovoroda", "email": "skovoroda@example.com", "phone": "0671234567",
+            "birthday": "1990-08-27", "description": "Poet"}
+    body.update(fields)
+    return body
+
+
+def test_create_contact_conflict(client, token):
+    response = client.post("/api/contacts/", json=new_contact(), headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 201, response.text
+    response = client.post("/api/contacts/", json=new_contact(phone="0671234568"),
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 409, response.text
+
+
+def test_create_contact_on_conflict_ignore(client, token):
+    response = client.post("/api/contacts/", params={"on_conflict": "ignore"},
+                           json=new_contact(phone="0671234568", description="Ignored"),
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert response.json()["description"] == "Poet"
+    response = client.post("/api/contacts/", params={"on_conflict": "ignore"},
+                           json=new_contact(email="ukrainka@example.com", phone="0671234569"),
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 201, response.text
+
+
+def test_create_contact_on_conflict_update(client, token, session):
+    response = client.post("/api/contacts/", params={"on_conflict": "update"},
+                           json=new_contact(description="Writer"), headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert response.json()["description"] == "Writer"
+    assert session.query(Contact).filter(Contact.email == "skovoroda@example.com").count() == 1
+    response = client.post("/api/contacts/", params={"on_conflict": "update"},
+                           json=new_contact(email="kvitka@example.com", phone="0671234570"),
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 201, response.text
+    response = client.post("/api/contacts/", params={"on_conflict": "update"},
+                           json=new_contact(phone="0671234570"), headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 409, response.text
+
+
+def test_patch_contact(client, token, session, contacts):
+    contact_id = contacts[5]["id"]
+    response = client.patch(f"/api/contacts/{contact_id}", json={"description": "Patched"},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["description"] == "Patched"
+    assert data["email"] == "contact5@example.com"
+
+
+def test_patch_contact_missing(client, token):
+    response = client.patch("/api/contacts/999999", json={"description": "Patched"},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404, response.text
+
+
+def test_patch_contact_conflict(client, token, contacts):
+    response = client.patch(f"/api/contacts/{contacts[5]['id']}", json={"email": "contact6@example.com"},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 409, response.text
+
+
+def test_patch_contact_rejects_null(client, token, session, contacts):
+    contact_id = contacts[5]["id"]
+    for field in ("name", "surname", "email", "phone"):
+        response = client.patch(f"/api/contacts/{contact_id}", json={field: None},
+                                headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 422, response.text
+    response = client.get(f"/api/contacts/{contact_id}", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert response.json()["email"] == "contact5@example.com"
+
+
+def test_patch_contact_clears_description(client, token, contacts):
+    response = client.patch(f"/api/contacts/{contacts[5]['id']}", json={"description": None},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert response.json()["description"] is None
+
+
+def test_contact_list_changes_with_its_rows(client, token, contacts):
+    headers = {"Authorization": f"Bearer {token}"}
+    etag = client.get("/api/contacts/search_by_name/Taras", params={"limit": 5}, headers=headers).headers["ETag"]
+    response = client.patch(f"/api/contacts/{contacts[1]['id']}", json={"name": "Renamed"}, headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.get("/api/contacts/search_by_name/Taras", params={"limit": 5},
+                          headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert contacts[1]["id"] not in [item["id"] for item in response.json()["items"]]
+    assert response.headers["ETag"] != etag
+    client.patch(f"/api/contacts/{contacts[1]['id']}", json={"name": "Taras"}, headers=headers)
+
+
+def test_bulk_update_contacts(client, token, session, contacts):
+    ids = [contact["id"] for contact in contacts[:3]] + [999999]
+    response = client.patch("/api/contacts/bulk", json={"ids": ids, "changes": {"description": "Bulk"}},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert sorted(data["affected"]) == ids[:3]
+    assert data["missing"] == [999999]
+    descriptions = {row.description for row in session.query(Contact).filter(Contact.id.in_(ids[:3]))}
+    assert descriptions == {"Bulk"}
+
+
+def test_bulk_update_contacts_by_filter(client, token, session):
+    response = client.patch("/api/contacts/bulk", json={"surname": "Surname4", "changes": {"description": "Four"}},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert len(response.json()["affected"]) == 1
+    assert session.query(Contact).filter(Contact.surname == "Surname4").one().description == "Four"
+
+
+def test_bulk_update_contacts_conflict(client, token, contacts):
+    ids = [contact["id"] for contact in contacts[:2]]
+    response = client.patch("/api/contacts/bulk", json={"ids": ids, "changes": {"email": "same@example.com"}},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 409, response.text
+
+
+def test_bulk_update_contacts_rejects_null(client, token, session, contacts):
+    ids = [contact["id"] for contact in contacts[:2]]
+    response = client.patch("/api/contacts/bulk", json={"ids": ids, "changes": {"name": None}},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 422, response.text
+    assert all(row.name for row in session.query(Contact).filter(Contact.id.in_(ids)))
+
+
+def test_bulk_update_contacts_requires_selection(client, token):
+    response = client.patch("/api/contacts/bulk", json={"changes": {"description": "All"}},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 422, response.text
+
+
+def test_bulk_delete_contacts_requires_admin(client, token, contacts):
+    response = client.request("DELETE", "/api/contacts/bulk", json={"ids": [contacts[0]["id"]]},
+                              headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403, response.text
+
+
+def test_bulk_delete_contacts(client, token, session, user, contacts):
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.role = Role.admin
+    session.commit()
+    ids = [contact["id"] for contact in contacts[20:]] + [999999]
+    response = client.request("DELETE", "/api/contacts/bulk", json={"ids": ids},
+                              headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert sorted(data["affected"]) == ids[:-1]
+    assert data["missing"] == [999999]
+    assert session.query(Contact).filter(Contact.id.in_(ids)).count() == 0
+
+
+def test_remove_contact(client, token, session, contacts):
+    contact_id = contacts[19]["id"]
+    response = client.delete(f"/api/contacts/{contact_id}", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert response.json()["id"] == contact_id
+    assert session.query(Contact).filter(Contact.id == contact_id).count() == 0
+    response = client.delete(f"/api/contacts/{contact_id}", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404, response.text
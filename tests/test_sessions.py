@@ -0,0 +1,77 @@
+import unittest
+from datetime import datetime, timedelta
+
+from fakeredis import aioredis as fakeredis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, User, UserSession
+from src.repository.sessions import create_session, purge_expired_sessions
+from src.repository.users import claim_refresh_token
+from src.services.sessions import RedisSessionStore, SqlSessionStore
+
+
+class SqlSessionStoreTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        self.db = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.db.add(User(id=1, username="deadpool", email="deadpool@example.com", password="hash"))
+        await self.db.commit()
+        self.store = SqlSessionStore(timedelta(days=7))
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        await self.engine.dispose()
+
+    async def test_rotation_detects_reuse(self):
+        session_id, jti = await self.store.create(1, "phone", self.db)
+        new_jti = await self.store.rotate(session_id, 1, jti, self.db)
+        self.assertIsNotNone(new_jti)
+        self.assertIsNone(await self.store.rotate(session_id, 1, jti, self.db))
+        self.assertIsNone(await self.store.rotate(session_id, 1, new_jti, self.db))
+        self.assertEqual(await self.store.list(1, self.db), [])
+
+    async def test_rotation_checks_owner(self):
+        session_id, jti = await self.store.create(1, "phone", self.db)
+        self.assertIsNone(await self.store.rotate(session_id, 2, jti, self.db))
+        self.assertEqual(len(await self.store.list(1, self.db)), 1)
+
+    async def test_legacy_refresh_token_is_claimed_once(self):
+        user = await self.db.get(User, 1)
+        user.refresh_token = "legacy"
+        await self.db.commit()
+        self.assertFalse(await claim_refresh_token("deadpool@example.com", "other", self.db))
+        self.assertTrue(await claim_refresh_token("deadpool@example.com", "legacy", self.db))
+        self.assertFalse(await claim_refresh_token("deadpool@example.com", "legacy", self.db))
+
+    async def test_purge_in_batches(self):
+        past = datetime.utcnow() - timedelta(seconds=1)
+        for number in range(5):
+            await create_session(f"expired{number}", 1, "jti", None, past, self.db)
+        live, _ = await self.store.create(1, "phone", self.db)
+        self.assertEqual(await purge_expired_sessions(self.db, batch_size=2), 5)
+        self.assertEqual((await self.db.execute(select(UserSession.id))).scalars().all(), [live])
+
+
+class RedisSessionStoreTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.store = RedisSessionStore(fakeredis.FakeRedis(), timedelta(days=7))
+
+    async def test_rotation_detects_reuse(self):
+        session_id, jti = await self.store.create(1, "phone")
+        other_id, _ = await self.store.create(1, "laptop")
+        new_jti = await self.store.rotate(session_id, 1, jti)
+        self.assertIsNotNone(new_jti)
+        self.assertIsNone(await self.store.rotate(session_id, 1, jti))
+        self.assertIsNone(await self.store.rotate(session_id, 1, new_jti))
+        self.assertEqual([session["id"] for session in await self.store.list(1)], [other_id])
+
+    async def test_revoke_checks_owner(self):
+        session_id, _ = await self.store.create(1, "phone")
+        self.assertFalse(await self.store.revoke(session_id, 2))
+        self.assertTrue(await self.store.revoke(session_id, 1))
+        self.assertEqual(await self.store.list(1), [])
@@ -1,13 +1,15 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 from datetime import date, datetime
 
 from pydantic import EmailStr
-from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import Contact, User
-from src.schemas import ContactModel
+from src.schemas import ContactModel, ContactUpdate
 from src.repository.contacts import (
+    birthday_key_ranges,
     get_contacts,
     get_contacts_by_birthdays,
     get_contact_by_id,
@@ -15,6 +17,7 @@ from src.repository.contacts import (
     get_contact_by_name,
     get_contact_by_surname,
     create_contact,
+    upsert_contact,
     update_contact,
     remove_contact
 )
@@ -23,43 +26,70 @@ from src.repository.contacts import (
 class TestNotes(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = AsyncMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
         self.user = User(id=1)
 
     async def test_get_contacts(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().all.return_value = contacts
+        self.result.scalars().all.return_value = contacts
         result = await get_contacts(db=self.session)
         self.assertEqual(result, contacts)
 
+    async def test_get_contacts_after_cursor(self):
+        contacts = [Contact(id=11), Contact(id=12)]
+        self.result.scalars().all.return_value = contacts
+        result = await get_contacts(db=self.session, limit=2, after_id=10)
+        self.assertEqual(result, contacts)
+        stmt = self.session.execute.call_args.args[0]
+        self.assertIn("contacts.id >", str(stmt))
+        self.assertEqual(stmt._limit, 2)
+
     async def test_get_contact_by_id(self):
         contact = Contact()
-        self.session.query().filter_by().first.return_value = contact
+        self.result.scalars().first.return_value = contact
         result = await get_contact_by_id(contact_id=1, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_get_contacts_by_birthdays(self):
         contact = [Contact(birthday=date(datetime.now().year, datetime.now().month, datetime.now().day))]
-        self.session.query().all.return_value = contact
+        self.result.scalars().all.return_value = contact
         result = await get_contacts_by_birthdays(db=self.session)
-        print(f'RESULT ______ {result}')
         self.assertEqual(result, contact)
 
+    def test_birthday_key_ranges(self):
+        self.assertEqual(birthday_key_ranges(date(2023, 6, 10), 7), [(610, 617)])
+
+    def test_birthday_key_ranges_year_wrap(self):
+        self.assertEqual(birthday_key_ranges(date(2023, 12, 28), 7), [(1228, 1231), (101, 104)])
+
+    def test_birthday_key_ranges_whole_year(self):
+        self.assertEqual(birthday_key_ranges(date(2022, 6, 10), 365), [])
+
+    def test_birthday_key_ranges_feb_29_in_common_year(self):
+        self.assertEqual(birthday_key_ranges(date(2023, 3, 1), 3), [(301, 304), (229, 229)])
+        self.assertEqual(birthday_key_ranges(date(2023, 2, 22), 6), [(222, 228)])
+
+    def test_birthday_key_ranges_feb_29_in_leap_year(self):
+        self.assertEqual(birthday_key_ranges(date(2024, 2, 26), 7), [(226, 304)])
+        self.assertEqual(birthday_key_ranges(date(2024, 3, 1), 3), [(301, 304)])
+
     async def test_get_contact_by_email(self):
         contact = Contact()
-        self.session.query().filter_by().first.return_value = contact
+        self.result.scalars().first.return_value = contact
         result = await get_contact_by_email(email=f'aaa@gmail.com', db=self.session)
         self.assertEqual(result, contact)
 
     async def test_get_contact_by_name(self):
         contact = [Contact()]
-        self.session.query().filter_by().all.return_value = contact
+        self.result.scalars().all.return_value = contact
         result = await get_contact_by_name(contact_name='Grigory', db=self.session)
         self.assertEqual(result, contact)
 
     async def test_get_contact_by_surname(self):
         contact = [Contact()]
-        self.session.query().filter_by().all.return_value = contact
+        self.result.scalars().all.return_value = contact
         result = await get_contact_by_surname(contact_surname='Skovoroda', db=self.session)
         self.assertEqual(result, contact)
 
@@ -78,11 +108,29 @@ class TestNotes(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.birthday, body.birthday)
         self.assertEqual(result.description, body.description)
 
+    async def test_upsert_contact_postgres_update(self):
+        self.session.bind = MagicMock()
+        self.session.bind.dialect = postgresql.dialect()
+        contact = Contact(id=1)
+        self.result.first.return_value = (contact, False)
+        body = ContactModel(name="Grigory", surname="Skovoroda", email=EmailStr('aaa@gmail.com'),
+                            phone='012345678', birthday=date(1722, 12, 3), description='Nothing')
+        result = await upsert_contact(body=body, db=self.session, update_existing=True)
+        self.assertEqual(result, (contact, False))
+        self.session.execute.assert_awaited_once()
+        sql = str(self.session.execute.call_args.args[0].compile(dialect=self.session.bind.dialect))
+        self.assertIn("ON CONFLICT (email) DO UPDATE", sql)
+        self.assertIn("xmax = 0", sql)
+        self.session.commit.assert_awaited_once()
+
     async def test_remove_contact(self):
         contact = Contact(id=1)
-        self.session.query().filter_by().first.return_value = contact
+        self.result.scalars().first.return_value = contact
         result = await remove_contact(contact_id=1, db=self.session)
         self.assertEqual(result, contact)
+        stmt = self.session.execute.call_args.args[0]
+        self.assertTrue(stmt.is_delete)
+        self.session.commit.assert_awaited_once()
 
     async def test_update_contact(self):
         body = ContactModel(name="Grigory",
@@ -92,9 +140,8 @@ class TestNotes(unittest.IsolatedAsyncioTestCase):
                             birthday=date(datetime.now().year, datetime.now().month, datetime.now().day),
                             description='Nothing',
                             id=1)
-        contact = Contact(id=1)
-        self.session.query().filter_by().first.return_value = contact
-        print(self.session.query().filter_by().first.return_value.name)
+        contact = Contact(id=1, **body.dict())
+        self.result.scalars().first.return_value = contact
         result = await update_contact(body=body, contact_id=1, db=self.session)
         self.assertEqual(result.name, body.name)
         self.assertEqual(result.surname, body.surname)
@@ -102,8 +149,20 @@ class TestNotes(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.phone, body.phone)
         self.assertEqual(result.birthday, body.birthday)
         self.assertEqual(result.description, body.description)
-        print(self.session.query().filter_by().first.return_value.name)
-
+        stmt = self.session.execute.call_args.args[0]
+        self.assertTrue(stmt.is_update)
+        self.assertEqual(set(stmt.compile().params),
+                         {'first_name', 'last_name', 'email', 'phone', 'birthday', 'description', 'id_1'})
+
+    async def test_update_contact_partial(self):
+        body = ContactUpdate(description='Philosopher')
+        contact = Contact(id=1, description='Philosopher')
+        self.result.scalars().first.return_value = contact
+        result = await update_contact(body=body, contact_id=1, db=self.session)
+        self.assertEqual(result, contact)
+        stmt = self.session.execute.call_args.args[0]
+        self.assertEqual(stmt.compile().params, {'description': 'Philosopher', 'id_1': 1})
+        self.assertEqual(self.session.execute.await_count, 1)
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,5 +1,8 @@
 from unittest import IsolatedAsyncioTestCase, mock
-from src.database.models import User
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import Role, User
 from src.schemas import UserModel
 from src.repository.users import (
     get_user_by_email,
@@ -7,49 +10,79 @@ from src.repository.users import (
     update_token,
     confirmed_email,
     update_avatar,
+    replace_avatar,
+    update_role,
 )
 
 
+def session_mock(user: User | None = None) -> mock.AsyncMock:
+    db_mock = mock.AsyncMock(spec=AsyncSession)
+    db_mock.execute.return_value = mock.MagicMock()
+    db_mock.execute.return_value.scalars().first.return_value = user
+    return db_mock
+
+
 class UserRepositoryTests(IsolatedAsyncioTestCase):
 
     async def test_get_user_by_email_existing_email(self):
-        db_mock = mock.MagicMock()
         user = User(email='test@example.com')
-        db_mock.query().filter().first.return_value = user
+        db_mock = session_mock(user)
         result = await get_user_by_email('test@example.com', db_mock)
         self.assertIsInstance(result, User)
 
     async def test_get_user_by_email_non_existing_email(self):
-        db_mock = mock.MagicMock()
-        db_mock.query().filter().first.return_value = None
+        db_mock = session_mock()
         result = await get_user_by_email('test@example.com', db_mock)
         self.assertIsNone(result)
 
     async def test_create_user(self):
-        db_mock = mock.MagicMock()
+        db_mock = session_mock()
         user_data = UserModel(email='test@example.com', username='Test User', password="password", )
         result = await create_user(user_data, db_mock)
         db_mock.add.assert_called_once_with(mock.ANY)
         db_mock.commit.assert_called_once()
         db_mock.refresh.assert_called_once_with(mock.ANY)
         self.assertIsInstance(result, User)
+        self.assertEqual(result.avatar, 'https://www.gravatar.com/avatar/55502f40dc8b7c769880b10874abc9d0')
 
     async def test_update_token(self):
-        db_mock = mock.MagicMock()
+        db_mock = session_mock()
         user = User(email='test@example.com')
         await update_token(user, 'new_token', db_mock)
         self.assertEqual(user.refresh_token, 'new_token')
         db_mock.commit.assert_called_once()
 
     async def test_confirmed_email(self):
-        db_mock = mock.MagicMock()
         user = User(email='test@example.com', confirmed=True)
-        db_mock.get_user_by_email.return_value = user
+        db_mock = session_mock(user)
         await confirmed_email('test@example.com', db_mock)
         self.assertTrue(user.confirmed)
 
     async def test_update_avatar(self):
-        db_mock = mock.MagicMock()
+        db_mock = session_mock(User(email='test@example.com'))
         user = User(email='test@example.com')
         result = await update_avatar('test@example.com', 'https://example.com/avatar.png', db_mock)
-        self.assertEqual(user.avatar, None)
\ No newline at end of file
+        self.assertEqual(user.avatar, None)
+
+    async def test_replace_avatar(self):
+        db_mock = session_mock()
+        db_mock.execute.return_value.rowcount = 1
+        self.assertTrue(await replace_avatar('test@example.com', 'https://example.com/a.png', None, db_mock))
+        db_mock.commit.assert_called_once()
+
+    async def test_replace_avatar_changed_meanwhile(self):
+        db_mock = session_mock()
+        db_mock.execute.return_value.rowcount = 0
+        self.assertFalse(await replace_avatar('test@example.com', 'https://example.com/a.png', None, db_mock))
+
+    async def test_update_role(self):
+        user = User(email='test@example.com', role=Role.user)
+        db_mock = session_mock(user)
+        result = await update_role('test@example.com', Role.moderator, db_mock)
+        self.assertEqual(result.role, Role.moderator)
+        db_mock.commit.assert_called_once()
+
+    async def test_update_role_missing_user(self):
+        db_mock = session_mock()
+        self.assertIsNone(await update_role('test@example.com', Role.moderator, db_mock))
+        db_mock.commit.assert_not_called()
@@ -0,0 +1,34 @@
+import asyncio
+import threading
+import unittest
+
+from fastapi import HTTPException
+
+from src.services.workers import BoundedExecutor
+
+
+class BoundedExecutorTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.executor = BoundedExecutor(max_workers=1, max_queue=1)
+        self.release = threading.Event()
+
+    async def asyncTearDown(self):
+        self.release.set()
+        self.executor.shutdown()
+
+    async def test_runs_off_the_event_loop(self):
+        self.assertNotEqual(await self.executor.run(threading.get_ident), threading.get_ident())
+        self.assertEqual(self.executor.stats()["completed"], 1)
+
+    async def test_rejects_when_saturated(self):
+        busy = [asyncio.create_task(self.executor.run(self.release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with self.assertRaises(HTTPException) as raised:
+            await self.executor.run(self.release.wait)
+        self.assertEqual(raised.exception.status_code, 503)
+        self.assertEqual(raised.exception.headers["Retry-After"], "1")
+        self.assertEqual(self.executor.stats()["rejected"], 1)
+        self.release.set()
+        await asyncio.gather(*busy)
+        self.assertEqual(self.executor.stats()["pending"], 0)